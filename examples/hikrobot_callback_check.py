@@ -0,0 +1,172 @@
+#
+# Project: laser_beam_measurements
+#
+# File: hikrobot_callback_check.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+# Checks the frame path of the HikRobot camera without the SDK. The MVS modules are replaced by a mock
+# which calls the image callback from its own thread like the SDK does. For every supported pixel format
+# the frame returned by query_frame has to match the sent pixels and must not change when the SDK buffer
+# is reused after the callback. Frames dropped from the callback queue have to return to the frame pool,
+# and the polling mode is used when the callback can not be registered.
+
+import sys
+import types
+import threading
+import numpy
+from ctypes import Structure, POINTER, c_ubyte, c_ushort, c_int, c_uint, pointer
+from time import perf_counter
+from pixel_format_benchmark import pack
+from laser_beam_measurements.camera_control.pixel_format import PixelFormat, PIXEL_FORMAT_BIT_DEPTH
+
+WIDTH: int = 4000
+HEIGHT: int = 3000
+REPEATS: int = 20
+HIKROBOT_PACKAGE: str = "laser_beam_measurements.camera_control.devices.hikrobot_camera"
+
+# the values of the SDK header
+SDK_PIXEL_TYPES: dict[PixelFormat, int] = {
+    PixelFormat.MONO8: 0x01080001,
+    PixelFormat.MONO10: 0x01100003,
+    PixelFormat.MONO10_PACKED: 0x010C0004,
+    PixelFormat.MONO12: 0x01100005,
+    PixelFormat.MONO12_PACKED: 0x010C0006,
+    PixelFormat.MONO16: 0x01100007,
+    PixelFormat.MONO10P: 0x010A0046,
+    PixelFormat.MONO12P: 0x010C0047
+}
+SDK_PIXEL_TYPE_NAMES: dict[PixelFormat, str] = {
+    PixelFormat.MONO8: "PixelType_Gvsp_Mono8",
+    PixelFormat.MONO10: "PixelType_Gvsp_Mono10",
+    PixelFormat.MONO10_PACKED: "PixelType_Gvsp_Mono10_Packed",
+    PixelFormat.MONO12: "PixelType_Gvsp_Mono12",
+    PixelFormat.MONO12_PACKED: "PixelType_Gvsp_Mono12_Packed",
+    PixelFormat.MONO16: "PixelType_Gvsp_Mono16",
+    PixelFormat.MONO10P: "PixelType_Gvsp_Mono10p",
+    PixelFormat.MONO12P: "PixelType_Gvsp_Mono12p"
+}
+
+
+class MV_FRAME_OUT_INFO_EX(Structure):
+    _fields_ = [("nWidth", c_ushort), ("nHeight", c_ushort), ("enPixelType", c_int), ("nFrameLen", c_uint)]
+
+
+class MV_FRAME_OUT(Structure):
+    _fields_ = [("pBufAddr", POINTER(c_ubyte)), ("stFrameInfo", MV_FRAME_OUT_INFO_EX)]
+
+
+class MockMvCamera:
+
+    def __init__(self, accept_callback: bool = True):
+        self.accept_callback: bool = accept_callback
+        self.callback = None
+        self.grabbing: bool = False
+        self.polled_frame: tuple[numpy.ndarray, MV_FRAME_OUT_INFO_EX] | None = None
+
+    def MV_CC_RegisterImageCallBackEx(self, callback, user) -> int:
+        if not self.accept_callback:
+            return -1
+        self.callback = callback
+        return 0
+
+    def MV_CC_StartGrabbing(self) -> int:
+        self.grabbing = True
+        return 0
+
+    def MV_CC_StopGrabbing(self) -> int:
+        self.grabbing = False
+        return 0
+
+    def MV_CC_GetImageBuffer(self, st_out_frame: MV_FRAME_OUT, timeout: int) -> int:
+        if self.polled_frame is None:
+            return -1
+        data, info = self.polled_frame
+        st_out_frame.pBufAddr = data.ctypes.data_as(POINTER(c_ubyte))
+        st_out_frame.stFrameInfo = info
+        return 0
+
+    def MV_CC_FreeImageBuffer(self, st_out_frame: MV_FRAME_OUT) -> int:
+        return 0
+
+    def MV_CC_DestroyHandle(self) -> int:
+        return 0
+
+    def send(self, data: numpy.ndarray, info: MV_FRAME_OUT_INFO_EX) -> None:
+        # the SDK calls the callback from its own thread
+        thread = threading.Thread(target=self.callback, args=(data.ctypes.data_as(POINTER(c_ubyte)), pointer(info), None))
+        thread.start()
+        thread.join()
+
+
+def install_mock_sdk() -> None:
+    hik = types.SimpleNamespace(MV_FRAME_OUT_INFO_EX=MV_FRAME_OUT_INFO_EX, MV_FRAME_OUT=MV_FRAME_OUT,
+                                MvCamera=MockMvCamera, MV_CC_DEVICE_INFO=object)
+    pixel_types = types.SimpleNamespace(**{SDK_PIXEL_TYPE_NAMES[f]: value for f, value in SDK_PIXEL_TYPES.items()})
+    module = types.ModuleType(HIKROBOT_PACKAGE + ".mv_import")
+    module.MvCameraControl_class = hik
+    module.PixelType_header = pixel_types
+    sys.modules[module.__name__] = module
+
+
+def frame_info(pixel_format: PixelFormat, data: numpy.ndarray, height: int, width: int) -> MV_FRAME_OUT_INFO_EX:
+    return MV_FRAME_OUT_INFO_EX(width, height, SDK_PIXEL_TYPES[pixel_format], len(data))
+
+
+if __name__ == "__main__":
+    install_mock_sdk()
+    from laser_beam_measurements.camera_control.devices.hikrobot_camera.hikrobot_camera import (HikRobotCamera,
+                                                                                               HikRobotGrabMode)
+    rng = numpy.random.default_rng(0)
+    sdk = MockMvCamera()
+    camera = HikRobotCamera(None, sdk, grab_mode=HikRobotGrabMode.CALLBACK)
+    camera.start()
+    assert sdk.callback is not None, "the callback is not registered before grabbing"
+
+    print(f"{'Format':<14}{'ms/frame':>10}{'fps':>10}")
+    for pixel_format in PixelFormat:
+        bit_depth = PIXEL_FORMAT_BIT_DEPTH[pixel_format]
+        pixels = rng.integers(0, 1 << bit_depth, (HEIGHT, WIDTH), dtype=numpy.uint16)
+        data = pack(pixel_format, pixels)
+        info = frame_info(pixel_format, data, HEIGHT, WIDTH)
+        sdk.send(data, info)
+        img = camera.query_frame(timeout=0)
+        assert img is not None, f"{pixel_format} frame is not queued"
+        # the SDK reuses its buffer after the callback returns
+        data[:] = 0
+        assert numpy.array_equal(img, pixels), f"{pixel_format} frame is not copied out of the SDK buffer"
+        assert camera.bit_depth == bit_depth
+        camera.frame_pool.release(img)
+        start = perf_counter()
+        for _ in range(REPEATS):
+            camera._on_image_callback(data.ctypes.data_as(POINTER(c_ubyte)), pointer(info), None)
+            camera.frame_pool.release(camera.query_frame(timeout=0))
+        duration = (perf_counter() - start) / REPEATS
+        print(f"{pixel_format:<14}{duration * 1e3:>10.2f}{1.0 / duration:>10.1f}")
+
+    # the consumer falls behind, only the newest frames are kept and the dropped ones return to the pool
+    pixels = rng.integers(0, 256, (8, HEIGHT // 10, WIDTH // 10), dtype=numpy.uint8)
+    for frame in pixels:
+        sdk.send(frame.ravel(), frame_info(PixelFormat.MONO8, frame.ravel(), *frame.shape))
+    kept = [camera.query_frame(timeout=0), camera.query_frame(timeout=0)]
+    assert camera.query_frame(timeout=0) is None
+    assert all(numpy.array_equal(img, frame) for img, frame in zip(kept, pixels[-2:])), "the newest frames are not kept"
+    assert camera.frame_pool.in_use == len(kept), "the dropped frames do not return to the pool"
+    for img in kept:
+        camera.frame_pool.release(img)
+    camera.stop()
+    assert not sdk.grabbing and camera.frame_pool.in_use == 0
+
+    # the frames are polled when the SDK refuses the callback
+    sdk = MockMvCamera(accept_callback=False)
+    camera = HikRobotCamera(None, sdk, grab_mode=HikRobotGrabMode.CALLBACK)
+    camera.start()
+    pixels = rng.integers(0, 1 << 12, (HEIGHT // 10, WIDTH // 10), dtype=numpy.uint16)
+    data = pack(PixelFormat.MONO12_PACKED, pixels)
+    sdk.polled_frame = (data, frame_info(PixelFormat.MONO12_PACKED, data, *pixels.shape))
+    assert numpy.array_equal(camera.query_frame(), pixels), "the polled frame is unpacked incorrectly"
+    camera.stop()
+    print("callback, queue and polling checks passed")
@@ -0,0 +1,60 @@
+#
+# Project: laser_beam_measurements
+#
+# File: pixel_format_benchmark.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+# Checks and times the unpacking of the supported pixel formats for a full resolution frame.
+# The frame rate column has to stay above the camera frame rate (30 fps for 4000 x 3000).
+
+import numpy
+from time import perf_counter
+from laser_beam_measurements.camera_control.pixel_format import (PixelFormat, PIXEL_FORMAT_BIT_DEPTH,
+                                                                  packed_frame_size, unpack_frame)
+
+WIDTH: int = 4000
+HEIGHT: int = 3000
+REPEATS: int = 20
+
+
+def pack(pixel_format: PixelFormat, pixels: numpy.ndarray) -> numpy.ndarray:
+    # reference packing written pixel group by pixel group
+    p = pixels.ravel().astype(numpy.uint64)
+    if pixel_format == PixelFormat.MONO8:
+        return pixels.astype(numpy.uint8).ravel()
+    if pixel_format in (PixelFormat.MONO10, PixelFormat.MONO12, PixelFormat.MONO16):
+        return pixels.astype("<u2").view(numpy.uint8).ravel()
+    if pixel_format == PixelFormat.MONO10P:
+        p = p.reshape(-1, 4)
+        words = p[:, 0] | (p[:, 1] << 10) | (p[:, 2] << 20) | (p[:, 3] << 30)
+        return numpy.stack([(words >> (8 * i)) & 0xFF for i in range(5)], axis=1).astype(numpy.uint8).ravel()
+    p = p.reshape(-1, 2)
+    if pixel_format == PixelFormat.MONO12P:
+        words = p[:, 0] | (p[:, 1] << 12)
+        groups = [words & 0xFF, (words >> 8) & 0xFF, (words >> 16) & 0xFF]
+    elif pixel_format == PixelFormat.MONO12_PACKED:
+        groups = [p[:, 0] >> 4, (p[:, 0] & 0x0F) | ((p[:, 1] & 0x0F) << 4), p[:, 1] >> 4]
+    else:
+        groups = [p[:, 0] >> 2, (p[:, 0] & 0x03) | ((p[:, 1] & 0x03) << 4), p[:, 1] >> 2]
+    return numpy.stack(groups, axis=1).astype(numpy.uint8).ravel()
+
+
+if __name__ == "__main__":
+    rng = numpy.random.default_rng(0)
+    print(f"{'Format':<14}{'ms/frame':>10}{'fps':>10}")
+    for pixel_format in PixelFormat:
+        bit_depth = PIXEL_FORMAT_BIT_DEPTH[pixel_format]
+        pixels = rng.integers(0, 1 << bit_depth, (HEIGHT, WIDTH), dtype=numpy.uint16)
+        data = pack(pixel_format, pixels)
+        assert len(data) == packed_frame_size(pixel_format, HEIGHT, WIDTH)
+        out = unpack_frame(pixel_format, data, HEIGHT, WIDTH)
+        assert numpy.array_equal(out, pixels), f"{pixel_format} is unpacked incorrectly"
+        start = perf_counter()
+        for _ in range(REPEATS):
+            unpack_frame(pixel_format, data, HEIGHT, WIDTH, out)
+        duration = (perf_counter() - start) / REPEATS
+        print(f"{pixel_format:<14}{duration * 1e3:>10.2f}{1.0 / duration:>10.1f}")
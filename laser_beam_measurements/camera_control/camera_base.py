@@ -13,6 +13,8 @@ __all__ = ["CameraBase", ]
 
 import numpy
 from .camera_property_base import CameraPropertyBase
+from .frame_pool import FramePool
+from .pixel_format import max_pixel_value
 
 
 class CameraBase(object):
@@ -24,7 +26,12 @@ class CameraBase(object):
         self._id: str | int | None = kwargs.get('camera_id', None)
         self._resolution: tuple[int, int] | list[int, int] = kwargs.get('resolution', (1920, 1080))
         self._bit_depth: int = kwargs.get('bit_depth', 8)
+        # the ROI is given in unbinned sensor pixels, the frames are the ROI divided by the binning
+        self._sensor_resolution: tuple[int, int] = tuple(self._resolution)
+        self._roi: tuple[int, int, int, int] = (0, 0, *self._sensor_resolution)
+        self._binning: int = 1
         self._properties: dict[str, CameraPropertyBase] = {}
+        self._frame_pool: FramePool = FramePool(kwargs.get('frame_pool_size', 8))
         self._initialize()
 
     def _initialize(self) -> None:
@@ -45,10 +52,23 @@ class CameraBase(object):
     def query_frame(self, *args, **kwargs) -> numpy.ndarray or None:
         pass
 
+    def interrupt_query(self) -> None:
+        # a blocking query_frame waiting in another thread returns as soon as possible
+        pass
+
     @property
     def is_opened(self) -> bool:
         return False
 
+    @property
+    def supports_blocking_query(self) -> bool:
+        # query_frame waits for the next frame instead of returning immediately
+        return False
+
+    @property
+    def frame_pool(self) -> FramePool:
+        return self._frame_pool
+
     @property
     def pixel_size(self) -> float:
         return self._pixel_size
@@ -57,6 +77,63 @@ class CameraBase(object):
     def resolution(self) -> tuple[int, int]:
         return self._resolution
 
+    @property
+    def bit_depth(self) -> int:
+        # significant bits of a pixel, frames deeper than 8 bits are uint16 arrays
+        return self._bit_depth
+
+    @property
+    def max_pixel_value(self) -> int:
+        return max_pixel_value(self._bit_depth)
+
+    @property
+    def supports_roi(self) -> bool:
+        return False
+
+    @property
+    def supports_binning(self) -> bool:
+        return False
+
+    @property
+    def sensor_resolution(self) -> tuple[int, int]:
+        return self._sensor_resolution
+
+    @property
+    def roi(self) -> tuple[int, int, int, int]:
+        # x, y, width and height
+        return self._roi
+
+    @property
+    def roi_step(self) -> tuple[int, int]:
+        # the ROI offset and size are multiples of the step
+        return 1, 1
+
+    @property
+    def binning(self) -> int:
+        return self._binning
+
+    def set_roi(self, x: int, y: int, width: int, height: int) -> bool:
+        # a camera may refuse to change the ROI while grabbing, the grabber stops it before
+        return False
+
+    def reset_roi(self) -> bool:
+        return self.set_roi(0, 0, *self._sensor_resolution)
+
+    def set_binning(self, binning: int) -> bool:
+        return False
+
+    def _align_roi(self, x: int, y: int, width: int, height: int) -> tuple[int, int, int, int]:
+        # the ROI is rounded outwards to the step and the binning and clipped by the sensor
+        sensor_width, sensor_height = self._sensor_resolution
+        step_x, step_y = (step * self._binning for step in self.roi_step)
+        x1 = min(max(int(x), 0), sensor_width) // step_x * step_x
+        y1 = min(max(int(y), 0), sensor_height) // step_y * step_y
+        x2 = min(-(-min(max(int(x + width), 0), sensor_width) // step_x) * step_x, sensor_width // step_x * step_x)
+        y2 = min(-(-min(max(int(y + height), 0), sensor_height) // step_y) * step_y, sensor_height // step_y * step_y)
+        x1 = min(x1, x2 - step_x)
+        y1 = min(y1, y2 - step_y)
+        return x1, y1, x2 - x1, y2 - y1
+
     @property
     def camera_id(self) -> str | int | None:
         return self._id
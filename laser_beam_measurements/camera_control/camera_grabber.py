@@ -9,19 +9,51 @@
 #
 
 
-from PySide6.QtCore import QObject, QThread, QMutex, QMutexLocker, QCoreApplication, Slot
+from PySide6.QtCore import QObject, QThread, QMutex, QMutexLocker, QCoreApplication, Signal, Slot
+from time import monotonic_ns
+from typing import Callable
+from enum import StrEnum
+import numpy
 
 from .camera_listener_base import CameraListenerBase, CameraState
 from .camera_listener import CameraListener
 from .camera_base import CameraBase
 from .camera_property_controller import CameraPropertyController
 from .camera_property_auto_controller import CameraPropertyAutoController
+from .frame import Frame
+from .frame_pool import FramePool, retain_for_receivers
 
-__all__ = ["CameraGrabber"]
+__all__ = ["CameraGrabber", "AcquisitionMode"]
+
+
+ACQUISITION_THREAD_STOP_TIMEOUT = 3000
+# the camera is woken up at this interval while the grabber waits for the acquisition thread
+ACQUISITION_THREAD_WAKE_INTERVAL = 100
+# the acquisition only tries to take the mutex, the stopping grabber holds it while it waits for the thread
+ACQUISITION_LOCK_TIMEOUT = 100
+
+
+class AcquisitionMode(StrEnum):
+    TIMER = "timer"
+    THREAD = "thread"
+
+
+class CameraAcquisitionThread(QThread):
+
+    def __init__(self, grabber: "CameraGrabber"):
+        super(CameraAcquisitionThread, self).__init__()
+        self._grabber: CameraGrabber = grabber
+
+    def run(self) -> None:
+        while not self.isInterruptionRequested():
+            self._grabber._acquire()
 
 
 class CameraGrabber(QObject):
 
+    signal_check_image = Signal(numpy.ndarray)
+    signal_bit_depth_changed = Signal(int)
+
     def __init__(self, parent=None, **kwargs):
         super(CameraGrabber, self).__init__(parent)
         self._camera: CameraBase | None = None
@@ -31,12 +63,20 @@ class CameraGrabber(QObject):
         self._mutex: QMutex = kwargs.get("mutex", QMutex())
         self._timer_interval: int = 30
         self._timer_id: int = -1
+        self._frame_sequence: int = 0
+        self._bit_depth: int = 0
+        self._acquisition_mode: AcquisitionMode = kwargs.get("acquisition_mode", AcquisitionMode.THREAD)
+        self._acquisition_thread: CameraAcquisitionThread | None = None
 
         self._update_fps: bool = False
         self._auto_grabbing_enabled: bool = True
         self._property_controller: CameraPropertyController = CameraPropertyController(self)
         self._property_auto_controller: CameraPropertyAutoController = CameraPropertyAutoController(self)
         self._property_auto_controller.set_controller(self._property_controller)
+        # the images are checked in the thread of the auto controller also when they are acquired in the
+        # acquisition thread
+        self.signal_check_image.connect(self._property_auto_controller.check_image)
+        self.signal_bit_depth_changed.connect(self._property_auto_controller.set_bit_depth)
 
         if self._thread is None:
             self._thread = QThread()
@@ -54,6 +94,7 @@ class CameraGrabber(QObject):
     def set_camera(self, camera: CameraBase) -> None:
         with QMutexLocker(self._mutex):
             self._camera = camera
+            self._bit_depth = 0
             self._property_controller.set_camera(self._camera)
             if self._listener is not None:
                 self._listener.reset()
@@ -96,15 +137,36 @@ class CameraGrabber(QObject):
         with QMutexLocker(self._mutex):
             return self._property_auto_controller
 
+    @property
+    def acquisition_mode(self) -> AcquisitionMode:
+        with QMutexLocker(self._mutex):
+            return self._acquisition_mode
+
+    @Slot(str)
+    def set_acquisition_mode(self, mode: AcquisitionMode | str) -> None:
+        with QMutexLocker(self._mutex):
+            mode = AcquisitionMode(mode)
+            if mode == self._acquisition_mode:
+                return
+            is_grabbing = self._is_grabbing()
+            if is_grabbing and not self.stop():
+                return
+            self._acquisition_mode = mode
+            if is_grabbing:
+                self.start()
+
+    def _is_grabbing(self) -> bool:
+        return self._timer_id > 0 or self._acquisition_thread is not None
+
     @Slot(bool)
     def set_auto_grabbing_flag(self, value: bool) -> None:
         with QMutexLocker(self._mutex):
             self._auto_grabbing_enabled = value
-            if not self._auto_grabbing_enabled and self._timer_id > 0:
+            if not self._auto_grabbing_enabled and self._is_grabbing():
                 self.stop()
 
     def start(self) -> None:
-        if self._timer_id > 0:
+        if self._is_grabbing():
             # self.stop()
             return
         if self._camera is None:
@@ -114,17 +176,76 @@ class CameraGrabber(QObject):
             if self._listener is None:
                 self._listener = CameraListener(parent=self)
             if self._camera.is_opened:
-                self._camera.start()
-                self._update_timer_interval()
-                self._timer_id = self.startTimer(self._timer_interval)
+                self._frame_sequence = 0
+                self._start_acquisition()
                 self._listener.on_camera_state_changed(CameraState.STARTED)
 
-    def stop(self) -> None:
+    def _start_acquisition(self) -> None:
+        self._camera.start()
+        if self._acquisition_mode == AcquisitionMode.THREAD and self._camera.supports_blocking_query:
+            # the camera waits for frames itself, so they are pushed as soon as they arrive
+            self._acquisition_thread = CameraAcquisitionThread(self)
+            self._acquisition_thread.start()
+        else:
+            self._update_timer_interval()
+            self._timer_id = self.startTimer(self._timer_interval)
+
+    def stop(self) -> bool:
+        if not self._is_grabbing():
+            return True
+        if not self._stop_acquisition():
+            return False
+        self._listener.on_camera_state_changed(CameraState.STOPPED)
+        return True
+
+    def _stop_acquisition(self) -> bool:
+        if self._acquisition_thread is not None:
+            self._acquisition_thread.requestInterruption()
+            waited = 0
+            while not self._acquisition_thread.wait(ACQUISITION_THREAD_WAKE_INTERVAL):
+                waited += ACQUISITION_THREAD_WAKE_INTERVAL
+                if waited >= ACQUISITION_THREAD_STOP_TIMEOUT:
+                    # the thread is still inside the driver, it is kept and the camera is not stopped under it
+                    self._listener.on_error("The acquisition thread does not stop")
+                    return False
+                self._camera.interrupt_query()
+            self._acquisition_thread = None
         if self._timer_id > 0:
             self.killTimer(self._timer_id)
             self._timer_id = -1
-            self._camera.stop()
-            self._listener.on_camera_state_changed(CameraState.STOPPED)
+        self._camera.stop()
+        return True
+
+    def _change_readout(self, change: Callable[[], bool]) -> bool:
+        # the readout area can not be changed while the camera is grabbing, the grabbing is paused
+        # without notifying the listener, so the frame sequence continues
+        if self._camera is None or not self._camera.is_opened:
+            return False
+        is_grabbing = self._is_grabbing()
+        if is_grabbing and not self._stop_acquisition():
+            return False
+        changed = change()
+        if is_grabbing:
+            self._start_acquisition()
+        return changed
+
+    @Slot(int, int, int, int)
+    def set_roi(self, x: int, y: int, width: int, height: int) -> None:
+        with QMutexLocker(self._mutex):
+            if self._camera is not None and self._camera.supports_roi:
+                self._change_readout(lambda: self._camera.set_roi(x, y, width, height))
+
+    @Slot()
+    def reset_roi(self) -> None:
+        with QMutexLocker(self._mutex):
+            if self._camera is not None and self._camera.supports_roi:
+                self._change_readout(self._camera.reset_roi)
+
+    @Slot(int)
+    def set_binning(self, binning: int) -> None:
+        with QMutexLocker(self._mutex):
+            if self._camera is not None and self._camera.supports_binning:
+                self._change_readout(lambda: self._camera.set_binning(binning))
 
     @Slot(bool)
     def run_status_changed(self, started: bool) -> None:
@@ -136,8 +257,10 @@ class CameraGrabber(QObject):
 
     @Slot()
     def close(self) -> None:
-        self.stop()
         with QMutexLocker(self._mutex):
+            if not self.stop():
+                # the camera is still used by the acquisition thread
+                return
             if self._camera is not None:
                 self._camera.close()
                 self._camera = None
@@ -168,10 +291,42 @@ class CameraGrabber(QObject):
         super().timerEvent(*args, **kwargs)
 
     def _acquire(self):
+        if not self._mutex.tryLock(ACQUISITION_LOCK_TIMEOUT):
+            return
+        camera, listener = self._camera, self._listener
+        self._mutex.unlock()
+        if camera is None or listener is None:
+            return
+        img = None
         try:
-            img = self._camera.query_frame()
-            if img is not None:
-                self._listener.on_new_image(img)
-                self._property_auto_controller.check_image(img)
+            # the query may wait for the next frame, so it runs without the mutex
+            img = camera.query_frame()
+            if img is None:
+                return
+            timestamp = monotonic_ns()
+            if not self._mutex.tryLock(ACQUISITION_LOCK_TIMEOUT):
+                # the grabber is being stopped, the frame is dropped
+                return
+            try:
+                if camera is not self._camera or listener is not self._listener:
+                    return
+                self._frame_sequence += 1
+                bit_depth = camera.bit_depth
+                if bit_depth != self._bit_depth:
+                    # the pixel format may change while grabbing, the auto controller follows the full scale
+                    self._bit_depth = bit_depth
+                    self.signal_bit_depth_changed.emit(bit_depth)
+                frame = Frame(
+                    img, timestamp, self._frame_sequence, camera.camera_id,
+                    camera.get_property_value('exposure'), camera.get_property_value('gain'),
+                    bit_depth, camera.roi[:2], camera.binning)
+                listener.on_new_frame(frame)
+            finally:
+                self._mutex.unlock()
+            retain_for_receivers(self, "signal_check_image(PyObject)", img)
+            self.signal_check_image.emit(img)
         except Exception as ex:
-            self._listener.on_error(str(ex))
+            listener.on_error(str(ex))
+        finally:
+            # the receivers took their own holds of the frame
+            FramePool.release(img)
@@ -13,6 +13,8 @@ import numpy
 from PySide6.QtCore import QObject, Signal, QElapsedTimer
 from PySide6.QtGui import QImage
 from .camera_listener_base import CameraListenerBase, CameraState
+from .frame import Frame
+from .frame_pool import retain_for_receivers
 
 __all__ = ["CameraListener"]
 
@@ -20,6 +22,7 @@ __all__ = ["CameraListener"]
 class CameraListener(QObject, CameraListenerBase):
 
     signal_new_image_received = Signal(numpy.ndarray)
+    signal_new_frame_received = Signal(object)
     signal_camera_state_changed = Signal(CameraState)
     signal_error_received = Signal(str)
     signal_statistic_collected = Signal(int, int, float)
@@ -43,6 +46,7 @@ class CameraListener(QObject, CameraListenerBase):
 
     def on_new_image(self, img: numpy.ndarray) -> None:
         self._frame_counter += 1
+        retain_for_receivers(self, "signal_new_image_received(PyObject)", img)
         self.signal_new_image_received.emit(img)
         self._t1 = self._elapsed_timer.nsecsElapsed()
         if self._actual_fps < 0.0:
@@ -52,6 +56,11 @@ class CameraListener(QObject, CameraListenerBase):
         self._t0 = self._t1
         self.signal_statistic_collected.emit(self._frame_counter, self._error_counter, self._actual_fps)
 
+    def on_new_frame(self, frame: Frame) -> None:
+        retain_for_receivers(self, "signal_new_frame_received(PyObject)", frame.image)
+        self.signal_new_frame_received.emit(frame)
+        self.on_new_image(frame.image)
+
     def on_camera_state_changed(self, flag_state: CameraState) -> None:
         self.signal_camera_state_changed.emit(flag_state)
 
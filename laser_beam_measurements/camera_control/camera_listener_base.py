@@ -10,6 +10,7 @@
 
 import numpy
 from enum import Enum
+from .frame import Frame
 
 __all__ = ["CameraListenerBase", "CameraState"]
 
@@ -25,6 +26,9 @@ class CameraListenerBase(object):
     def on_new_image(self, img: numpy.ndarray) -> None:
         pass
 
+    def on_new_frame(self, frame: Frame) -> None:
+        self.on_new_image(frame.image)
+
     def on_camera_state_changed(self, flag_state: CameraState) -> None:
         pass
 
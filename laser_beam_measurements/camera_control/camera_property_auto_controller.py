@@ -12,6 +12,12 @@ from PySide6.QtCore import QObject, Signal, Slot, Qt
 from enum import Enum
 import numpy
 from .camera_property_controller import CameraPropertyController
+from .pixel_format import max_pixel_value
+from .frame_pool import FramePool
+
+
+# the target range of the maximal pixel value relative to the full scale, 190-240 for 8-bit frames
+DEFAULT_RELATIVE_RANGE = (190 / 255, 240 / 255)
 
 
 class ControllerStatus(Enum):
@@ -85,7 +91,9 @@ class CameraPropertyAutoController(QObject):
         self._flag_control_always: bool = False
         self._flag_bad_signal: bool = False
         self._property_name: str = "exposure"
-        self._checker.range = (190, 240)
+        self._bit_depth: int = 8
+        self._relative_range: tuple[float, float] = DEFAULT_RELATIVE_RANGE
+        self._update_checker_range()
         self._current_bounds: list = list()
         self._step = 1e-1
         self._prop_range: tuple = (0.0, 1.0)
@@ -126,7 +134,13 @@ class CameraPropertyAutoController(QObject):
     def slot_control_always_change(self) -> None:
         self.set_control_always(not self._flag_control_always)
 
+    @Slot(numpy.ndarray)
     def check_image(self, img: numpy.ndarray) -> None:
+        self._check_image(img)
+        # the grabber took a hold of the frame for this slot
+        FramePool.release(img)
+
+    def _check_image(self, img: numpy.ndarray) -> None:
         if not self._flag_active:
             return
         check_result = ControllerStatus.STATUS_NONE
@@ -165,8 +179,27 @@ class CameraPropertyAutoController(QObject):
         return check_result
 
     def set_range(self, min_value: int, max_value: int) -> None:
+        # the values are pixel values of the current bit depth
+        full_scale = max_pixel_value(self._bit_depth)
+        self._relative_range = (min_value / full_scale, max_value / full_scale)
         self._checker.range = (min_value, max_value)
 
+    @property
+    def bit_depth(self) -> int:
+        return self._bit_depth
+
+    @Slot(int)
+    def set_bit_depth(self, bit_depth: int) -> None:
+        if bit_depth <= 0 or bit_depth == self._bit_depth:
+            return
+        self._bit_depth = bit_depth
+        self._update_checker_range()
+
+    def _update_checker_range(self) -> None:
+        full_scale = max_pixel_value(self._bit_depth)
+        self._checker.range = (round(self._relative_range[0] * full_scale),
+                               round(self._relative_range[1] * full_scale))
+
     def _small_correct(self, check_result: ControllerStatus) -> bool:
         value = self._controller.get_property_value(self._property_name)
         if abs(value - self._prop_range[0]) < self._step or abs(value - self._prop_range[1]) < self._step:
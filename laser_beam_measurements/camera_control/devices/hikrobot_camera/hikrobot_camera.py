@@ -10,6 +10,13 @@
 
 
 from laser_beam_measurements.camera_control.camera_base import CameraBase
+from laser_beam_measurements.camera_control.frame_pool import FramePool
+from laser_beam_measurements.camera_control.pixel_format import (PixelFormat, PIXEL_FORMAT_BIT_DEPTH,
+                                                                  packed_frame_size, unpack_frame)
+from PySide6.QtCore import QMutex, QMutexLocker, QWaitCondition
+from collections import deque
+from enum import StrEnum
+import sys
 import numpy
 from ctypes import *
 
@@ -17,6 +24,37 @@ from .mv_import import MvCameraControl_class as hik
 from .mv_import import PixelType_header as PixelType
 from .hikrobot_camera_property import HikRobotCameraProperty
 
+if sys.platform == "win32":
+    _callback_function_type = WINFUNCTYPE
+else:
+    _callback_function_type = CFUNCTYPE
+
+# void __stdcall ImageCallBackEx(unsigned char *pData, MV_FRAME_OUT_INFO_EX *pFrameInfo, void *pUser)
+ImageCallBackEx = _callback_function_type(None, POINTER(c_ubyte), POINTER(hik.MV_FRAME_OUT_INFO_EX), c_void_p)
+
+FRAME_TIMEOUT_MS = 1000
+CALLBACK_QUEUE_SIZE = 2
+
+# not every SDK version defines all packed formats
+_SDK_PIXEL_FORMATS: dict[int, PixelFormat] = {
+    getattr(PixelType, name): pixel_format for name, pixel_format in (
+        ("PixelType_Gvsp_Mono8", PixelFormat.MONO8),
+        ("PixelType_Gvsp_Mono10", PixelFormat.MONO10),
+        ("PixelType_Gvsp_Mono12", PixelFormat.MONO12),
+        ("PixelType_Gvsp_Mono16", PixelFormat.MONO16),
+        ("PixelType_Gvsp_Mono10_Packed", PixelFormat.MONO10_PACKED),
+        ("PixelType_Gvsp_Mono12_Packed", PixelFormat.MONO12_PACKED),
+        ("PixelType_Gvsp_Mono10p", PixelFormat.MONO10P),
+        ("PixelType_Gvsp_Mono12p", PixelFormat.MONO12P)
+    ) if hasattr(PixelType, name)
+}
+_UNPACKED_PIXEL_FORMATS = (PixelFormat.MONO8, PixelFormat.MONO10, PixelFormat.MONO12, PixelFormat.MONO16)
+
+
+class HikRobotGrabMode(StrEnum):
+    POLLING = "polling"
+    CALLBACK = "callback"
+
 
 class HikRobotCamera(CameraBase):
 
@@ -27,6 +65,16 @@ class HikRobotCamera(CameraBase):
         self._cam: hik.MvCamera = mv_cam
         self._is_opened: bool = False
         self._st_out_frame: hik.MV_FRAME_OUT = hik.MV_FRAME_OUT()
+        self._grab_mode: HikRobotGrabMode = HikRobotGrabMode(kwargs.get("grab_mode", HikRobotGrabMode.CALLBACK))
+        self._callback_registered: bool = False
+        # the ctypes callback object must stay alive while the SDK may call it
+        self._image_callback = ImageCallBackEx(self._on_image_callback)
+        self._frames_mutex: QMutex = QMutex()
+        self._frames_condition: QWaitCondition = QWaitCondition()
+        self._frames: deque[numpy.ndarray] = deque(maxlen=CALLBACK_QUEUE_SIZE)
+        self._roi_available: bool = False
+        self._binning_available: bool = False
+        self._roi_step: tuple[int, int] = (1, 1)
         super(HikRobotCamera, self).__init__(**kwargs)
 
     def _initialize(self) -> None:
@@ -50,15 +98,82 @@ class HikRobotCamera(CameraBase):
 
             self._cam.MV_CC_SetEnumValue("TriggerMode", hik.MV_TRIGGER_MODE_OFF)
 
-            int_value = hik.MVCC_INTVALUE()
-            memset(byref(int_value), 0, sizeof(hik.MVCC_INTVALUE))
-            self._cam.MV_CC_GetIntValue("Width", int_value)
-            width = int(int_value.nCurValue)
+            self._read_readout()
+
+            enum_value = hik.MVCC_ENUMVALUE()
+            memset(byref(enum_value), 0, sizeof(hik.MVCC_ENUMVALUE))
+            if self._cam.MV_CC_GetEnumValue("PixelFormat", enum_value) == 0:
+                pixel_format = _SDK_PIXEL_FORMATS.get(int(enum_value.nCurValue), None)
+                if pixel_format is not None:
+                    self._bit_depth = PIXEL_FORMAT_BIT_DEPTH[pixel_format]
+
+    def _get_int_value(self, name: str) -> tuple[int, int, int, int] | None:
+        # current, min, max and increment
+        int_value = hik.MVCC_INTVALUE()
+        memset(byref(int_value), 0, sizeof(hik.MVCC_INTVALUE))
+        if self._cam.MV_CC_GetIntValue(name, int_value) != 0:
+            return None
+        return int(int_value.nCurValue), int(int_value.nMin), int(int_value.nMax), max(int(int_value.nInc), 1)
+
+    def _read_readout(self) -> None:
+        # the GenICam offsets and sizes are given in binned pixels
+        enum_value = hik.MVCC_ENUMVALUE()
+        memset(byref(enum_value), 0, sizeof(hik.MVCC_ENUMVALUE))
+        self._binning_available = self._cam.MV_CC_GetEnumValue("BinningHorizontal", enum_value) == 0
+        self._binning = max(int(enum_value.nCurValue), 1) if self._binning_available else 1
+        b = self._binning
+        width = self._get_int_value("Width")
+        height = self._get_int_value("Height")
+        if width is None or height is None:
+            return
+        self._resolution = (width[0], height[0])
+        offset_x = self._get_int_value("OffsetX")
+        offset_y = self._get_int_value("OffsetY")
+        width_max = self._get_int_value("WidthMax")
+        height_max = self._get_int_value("HeightMax")
+        self._roi_available = offset_x is not None and offset_y is not None
+        if width_max is not None and height_max is not None:
+            self._sensor_resolution = (width_max[0] * b, height_max[0] * b)
+        else:
+            self._sensor_resolution = (width[2] * b, height[2] * b)
+        if self._roi_available:
+            self._roi = (offset_x[0] * b, offset_y[0] * b, width[0] * b, height[0] * b)
+            self._roi_step = (max(width[3], offset_x[3]), max(height[3], offset_y[3]))
+        else:
+            self._roi = (0, 0, width[0] * b, height[0] * b)
+
+    @property
+    def supports_roi(self) -> bool:
+        return self._is_opened and self._roi_available
+
+    @property
+    def supports_binning(self) -> bool:
+        return self._is_opened and self._binning_available
+
+    @property
+    def roi_step(self) -> tuple[int, int]:
+        return self._roi_step
 
-            self._cam.MV_CC_GetIntValue("Height", int_value)
-            height = int(int_value.nCurValue)
+    def set_roi(self, x: int, y: int, width: int, height: int) -> bool:
+        if not self.supports_roi:
+            return False
+        b = self._binning
+        x, y, width, height = (value // b for value in self._align_roi(x, y, width, height))
+        # the offsets are cleared first, so the new size always fits the sensor
+        ret = self._cam.MV_CC_SetIntValue("OffsetX", 0) | self._cam.MV_CC_SetIntValue("OffsetY", 0)
+        ret |= self._cam.MV_CC_SetIntValue("Width", width) | self._cam.MV_CC_SetIntValue("Height", height)
+        ret |= self._cam.MV_CC_SetIntValue("OffsetX", x) | self._cam.MV_CC_SetIntValue("OffsetY", y)
+        self._read_readout()
+        return ret == 0
 
-            self._resolution = (width, height)
+    def set_binning(self, binning: int) -> bool:
+        if not self.supports_binning:
+            return False
+        ret = self._cam.MV_CC_SetEnumValue("BinningHorizontal", int(binning))
+        ret |= self._cam.MV_CC_SetEnumValue("BinningVertical", int(binning))
+        # the camera adjusts the ROI to the new binning
+        self._read_readout()
+        return ret == 0
 
     def close(self) -> None:
         if self._cam.MV_CC_CloseDevice() == 0:
@@ -67,35 +182,104 @@ class HikRobotCamera(CameraBase):
     def __del__(self) -> None:
         self._cam.MV_CC_DestroyHandle()
 
+    @property
+    def grab_mode(self) -> HikRobotGrabMode:
+        return self._grab_mode
+
+    def set_grab_mode(self, mode: HikRobotGrabMode | str) -> None:
+        # takes effect on the next start
+        self._grab_mode = HikRobotGrabMode(mode)
+
     def start(self) -> None:
+        self._clear_frames()
+        self._callback_registered = False
+        if self._grab_mode == HikRobotGrabMode.CALLBACK:
+            # the callback has to be registered before grabbing starts, if the SDK refuses it
+            # the frames are polled
+            self._callback_registered = self._cam.MV_CC_RegisterImageCallBackEx(self._image_callback, None) == 0
         ret = self._cam.MV_CC_StartGrabbing()
 
     def stop(self) -> None:
         self._cam.MV_CC_StopGrabbing()
+        if self._callback_registered:
+            self._cam.MV_CC_RegisterImageCallBackEx(None, None)
+            self._callback_registered = False
+        self._clear_frames()
 
     def query_frame(self, *args, **kwargs) -> numpy.ndarray or None:
-        ret = self._cam.MV_CC_GetImageBuffer(self._st_out_frame, 1000)
+        timeout = kwargs.get("timeout", FRAME_TIMEOUT_MS)
+        if self._callback_registered:
+            return self._wait_frame(timeout)
+
+        ret = self._cam.MV_CC_GetImageBuffer(self._st_out_frame, timeout)
 
         if ret != 0:
             return None
 
-        st_frame_info = self._st_out_frame.stFrameInfo
-        h, w = st_frame_info.nHeight, st_frame_info.nWidth
-
-        buf_save_image = (c_ubyte * st_frame_info.nFrameLen)()
-        cdll.msvcrt.memcpy(byref(buf_save_image), self._st_out_frame.pBufAddr, st_frame_info.nFrameLen)
-        en_pixel_size = st_frame_info.enPixelType
-        img: numpy.ndarray | None = None
-        if en_pixel_size == PixelType.PixelType_Gvsp_Mono8:
-            img = numpy.frombuffer(buf_save_image, count=int(w * h), dtype=numpy.uint8, offset=0)
-            img = img.copy().reshape(h, w)
+        img = self._copy_frame(self._st_out_frame.pBufAddr, self._st_out_frame.stFrameInfo)
         self._cam.MV_CC_FreeImageBuffer(self._st_out_frame)
         return img
 
+    def interrupt_query(self) -> None:
+        # the query waiting for the callback returns without a frame, a polling query returns
+        # after its timeout
+        with QMutexLocker(self._frames_mutex):
+            self._frames_condition.wakeAll()
+
+    def _wait_frame(self, timeout: int) -> numpy.ndarray | None:
+        with QMutexLocker(self._frames_mutex):
+            if not self._frames and timeout > 0:
+                self._frames_condition.wait(self._frames_mutex, int(timeout))
+            if self._frames:
+                return self._frames.popleft()
+            return None
+
+    def _on_image_callback(self, p_data, p_frame_info, p_user) -> None:
+        # called from the SDK thread, the SDK buffer is valid only until the callback returns
+        if not p_data or not p_frame_info:
+            return
+        img = self._copy_frame(p_data, p_frame_info.contents)
+        if img is None:
+            return
+        with QMutexLocker(self._frames_mutex):
+            # the oldest frame is dropped when the consumer falls behind, its buffer returns to the pool
+            if len(self._frames) == self._frames.maxlen:
+                FramePool.release(self._frames.popleft())
+            self._frames.append(img)
+            self._frames_condition.wakeOne()
+
+    def _clear_frames(self) -> None:
+        with QMutexLocker(self._frames_mutex):
+            while self._frames:
+                FramePool.release(self._frames.popleft())
+            self._frames_condition.wakeAll()
+
+    def _copy_frame(self, p_data, st_frame_info) -> numpy.ndarray | None:
+        h, w = int(st_frame_info.nHeight), int(st_frame_info.nWidth)
+        pixel_format = _SDK_PIXEL_FORMATS.get(int(st_frame_info.enPixelType), None)
+        if pixel_format is None:
+            return None
+        self._bit_depth = PIXEL_FORMAT_BIT_DEPTH[pixel_format]
+        frame_length = int(st_frame_info.nFrameLen)
+        if pixel_format in _UNPACKED_PIXEL_FORMATS:
+            # the frame is copied from the SDK buffer directly into a pooled array
+            img = self._frame_pool.acquire((h, w), numpy.uint8 if pixel_format == PixelFormat.MONO8 else numpy.uint16)
+            memmove(img.ctypes.data, p_data, min(img.nbytes, frame_length))
+            return img
+        if frame_length < packed_frame_size(pixel_format, h, w):
+            return None
+        # the packed pixels are unpacked from the SDK buffer into a pooled array
+        data = numpy.ctypeslib.as_array(cast(p_data, POINTER(c_ubyte)), shape=(frame_length,))
+        return unpack_frame(pixel_format, data, h, w, self._frame_pool.acquire((h, w), numpy.uint16))
+
     @property
     def is_opened(self) -> bool:
         return self._is_opened
 
+    @property
+    def supports_blocking_query(self) -> bool:
+        return True
+
     def has_property_dialog(self):
         return True
 
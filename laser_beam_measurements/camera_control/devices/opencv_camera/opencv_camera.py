@@ -27,6 +27,7 @@ class OpenCVCamera(CameraBase):
         kwargs.update({"camera_id": camera_id})
         super(OpenCVCamera, self).__init__(**kwargs)
         self._cap: [cv2.VideoCapture, None] = None
+        self._raw_frame = None
 
     def _initialize(self) -> None:
         self._properties.clear()
@@ -68,9 +69,18 @@ class OpenCVCamera(CameraBase):
             return self._cap.isOpened()
         return False
 
+    @property
+    def supports_blocking_query(self) -> bool:
+        return True
+
     def query_frame(self, *args, **kwargs):
         if self.is_opened:
-            res, im = self._cap.read()
-            im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
-            return im
+            # the raw frame is reused by the capture, the converted one comes from the pool
+            res, im = self._cap.read(self._raw_frame)
+            if not res or im is None:
+                return None
+            self._raw_frame = im
+            frame = self._frame_pool.acquire(im.shape, im.dtype)
+            cv2.cvtColor(im, cv2.COLOR_BGR2RGB, dst=frame)
+            return frame
         return None
@@ -20,3 +20,13 @@ def generate_line(x, y, x0, y0, sigma_x, power) -> numpy.ndarray:
     distance_x = (x - x0)
     exp_arg = -2.0 * distance_x**2 / (sigma_x*2)
     return power / (numpy.sqrt(2*numpy.pi) * sigma_x) * numpy.exp(exp_arg)
+
+
+# normalised 1-D profiles of the patterns above, the 2-D patterns are their outer products
+
+def gauss_profile(x: numpy.ndarray, x0: float, sigma: float) -> numpy.ndarray:
+    return numpy.exp(numpy.float32(-2.0 / sigma ** 2) * (x - numpy.float32(x0)) ** 2)
+
+
+def line_profile(x: numpy.ndarray, x0: float, sigma_x: float) -> numpy.ndarray:
+    return numpy.exp(numpy.float32(-2.0 / (sigma_x * 2)) * (x - numpy.float32(x0)) ** 2)
@@ -9,83 +9,163 @@
 #
 
 import numpy
-from numpy.random import random, randint
-from time import time, sleep
+import cv2
+from numpy.random import randint, default_rng
+from time import perf_counter, sleep
 
 from laser_beam_measurements.camera_control.camera_base import CameraBase
 from laser_beam_measurements.camera_control.camera_property_base import CameraPropertyBase
-from .helper_functions import generate_gauss, generate_line
+from .helper_functions import gauss_profile, line_profile
 
 __all__ = ['VirtualCamera', 'VirtualProperty']
 
 
+DEFAULT_RESOLUTION = (4000, 3000)
+DEFAULT_FPS = 30.0
+MAX_FPS = 1000.0
+SIGMA = 300.0
+PEAK_SEARCH_STEP = 4
+VIRTUAL_BINNING = (1, 2, 4)
+# the noise of a frame is a window of the pool at a random offset
+NOISE_POOL_EXTRA = 1 << 16
+
+
 class VirtualCamera(CameraBase):
     type = 'Virtual'
 
     def __init__(self, **kwargs):
-        # kwargs.update({'resolution': [1920, 1080]})
-        kwargs.update({'resolution': [4000, 3000]})
+        kwargs.update({'resolution': tuple(kwargs.get('resolution', DEFAULT_RESOLUTION))})
         super(VirtualCamera, self).__init__(**kwargs)
-        self.fps = kwargs.get('fps', 30)
+        self.fps = min(max(float(kwargs.get('fps', DEFAULT_FPS)), 1.0), MAX_FPS)
+        # the camera id is the beam pattern followed by the options, e.g. "round 12-bit"
+        self._pattern: str = str(self._id).split()[0] if self._id is not None else "round"
+        # brightness is simulated in 8-bit units and scaled to the full scale of the bit depth
+        self._intensity_scale: float = self.max_pixel_value / 255.0
+        self._frame_dtype: type = numpy.uint8 if self._bit_depth <= 8 else numpy.uint16
+        self._frame_depth: int = cv2.CV_8U if self._bit_depth <= 8 else cv2.CV_16U
+        # the normalised beam profile of the current readout and the key it was rendered for
+        self._profile: numpy.ndarray | None = None
+        self._profile_key: tuple | None = None
+        self._pattern_peak: tuple[tuple, float] | None = None
+        self._rng: numpy.random.Generator = default_rng()
+        self._noise_pool: numpy.ndarray | None = None
         self.x0 = randint(self._resolution[0] / 4, self._resolution[0] / 2)
         self.y0 = randint(self._resolution[1] / 4, self._resolution[1] / 2)
         self.t_ms = 100.0
         self.flag_opened = False
         self.prev_frame_time = 0.0
         self.exp_range = (1, 255)
-        self._max_fps_t = 60.0
-        self.fps_range = (1.0, round(1.0/self._max_fps_t, 2))
+        self.fps_range = (1.0, MAX_FPS)
         self.gain_range = (0.0, 4.0)
         self._properties = {
             'fps': VirtualProperty(self, 'fps', self.fps_range),
             'exposure': VirtualProperty(self, 'exposure', self.exp_range)
         }
-        self._initialize1()
-
-    def _initialize1(self) -> None:
-        self._max_fps_t = 60.0
-        for _ in range(5):
-            t0 = time()
-            _ = self._get_stimulated_image(self.x0, self.y0, False)
-            t1 = time()
-            if self._max_fps_t > t1 - t0:
-                self._max_fps_t = t1 - t0
 
     def _get_stimulated_image(self, x0, y0, is_sleep=True, static=False):
-        t0 = time()
         if is_sleep:
-            if 1.0/self.fps > (t0 - self.prev_frame_time):
-                sleep(1.0/self.fps - t0 + self.prev_frame_time)
-        x = numpy.arange(0, self._resolution[0])
-        y = numpy.arange(0, self._resolution[1])
-        sigma = 300.0
-        power = 1000.0
-        xx, yy = numpy.meshgrid(x, y)
-        if self._id == "zero":
-            img = (self.t_ms * 0.01 * random([self._resolution[1],
-                                              self._resolution[0]]))
-        elif self._id == "line":
-            img = generate_line(xx, yy, x0, y0, sigma, power)
+            self._wait_next_frame()
+        width, height = self._resolution
+        signal = (self.t_ms + 100.0) * self._intensity_scale
+        noise = 0.0 if static else self.t_ms * 0.01 * self._intensity_scale
+        profile = self._get_profile(x0, y0)
+        frame = self._frame_pool.acquire((height, width), self._frame_dtype)
+        if profile is None and noise == 0.0:
+            frame.fill(0)
+            return frame
+        noise_image = self._get_noise(height, width) if noise != 0.0 else profile
+        if profile is None:
+            profile, signal = noise_image, 0.0
+        # the profile and the noise are scaled, summed, converted and saturated in one pass, the offset
+        # turns the rounding into the truncation of the former float frames
+        cv2.addWeighted(profile, signal, noise_image, noise, -0.5, dst=frame, dtype=self._frame_depth)
+        if self.max_pixel_value < numpy.iinfo(self._frame_dtype).max:
+            numpy.minimum(frame, self.max_pixel_value, out=frame)
+        return frame
+
+    def _wait_next_frame(self) -> None:
+        # the frames are paced by deadlines, so the frame rate does not drift with the rendering time
+        period = 1.0 / self.fps
+        now = perf_counter()
+        next_frame_time = self.prev_frame_time + period
+        if next_frame_time > now:
+            sleep(next_frame_time - now)
+            self.prev_frame_time = next_frame_time
         else:
-            img = generate_gauss(yy, xx, y0, x0, sigma, power)
-        if self._id == "perpendicular":
-            img += generate_gauss(yy, xx, y0 + sigma/1.5, x0, sigma, power)
-        elif self._id == "left":
-            img += generate_gauss(yy, xx, y0 + sigma/1.5, x0 + sigma/2, sigma, power)
-        elif self._id == "right":
-            img += generate_gauss(yy, xx, y0 + sigma/1.5, x0 - sigma/2, sigma, power)
-        img = numpy.array((self.t_ms + 100.0) * img / numpy.max(img))
-        if not static:
-            img += (self.t_ms*0.01*random([self._resolution[1],
-                                           self._resolution[0]]))
-        numpy.putmask(img, img > 255.0, 255.0)
-        img = numpy.array(img, dtype=numpy.uint8)
-        self.prev_frame_time = time()
+            # the camera fell behind, the missed frames are not caught up
+            self.prev_frame_time = now
+
+    def _render_pattern(self, x: numpy.ndarray, y: numpy.ndarray, x0: float, y0: float) -> numpy.ndarray:
+        # the patterns are sums of separable profiles, so only the 1-D profiles are evaluated per pixel row
+        # and column
+        sigma = SIGMA
+        if self._pattern == "line":
+            return numpy.broadcast_to(line_profile(x, x0, sigma), (len(y), len(x))).copy()
+        img = numpy.outer(gauss_profile(y, y0, sigma), gauss_profile(x, x0, sigma))
+        if self._pattern == "perpendicular":
+            img += numpy.outer(gauss_profile(y, y0 + sigma/1.5, sigma), gauss_profile(x, x0, sigma))
+        elif self._pattern == "left":
+            img += numpy.outer(gauss_profile(y, y0 + sigma/1.5, sigma), gauss_profile(x, x0 + sigma/2, sigma))
+        elif self._pattern == "right":
+            img += numpy.outer(gauss_profile(y, y0 + sigma/1.5, sigma), gauss_profile(x, x0 - sigma/2, sigma))
         return img
 
+    def _get_pattern_peak(self, x0: float, y0: float) -> float:
+        key = (self._pattern, x0, y0)
+        if self._pattern_peak is None or self._pattern_peak[0] != key:
+            x = numpy.arange(0, self._sensor_resolution[0], PEAK_SEARCH_STEP, dtype=numpy.float32)
+            y = numpy.arange(0, self._sensor_resolution[1], PEAK_SEARCH_STEP, dtype=numpy.float32)
+            self._pattern_peak = (key, float(numpy.max(self._render_pattern(x, y, x0, y0))))
+        return self._pattern_peak[1]
+
+    def _get_profile(self, x0: float, y0: float) -> numpy.ndarray | None:
+        if self._pattern == "zero":
+            return None
+        key = (self._pattern, x0, y0, self._roi, self._binning)
+        if key != self._profile_key:
+            # a frame pixel is sampled in the centre of the binned sensor pixels of the ROI
+            roi_x, roi_y = self._roi[:2]
+            x = roi_x + self._binning * numpy.arange(0, self._resolution[0], dtype=numpy.float32) + \
+                (self._binning - 1) / 2.0
+            y = roi_y + self._binning * numpy.arange(0, self._resolution[1], dtype=numpy.float32) + \
+                (self._binning - 1) / 2.0
+            # the brightness is normalised by the peak on the whole sensor, so it does not depend on the ROI
+            profile = self._render_pattern(x, y, x0, y0)
+            profile *= numpy.float32(1.0 / self._get_pattern_peak(x0, y0))
+            self._profile = profile
+            self._profile_key = key
+        return self._profile
+
+    def _get_noise(self, height: int, width: int) -> numpy.ndarray:
+        size = height * width
+        if self._noise_pool is None or len(self._noise_pool) < size + NOISE_POOL_EXTRA:
+            self._noise_pool = self._rng.random(size + NOISE_POOL_EXTRA, dtype=numpy.float32)
+        offset = int(self._rng.integers(0, len(self._noise_pool) - size))
+        return self._noise_pool[offset:offset + size].reshape(height, width)
+
+    @property
+    def supports_roi(self) -> bool:
+        return True
+
+    @property
+    def supports_binning(self) -> bool:
+        return True
+
+    def set_roi(self, x: int, y: int, width: int, height: int) -> bool:
+        self._roi = self._align_roi(x, y, width, height)
+        self._resolution = (self._roi[2] // self._binning, self._roi[3] // self._binning)
+        return True
+
+    def set_binning(self, binning: int) -> bool:
+        if binning not in VIRTUAL_BINNING:
+            return False
+        self._binning = int(binning)
+        return self.set_roi(*self._roi)
+
     def open(self, camera_id: str | int | None = None) -> None:
         if camera_id is not None:
             self._id = camera_id
+            self._pattern = str(camera_id).split()[0]
         self.flag_opened = True
 
     def close(self):
@@ -94,11 +174,16 @@ class VirtualCamera(CameraBase):
     def is_opened(self):
         return self.flag_opened
 
+    @property
+    def supports_blocking_query(self) -> bool:
+        # query_frame waits for the frame time of the target frame rate
+        return True
+
     def start(self):
-        self.prev_frame_time = time()
+        self.prev_frame_time = perf_counter()
 
     def query_frame(self, *args, **kwargs):
-        img = self._get_stimulated_image(self.x0, self.y0, False)
+        img = self._get_stimulated_image(self.x0, self.y0)
         return img
 
 
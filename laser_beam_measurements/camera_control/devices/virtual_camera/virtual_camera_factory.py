@@ -12,6 +12,10 @@ from laser_beam_measurements.camera_control.camera_factory_base import CameraFac
 from .virtual_camera import VirtualCamera
 
 
+HIGH_BIT_DEPTH_SUFFIX = " {}-bit"
+LOAD_TEST_SUFFIX = " 1920x1080 200fps"
+
+
 class VirtualCameraFactory(CameraFactoryBase):
     camera_class = VirtualCamera
 
@@ -23,5 +27,33 @@ class VirtualCameraFactory(CameraFactoryBase):
                 "perpendicular",
                 "left",
                 "right",
-                "line"]
+                "line",
+                f"round{HIGH_BIT_DEPTH_SUFFIX.format(12)}",
+                f"round{HIGH_BIT_DEPTH_SUFFIX.format(16)}",
+                f"round{LOAD_TEST_SUFFIX}"]
         )
+
+    def create(self, camera_id=None, *args, **kwargs):
+        # the options follow the pattern name: "<N>-bit" for N-bit pixels, "<W>x<H>" for the resolution
+        # and "<F>fps" for the target frame rate, e.g. "round 12-bit 1920x1080 200fps"
+        if isinstance(camera_id, str):
+            for option in camera_id.split()[1:]:
+                kwargs.update(self._parse_option(option))
+        return super(VirtualCameraFactory, self).create(camera_id, *args, **kwargs)
+
+    @staticmethod
+    def _parse_option(option: str) -> dict:
+        try:
+            if option.endswith("-bit"):
+                bit_depth = int(option[:-len("-bit")])
+                if 8 <= bit_depth <= 16:
+                    return {"bit_depth": bit_depth}
+            elif option.endswith("fps"):
+                return {"fps": float(option[:-len("fps")])}
+            elif "x" in option:
+                width, height = (int(value) for value in option.split("x"))
+                if width > 0 and height > 0:
+                    return {"resolution": (width, height)}
+        except ValueError:
+            pass
+        return dict()
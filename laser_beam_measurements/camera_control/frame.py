@@ -0,0 +1,83 @@
+#
+# Project: laser_beam_measurements
+#
+# File: frame.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+
+import numpy
+from enum import StrEnum
+from time import monotonic_ns
+
+__all__ = ["Frame", "FrameField", "FRAME_INFO"]
+
+
+FRAME_INFO = "Frame"
+
+
+class FrameField(StrEnum):
+    TIMESTAMP = "Timestamp"
+    SEQUENCE = "Sequence"
+    CAMERA_ID = "Camera"
+    EXPOSURE = "Exposure"
+    GAIN = "Gain"
+    BIT_DEPTH = "Bit Depth"
+    OFFSET_X = "Offset X"
+    OFFSET_Y = "Offset Y"
+    BINNING = "Binning"
+
+
+class Frame:
+
+    __slots__ = ("image", "timestamp_ns", "sequence", "camera_id", "exposure", "gain", "bit_depth", "offset", "binning")
+
+    def __init__(
+            self,
+            image: numpy.ndarray,
+            timestamp_ns: int | None = None,
+            sequence: int = 0,
+            camera_id: str | int | None = None,
+            exposure: float | None = None,
+            gain: float | None = None,
+            bit_depth: int = 8,
+            offset: tuple[int, int] = (0, 0),
+            binning: int = 1):
+        self.image: numpy.ndarray = image
+        # monotonic clock, comparable with time.monotonic_ns() of the same process
+        self.timestamp_ns: int = monotonic_ns() if timestamp_ns is None else timestamp_ns
+        self.sequence: int = sequence
+        self.camera_id: str | int | None = camera_id
+        self.exposure: float | None = exposure
+        self.gain: float | None = gain
+        self.bit_depth: int = bit_depth
+        # the position of the frame on the sensor, a frame pixel covers binning x binning sensor pixels
+        self.offset: tuple[int, int] = offset
+        self.binning: int = binning
+
+    @property
+    def timestamp(self) -> float:
+        return self.timestamp_ns / 1e9
+
+    def info(self) -> dict[FrameField, object]:
+        info = {
+            FrameField.TIMESTAMP: self.timestamp,
+            FrameField.SEQUENCE: self.sequence,
+            FrameField.BIT_DEPTH: self.bit_depth,
+            FrameField.OFFSET_X: self.offset[0],
+            FrameField.OFFSET_Y: self.offset[1],
+            FrameField.BINNING: self.binning
+        }
+        if self.camera_id is not None:
+            info.update({FrameField.CAMERA_ID: self.camera_id})
+        if self.exposure is not None:
+            info.update({FrameField.EXPOSURE: self.exposure})
+        if self.gain is not None:
+            info.update({FrameField.GAIN: self.gain})
+        return info
+
+    def __repr__(self) -> str:
+        return f"Frame(sequence={self.sequence}, timestamp={self.timestamp:.6f}, shape={self.image.shape})"
@@ -0,0 +1,142 @@
+#
+# Project: laser_beam_measurements
+#
+# File: frame_pool.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+
+import numpy
+from PySide6.QtCore import QObject, QMutex, QMutexLocker, SIGNAL
+
+__all__ = ["FramePool", "retain_for_receivers"]
+
+
+DEFAULT_FRAME_POOL_SIZE = 8
+MAX_FRAME_POOL_FORMATS = 2
+
+# the holds of all pooled buffers are counted under one mutex, they are taken and returned in every thread
+_holds_mutex: QMutex = QMutex()
+# the pooled buffers by the id of the buffer, a view is found by its base
+_pooled_buffers: dict[int, "_PooledBuffer"] = dict()
+
+
+class _PooledBuffer:
+
+    __slots__ = ("array", "holds")
+
+    def __init__(self, array: numpy.ndarray):
+        self.array: numpy.ndarray = array
+        self.holds: int = 0
+
+
+def _find_pooled_buffer(image: numpy.ndarray | None) -> _PooledBuffer | None:
+    if not isinstance(image, numpy.ndarray):
+        return None
+    root = image
+    while isinstance(root.base, numpy.ndarray):
+        root = root.base
+    entry = _pooled_buffers.get(id(root), None)
+    if entry is None or entry.array is not root:
+        return None
+    return entry
+
+
+class FramePool:
+
+    def __init__(self, size: int = DEFAULT_FRAME_POOL_SIZE):
+        # The pool owns the buffers and counts the holds of every buffer explicitly. acquire gives the
+        # buffer with one hold to the caller, everybody who keeps the frame or a view of it after the
+        # call which gave it takes a hold with retain and returns it with release. A buffer is reused
+        # only when all holds are returned. A hold which is never returned only keeps its buffer out of
+        # the pool, the next frames are allocated then.
+        self._mutex: QMutex = QMutex()
+        self._size: int = max(int(size), 1)
+        self._buffers: dict[tuple[tuple[int, ...], numpy.dtype], list[_PooledBuffer]] = dict()
+        self._allocated_counter: int = 0
+        self._missed_counter: int = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def allocated(self) -> int:
+        with QMutexLocker(self._mutex):
+            return self._allocated_counter
+
+    @property
+    def missed(self) -> int:
+        with QMutexLocker(self._mutex):
+            return self._missed_counter
+
+    @property
+    def in_use(self) -> int:
+        with QMutexLocker(self._mutex), QMutexLocker(_holds_mutex):
+            return sum(1 for buffers in self._buffers.values() for entry in buffers if entry.holds > 0)
+
+    def acquire(self, shape: tuple[int, ...], dtype: numpy.dtype = numpy.uint8) -> numpy.ndarray:
+        key = (tuple(int(s) for s in shape), numpy.dtype(dtype))
+        with QMutexLocker(self._mutex):
+            buffers = self._buffers.pop(key, None)
+            if buffers is None:
+                buffers = list()
+                if len(self._buffers) >= MAX_FRAME_POOL_FORMATS:
+                    # the oldest format is forgotten, its buffers are freed when nobody refers to them
+                    self._forget(self._buffers.pop(next(iter(self._buffers))))
+            self._buffers[key] = buffers
+            with QMutexLocker(_holds_mutex):
+                for entry in buffers:
+                    if entry.holds == 0:
+                        entry.holds = 1
+                        return entry.array
+                if len(buffers) < self._size:
+                    entry = _PooledBuffer(numpy.empty(key[0], dtype=key[1]))
+                    entry.holds = 1
+                    buffers.append(entry)
+                    _pooled_buffers[id(entry.array)] = entry
+                    self._allocated_counter += 1
+                    return entry.array
+            # every buffer is still held, the frame is not pooled
+            self._missed_counter += 1
+        return numpy.empty(key[0], dtype=key[1])
+
+    @staticmethod
+    def retain(image: numpy.ndarray | None, count: int = 1) -> None:
+        # the arrays which are not pooled are ignored, so the holders do not have to know the source
+        if count <= 0:
+            return
+        with QMutexLocker(_holds_mutex):
+            entry = _find_pooled_buffer(image)
+            if entry is not None:
+                entry.holds += count
+
+    @staticmethod
+    def release(image: numpy.ndarray | None) -> None:
+        with QMutexLocker(_holds_mutex):
+            entry = _find_pooled_buffer(image)
+            if entry is not None and entry.holds > 0:
+                entry.holds -= 1
+
+    def clear(self) -> None:
+        with QMutexLocker(self._mutex):
+            for buffers in self._buffers.values():
+                self._forget(buffers)
+            self._buffers.clear()
+
+    @staticmethod
+    def _forget(buffers: list[_PooledBuffer]) -> None:
+        with QMutexLocker(_holds_mutex):
+            for entry in buffers:
+                _pooled_buffers.pop(id(entry.array), None)
+
+
+def retain_for_receivers(sender: QObject, signature: str, image: numpy.ndarray | None) -> None:
+    # takes one hold for every slot connected to the signal, the slot releases it when it does not
+    # keep the image any more. It is called right before the signal is emitted
+    if sender.signalsBlocked():
+        return
+    FramePool.retain(image, sender.receivers(SIGNAL(signature)))
@@ -0,0 +1,359 @@
+#
+# Project: laser_beam_measurements
+#
+# File: background_subtractor.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+import os
+import numpy
+import cv2
+from enum import StrEnum
+from PySide6.QtCore import Signal, Slot, QMutexLocker, QPointF, QSizeF, QSettings
+
+from .image_processor_base import ImageProcessorBase
+from .beam_finder import BeamState
+from laser_beam_measurements.camera_control.frame import FRAME_INFO, FrameField
+from laser_beam_measurements.camera_control.frame_pool import FramePool
+from laser_beam_measurements.utils.settings_bool_reader import read_boolean_value
+
+
+class BackgroundSubtractorParameters(StrEnum):
+    ACTIVE = "active"
+    DARK_FRAME_COUNT = "dark frame count"
+    RUNNING_BACKGROUND = "running background"
+    RUNNING_BACKGROUND_RATE = "running background rate"
+    ROI_MARGIN = "roi margin"
+    DARK_FRAME_FILE = "dark frame file"
+
+
+DEFAULT_DARK_FRAME_COUNT = 16
+DEFAULT_RUNNING_BACKGROUND_RATE = 0.05
+# the beam ROI is enlarged by this factor before it is excluded from the running background
+DEFAULT_ROI_MARGIN = 1.5
+DEFAULT_DARK_FRAME_FILE = "dark_frame.npz"
+OUTPUT_POOL_SIZE = 4
+# the arrays of the dark frame file, the frame is stored with its camera readout and frame type
+DARK_FRAME_KEY = "dark_frame"
+DARK_FRAME_READOUT_KEYS = ("offset_x", "offset_y", "binning")
+DARK_FRAME_DTYPE_KEY = "dtype"
+
+_CV_DEPTHS: dict[numpy.dtype, int] = {
+    numpy.dtype(numpy.uint8): cv2.CV_8U,
+    numpy.dtype(numpy.uint16): cv2.CV_16U,
+    numpy.dtype(numpy.float32): cv2.CV_32F
+}
+
+
+class BackgroundSubtractor(ImageProcessorBase):
+
+    signal_dark_frame_captured = Signal()
+    signal_dark_frame_capture_progress = Signal(int, int)
+
+    def __init__(self, *args, **kwargs):
+        super(BackgroundSubtractor, self).__init__(*args, **kwargs)
+        self._flag_active: bool = False
+        self._flag_running_background: bool = False
+        self._dark_frame_count: int = DEFAULT_DARK_FRAME_COUNT
+        self._running_background_rate: float = DEFAULT_RUNNING_BACKGROUND_RATE
+        self._roi_margin: float = DEFAULT_ROI_MARGIN
+        self._dark_frame_file: str = DEFAULT_DARK_FRAME_FILE
+
+        self._accumulator: numpy.ndarray | None = None
+        self._captured_frames: int = 0
+        self._frames_to_capture: int = 0
+        # the averaged dark frame and its copy in the frame type for the saturating subtraction
+        self._dark_frame: numpy.ndarray | None = None
+        self._dark_frame_native: numpy.ndarray | None = None
+        # offset x, offset y and binning of the camera readout of the dark frame
+        self._dark_frame_readout: tuple[int, int, int] = (0, 0, 1)
+        self._background: numpy.ndarray | None = None
+        self._background_readout: tuple[int, int, int] = (0, 0, 1)
+        self._background_mask: numpy.ndarray | None = None
+        self._masked_rect: tuple[int, int, int, int] | None = None
+        self._beam_rect: tuple[int, int, int, int] | None = None
+        # the camera frames are shared with the display, so the result is written into reused buffers
+        self._output_pool: FramePool = FramePool(OUTPUT_POOL_SIZE)
+
+    @property
+    def dark_frame(self) -> numpy.ndarray | None:
+        with QMutexLocker(self._mutex):
+            return self._dark_frame
+
+    @property
+    def is_capturing(self) -> bool:
+        with QMutexLocker(self._mutex):
+            return self._frames_to_capture > 0
+
+    def process(self, image: numpy.ndarray) -> bool | None:
+        with QMutexLocker(self._mutex):
+            if self._frames_to_capture > 0:
+                self._accumulate_dark_frame(image)
+            if not self._flag_active or image.ndim != 2:
+                self._processed_image = image
+                return True
+            if self._flag_running_background:
+                self._processed_image = self._subtract_running_background(image)
+            else:
+                dark_frame = self._get_dark_frame_for(image)
+                if dark_frame is not None:
+                    output = self._output_pool.acquire(image.shape, image.dtype)
+                    self._processed_image = cv2.subtract(image, dark_frame, dst=output)
+                    # the result is held by the processor base from now on
+                    FramePool.release(output)
+                else:
+                    self._processed_image = image
+        return True
+
+    def _get_readout(self) -> tuple[int, int, int]:
+        frame_info = self._extra_context.get(FRAME_INFO, None)
+        if frame_info is None:
+            return 0, 0, 1
+        return (frame_info.get(FrameField.OFFSET_X, 0), frame_info.get(FrameField.OFFSET_Y, 0),
+                frame_info.get(FrameField.BINNING, 1))
+
+    def _get_dark_frame_for(self, image: numpy.ndarray, native: bool = True) -> numpy.ndarray | None:
+        if self._dark_frame_native is None:
+            return None
+        if self._dark_frame_native.dtype != image.dtype:
+            self._dark_frame_native = self._to_frame_type(self._dark_frame, image.dtype)
+        offset_x, offset_y, binning = self._get_readout()
+        dark_x, dark_y, dark_binning = self._dark_frame_readout
+        if binning != dark_binning:
+            return None
+        # the frame of a camera ROI is cut out of the dark frame of a larger readout
+        x = (offset_x - dark_x) // binning
+        y = (offset_y - dark_y) // binning
+        h, w = image.shape
+        if x < 0 or y < 0 or y + h > self._dark_frame_native.shape[0] or x + w > self._dark_frame_native.shape[1]:
+            return None
+        return (self._dark_frame_native if native else self._dark_frame)[y:y + h, x:x + w]
+
+    def _accumulate_dark_frame(self, image: numpy.ndarray) -> None:
+        if image.ndim != 2:
+            return
+        if self._accumulator is None or self._accumulator.shape != image.shape:
+            self._accumulator = numpy.zeros(image.shape, dtype=numpy.float32)
+            self._captured_frames = 0
+        cv2.accumulate(image, self._accumulator)
+        self._captured_frames += 1
+        self._frames_to_capture -= 1
+        self.signal_dark_frame_capture_progress.emit(self._captured_frames, self._captured_frames + self._frames_to_capture)
+        if self._frames_to_capture > 0:
+            return
+        numpy.multiply(self._accumulator, 1.0 / self._captured_frames, out=self._accumulator)
+        self._set_dark_frame(self._accumulator, image.dtype, self._get_readout())
+        self._accumulator = None
+        self._save_dark_frame()
+        self.signal_dark_frame_captured.emit()
+
+    @staticmethod
+    def _to_frame_type(frame: numpy.ndarray, dtype: numpy.dtype) -> numpy.ndarray:
+        if numpy.dtype(dtype).kind == 'f':
+            return frame.astype(dtype)
+        info = numpy.iinfo(dtype)
+        return numpy.clip(numpy.rint(frame), info.min, info.max).astype(dtype)
+
+    def _set_dark_frame(
+            self,
+            dark_frame: numpy.ndarray | None,
+            dtype: numpy.dtype = numpy.uint8,
+            readout: tuple[int, int, int] = (0, 0, 1)) -> None:
+        self._dark_frame = dark_frame
+        self._dark_frame_readout = readout
+        self._dark_frame_native = None if dark_frame is None else self._to_frame_type(dark_frame, dtype)
+        # the running background starts again from the new dark frame
+        self._background = None
+
+    def _subtract_running_background(self, image: numpy.ndarray) -> numpy.ndarray:
+        readout = self._get_readout()
+        if self._background is None or self._background.shape != image.shape or self._background_readout != readout:
+            dark_frame = self._get_dark_frame_for(image, native=False)
+            if dark_frame is not None:
+                self._background = dark_frame.copy()
+            else:
+                self._background = image.astype(numpy.float32)
+            self._background_readout = readout
+            # the beam rectangle is in the coordinates of the previous readout, the finder sends a new one
+            self._background_mask = None
+            self._masked_rect = None
+            self._beam_rect = None
+        self._update_background_mask(image.shape)
+        # the pixels of the beam do not take part in the background model
+        cv2.accumulateWeighted(image, self._background, self._running_background_rate, mask=self._background_mask)
+        output = self._output_pool.acquire(image.shape, image.dtype)
+        # the float background is rounded and the result saturated by OpenCV in the same pass
+        cv2.subtract(image, self._background, dst=output, dtype=_CV_DEPTHS.get(image.dtype, -1))
+        FramePool.release(output)
+        return output
+
+    def _update_background_mask(self, shape: tuple[int, int]) -> None:
+        if self._background_mask is None or self._background_mask.shape != shape:
+            self._background_mask = numpy.full(shape, 255, dtype=numpy.uint8)
+            self._masked_rect = None
+        if self._beam_rect == self._masked_rect:
+            return
+        # only the previous and the new beam rectangles are redrawn
+        if self._masked_rect is not None:
+            x1, y1, x2, y2 = self._masked_rect
+            self._background_mask[y1:y2, x1:x2] = 255
+        if self._beam_rect is not None:
+            x1, y1, x2, y2 = self._beam_rect
+            self._background_mask[y1:y2, x1:x2] = 0
+        self._masked_rect = self._beam_rect
+
+    @Slot(dict)
+    def slot_set_beam_state(self, state: dict) -> None:
+        pos = state.get(BeamState.POS, None)
+        size = state.get(BeamState.SIZE, None)
+        if isinstance(pos, QPointF):
+            pos = (pos.x(), pos.y())
+        if isinstance(size, QSizeF):
+            size = (size.width(), size.height())
+        if pos is None or size is None:
+            return
+        # the rotated ROI is covered by the square of its diagonal
+        half_size = 0.5 * self._roi_margin * float(numpy.hypot(size[0], size[1]))
+        with QMutexLocker(self._mutex):
+            self._beam_rect = (max(int(pos[0] - half_size), 0), max(int(pos[1] - half_size), 0),
+                               max(int(pos[0] + half_size) + 1, 0), max(int(pos[1] + half_size) + 1, 0))
+
+    @Slot()
+    @Slot(int)
+    def start_dark_frame_capture(self, count: int | None = None) -> None:
+        # the next frames are averaged into the dark frame, the beam has to be blocked meanwhile
+        with QMutexLocker(self._mutex):
+            if count is not None and count > 0:
+                self._dark_frame_count = int(count)
+            self._accumulator = None
+            self._captured_frames = 0
+            self._frames_to_capture = self._dark_frame_count
+
+    @Slot()
+    def clear_dark_frame(self) -> None:
+        with QMutexLocker(self._mutex):
+            self._frames_to_capture = 0
+            self._accumulator = None
+            self._set_dark_frame(None)
+
+    @Slot(bool)
+    def set_active(self, value: bool) -> None:
+        self._set_parameter_value(BackgroundSubtractorParameters.ACTIVE, value)
+
+    @Slot(bool)
+    def set_running_background(self, value: bool) -> None:
+        self._set_parameter_value(BackgroundSubtractorParameters.RUNNING_BACKGROUND, value)
+
+    def save_dark_frame(self, file_name: str) -> bool:
+        with QMutexLocker(self._mutex):
+            if self._dark_frame is None:
+                return False
+            self._write_dark_frame(file_name)
+            return True
+
+    def load_dark_frame(self, file_name: str) -> bool:
+        if not os.path.isfile(file_name):
+            return False
+        try:
+            with numpy.load(file_name) as data:
+                # the dark frame is only valid for the readout it was captured with
+                dark_frame = data[DARK_FRAME_KEY]
+                readout = tuple(int(data[key]) for key in DARK_FRAME_READOUT_KEYS)
+                dtype = numpy.dtype(str(data[DARK_FRAME_DTYPE_KEY]))
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return False
+        if dark_frame.ndim != 2 or readout[2] < 1 or dtype not in _CV_DEPTHS:
+            return False
+        with QMutexLocker(self._mutex):
+            self._set_dark_frame(dark_frame.astype(numpy.float32, copy=False), dtype, readout)
+        return True
+
+    def _save_dark_frame(self) -> None:
+        if self._dark_frame_file and self._dark_frame is not None:
+            try:
+                self._write_dark_frame(self._dark_frame_file)
+            except OSError:
+                pass
+
+    def _write_dark_frame(self, file_name: str) -> None:
+        offset_x, offset_y, binning = self._dark_frame_readout
+        # the file is written under the given name, numpy.savez would append the extension to a path
+        with open(file_name, "wb") as file:
+            numpy.savez(file, **{
+                DARK_FRAME_KEY: self._dark_frame,
+                DARK_FRAME_READOUT_KEYS[0]: offset_x,
+                DARK_FRAME_READOUT_KEYS[1]: offset_y,
+                DARK_FRAME_READOUT_KEYS[2]: binning,
+                DARK_FRAME_DTYPE_KEY: self._dark_frame_native.dtype.str
+            })
+
+    def _set_parameter_value(self, parameter: BackgroundSubtractorParameters | str, value: object) -> None:
+        with QMutexLocker(self._mutex):
+            if parameter == BackgroundSubtractorParameters.ACTIVE:
+                if isinstance(value, bool):
+                    self._flag_active = value
+            elif parameter == BackgroundSubtractorParameters.RUNNING_BACKGROUND:
+                if isinstance(value, bool):
+                    self._flag_running_background = value
+                    self._background = None
+            elif parameter == BackgroundSubtractorParameters.DARK_FRAME_COUNT:
+                if isinstance(value, int) and value > 0:
+                    self._dark_frame_count = value
+            elif parameter == BackgroundSubtractorParameters.RUNNING_BACKGROUND_RATE:
+                if isinstance(value, (float, int)) and 0.0 < value <= 1.0:
+                    self._running_background_rate = float(value)
+            elif parameter == BackgroundSubtractorParameters.ROI_MARGIN:
+                if isinstance(value, (float, int)) and value >= 1.0:
+                    self._roi_margin = float(value)
+            elif parameter == BackgroundSubtractorParameters.DARK_FRAME_FILE:
+                if isinstance(value, str):
+                    self._dark_frame_file = value
+
+    def get_parameter_value(self, parameter: BackgroundSubtractorParameters | str) -> object | None:
+        with QMutexLocker(self._mutex):
+            if parameter == BackgroundSubtractorParameters.ACTIVE:
+                return self._flag_active
+            elif parameter == BackgroundSubtractorParameters.RUNNING_BACKGROUND:
+                return self._flag_running_background
+            elif parameter == BackgroundSubtractorParameters.DARK_FRAME_COUNT:
+                return self._dark_frame_count
+            elif parameter == BackgroundSubtractorParameters.RUNNING_BACKGROUND_RATE:
+                return self._running_background_rate
+            elif parameter == BackgroundSubtractorParameters.ROI_MARGIN:
+                return self._roi_margin
+            elif parameter == BackgroundSubtractorParameters.DARK_FRAME_FILE:
+                return self._dark_frame_file
+        return None
+
+    def save_settings(self, settings: QSettings) -> None:
+        settings.beginGroup("BackgroundSubtractor")
+        settings.setValue("Active", self._flag_active)
+        settings.setValue("RunningBackground", self._flag_running_background)
+        settings.setValue("DarkFrameCount", self._dark_frame_count)
+        settings.setValue("RunningBackgroundRate", self._running_background_rate)
+        settings.setValue("RoiMargin", self._roi_margin)
+        settings.setValue("DarkFrameFile", self._dark_frame_file)
+        settings.endGroup()
+
+    def load_settings(self, settings: QSettings) -> None:
+        if not settings.contains("BackgroundSubtractor/Active"):
+            return
+        settings.beginGroup("BackgroundSubtractor")
+        self._flag_active = read_boolean_value(settings, "Active", self._flag_active)
+        self._flag_running_background = read_boolean_value(settings, "RunningBackground", self._flag_running_background)
+        if settings.contains("DarkFrameCount"):
+            self._dark_frame_count = max(int(settings.value("DarkFrameCount")), 1)
+        if settings.contains("RunningBackgroundRate"):
+            rate = float(settings.value("RunningBackgroundRate"))
+            if 0.0 < rate <= 1.0:
+                self._running_background_rate = rate
+        if settings.contains("RoiMargin"):
+            self._roi_margin = max(float(settings.value("RoiMargin")), 1.0)
+        if settings.contains("DarkFrameFile"):
+            self._dark_frame_file = str(settings.value("DarkFrameFile"))
+        settings.endGroup()
+        if self._dark_frame_file:
+            self.load_dark_frame(self._dark_frame_file)
@@ -10,6 +10,8 @@
 
 from .image_processor_pipeline import ImageProcessorPipeline, ImageProcessorBase
 
+from .background_subtractor import BackgroundSubtractor
+from .frame_averager import FrameAverager
 from .beam_finder import BeamFinder
 from .beam_profiler import BeamProfiler
 
@@ -19,17 +21,36 @@ class BeamAnalyzer(ImageProcessorPipeline):
     def __init__(self, *args, **kwargs):
         super(BeamAnalyzer, self).__init__(*args, **kwargs)
 
+        subtractor = BackgroundSubtractor()
+        averager = FrameAverager()
         finder = BeamFinder()
         profiler = BeamProfiler()
 
+        self.add_processor(subtractor)
+        self.add_processor(averager)
         self.add_processor(finder)
         self.add_processor(profiler)
         self._enable_add_processors = False
+        # the running background skips the found beam
+        finder.signal_beam_state_updated.connect(subtractor.slot_set_beam_state)
+
+        self._background_subtractor: BackgroundSubtractor = subtractor
+        self._frame_averager: FrameAverager = averager
+        self._beam_finder: BeamFinder = finder
+        self._beam_profiler: BeamProfiler = profiler
+
+    @property
+    def background_subtractor(self) -> ImageProcessorBase:
+        return self._background_subtractor
+
+    @property
+    def frame_averager(self) -> ImageProcessorBase:
+        return self._frame_averager
 
     @property
     def beam_finder(self) -> ImageProcessorBase:
-        return self._first_processor
+        return self._beam_finder
 
     @property
     def beam_profiler(self) -> ImageProcessorBase:
-        return self._last_processor
+        return self._beam_profiler
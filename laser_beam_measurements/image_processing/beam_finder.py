@@ -12,14 +12,17 @@ import numpy
 
 from .image_processor_base import ImageProcessorBase
 
-from .utils.sub_image import rotate_sub_image
+from .utils.sub_image import rotate_sub_image, SubImageBufferPool
 from .utils.denoising import threshold
-from .utils.beam_width import width_by_moments
+from .utils.beam_width import width_by_moments, width_by_moments_iso
+from .utils.tracking import AlphaBetaFilter
 from enum import StrEnum
 import cv2
 from math import pi
 from PySide6.QtCore import Signal, Slot, QMutexLocker, QPointF, QSizeF, QSettings
 from laser_beam_measurements.utils.settings_bool_reader import read_boolean_value
+from laser_beam_measurements.camera_control.frame import FRAME_INFO, FrameField
+from laser_beam_measurements.camera_control.pixel_format import max_pixel_value
 
 
 class BeamFinderParameters(StrEnum):
@@ -32,6 +35,32 @@ class BeamFinderParameters(StrEnum):
     ROTATION_ENABLE = "rotation enable"
     DELETE_NOISE_ENABLE = "delete noise"
     MANUAL_ROTATION_ENABLE = "manual rotation"
+    ISO_MOMENTS_ENABLE = "iso moments"
+    PYRAMID_DEPTH = "pyramid depth"
+    TRACKING_ENABLE = "tracking"
+    TRACKING_SMOOTHING = "tracking smoothing"
+    CAMERA_ROI_ENABLE = "camera roi"
+    CAMERA_ROI_MARGIN = "camera roi margin"
+
+
+MAX_PYRAMID_DEPTH = 3
+MIN_PYRAMID_IMAGE_SIZE = 16
+PYRAMID_REFINE_WINDOW_FACTOR = 3.0
+TRACKING_WINDOW_FACTOR = 4.0
+TRACKING_MIN_WINDOW_FACTOR = 1.5
+# The camera ROI is the beam box enlarged by the margin. It is requested again when the beam box enlarged
+# by the keep factor leaves the ROI or when the ROI grew larger than the shrink factor times the wanted one
+DEFAULT_CAMERA_ROI_MARGIN = 1.5
+CAMERA_ROI_KEEP_FACTOR = 1.1
+CAMERA_ROI_SHRINK_FACTOR = 2.0
+CAMERA_ROI_MIN_SIZE = 64
+# frames grabbed before the new ROI was applied are not checked
+CAMERA_ROI_SETTLE_FRAMES = 3
+
+
+class FinderStage(StrEnum):
+    FIND = "find"
+    CROP = "crop"
 
 
 class BeamState(StrEnum):
@@ -43,6 +72,9 @@ class BeamState(StrEnum):
 class BeamFinder(ImageProcessorBase):
 
     signal_beam_state_updated = Signal(dict)
+    # x, y, width and height in sensor pixels
+    signal_camera_roi_requested = Signal(int, int, int, int)
+    signal_camera_roi_reset = Signal()
 
     def __init__(self, *args, **kwargs):
         super(BeamFinder, self).__init__(*args, **kwargs)
@@ -52,18 +84,38 @@ class BeamFinder(ImageProcessorBase):
         self._rotation_angle: float = 0.0
         self._scale_factor: float = 1.0
         self._noise_level: float = 0.0
+        # the noise level is set in 8-bit units and scaled to the bit depth of the frame
+        self._noise_threshold: float = 0.0
 
         self._flag_find_auto: bool = True
         self._flag_delete_noise: bool = False
         self._flag_rotation_enable: bool = False
         self._flag_manual_rotation: bool = False
+        self._flag_iso_moments: bool = False
+        self._pyramid_depth: int = 0
+        self._flag_tracking: bool = False
+        self._tracking_smoothing: float = 1.0
+        self._tracked_beam: tuple[float, float, float, float, float] | None = None
+        self._position_filter: AlphaBetaFilter = AlphaBetaFilter(self._tracking_smoothing)
+        self._shape_filter: AlphaBetaFilter = AlphaBetaFilter(self._tracking_smoothing, 0.0)
+        self._buffer_pool: SubImageBufferPool = SubImageBufferPool()
+        self._flag_camera_roi: bool = False
+        self._camera_roi_margin: float = DEFAULT_CAMERA_ROI_MARGIN
+        self._camera_roi: tuple[int, int, int, int] | None = None
+        self._camera_roi_settle: int = 0
+        # offset x, offset y and binning of the last frame
+        self._readout: tuple[int, int, int] = (0, 0, 1)
 
         self._beam_state = dict()
 
     def process(self, image: numpy.ndarray) -> bool | None:
+        self._noise_threshold = self._noise_level * max_pixel_value(self._get_bit_depth(image)) / 255.0
+        self._update_readout()
         self._processed_image = self.roi_find(image)
         if self._flag_find_auto:
             self.signal_beam_state_updated.emit(self._beam_state)
+            if self._flag_camera_roi:
+                self._update_camera_roi(image)
         if self._processed_image is not None:
             return True
         return False
@@ -100,9 +152,8 @@ class BeamFinder(ImageProcessorBase):
             if _image.shape[0] == 0 or _image.shape[1] == 0:
                 # return numpy.array(_image, copy=True)
                 return None
-            if self._flag_delete_noise:
-                _image = threshold(_image, self._noise_level)
-            cx, cy, dx, dy, angle = width_by_moments(_image, self._flag_rotation_enable)
+            with self._latency.measure(f"{self._name}: {FinderStage.FIND}"):
+                cx, cy, dx, dy, angle = self._find_beam(_image)
             self._position = (cx, cy)
             scaled_dx = 2 * self._scale_factor * dx
             scaled_dy = 2 * self._scale_factor * dy
@@ -125,7 +176,154 @@ class BeamFinder(ImageProcessorBase):
         center = self._position
         if not self._flag_rotation_enable:
             self._rotation_angle = 0.0
-        return rotate_sub_image(image, center, w, h, self._rotation_angle)
+        with self._latency.measure(f"{self._name}: {FinderStage.CROP}"):
+            return rotate_sub_image(image, center, w, h, self._rotation_angle, copy=False, pool=self._buffer_pool)
+
+    def _update_readout(self) -> None:
+        frame_info = self._extra_context.get(FRAME_INFO, None)
+        if frame_info is None:
+            return
+        readout = (frame_info.get(FrameField.OFFSET_X, 0), frame_info.get(FrameField.OFFSET_Y, 0),
+                   frame_info.get(FrameField.BINNING, 1))
+        if readout != self._readout:
+            # the frame coordinates moved with the camera ROI
+            self._readout = readout
+            self._camera_roi_settle = 0
+            self.reset_tracking()
+
+    def _update_camera_roi(self, image: numpy.ndarray) -> None:
+        if self._camera_roi_settle > 0:
+            self._camera_roi_settle -= 1
+            return
+        w, h = self._shape
+        if w <= 0 or h <= 0:
+            # the beam is lost, the whole sensor is read out again
+            if self._camera_roi is not None:
+                self._request_camera_roi(None)
+            return
+        offset_x, offset_y, binning = self._readout
+        if self._flag_rotation_enable:
+            half_x = half_y = 0.5 * binning * float(numpy.hypot(w, h))
+        else:
+            half_x, half_y = 0.5 * binning * w, 0.5 * binning * h
+        cx = offset_x + binning * self._position[0]
+        cy = offset_y + binning * self._position[1]
+        x1, y1 = offset_x, offset_y
+        x2, y2 = offset_x + binning * image.shape[1], offset_y + binning * image.shape[0]
+        keep_x, keep_y = CAMERA_ROI_KEEP_FACTOR * half_x, CAMERA_ROI_KEEP_FACTOR * half_y
+        # a side of the frame at a sensor edge always holds the beam, the right and bottom sensor edges
+        # are known from the clipped request
+        requested = self._camera_roi
+        inside = ((x1 == 0 or cx - keep_x >= x1) and (y1 == 0 or cy - keep_y >= y1) and
+                  (cx + keep_x <= x2 or (requested is not None and requested[0] + requested[2] > x2)) and
+                  (cy + keep_y <= y2 or (requested is not None and requested[1] + requested[3] > y2)))
+        wanted_x = max(self._camera_roi_margin * half_x, CAMERA_ROI_MIN_SIZE / 2)
+        wanted_y = max(self._camera_roi_margin * half_y, CAMERA_ROI_MIN_SIZE / 2)
+        oversized = x2 - x1 > CAMERA_ROI_SHRINK_FACTOR * 2 * wanted_x or \
+            y2 - y1 > CAMERA_ROI_SHRINK_FACTOR * 2 * wanted_y
+        if inside and not oversized:
+            return
+        self._request_camera_roi((int(cx - wanted_x), int(cy - wanted_y), int(2 * wanted_x), int(2 * wanted_y)))
+
+    def _request_camera_roi(self, roi: tuple[int, int, int, int] | None) -> None:
+        self._camera_roi = roi
+        self._camera_roi_settle = CAMERA_ROI_SETTLE_FRAMES
+        if roi is None:
+            self.signal_camera_roi_reset.emit()
+        else:
+            self.signal_camera_roi_requested.emit(*roi)
+
+    def _get_bit_depth(self, image: numpy.ndarray) -> int:
+        frame_info = self._extra_context.get(FRAME_INFO, None)
+        if frame_info is not None and FrameField.BIT_DEPTH in frame_info:
+            return frame_info[FrameField.BIT_DEPTH]
+        return 8 * image.dtype.itemsize if image.dtype.kind == 'u' else 8
+
+    def _measure_beam(self, image: numpy.ndarray) -> tuple[float, float, float, float, float]:
+        if self._flag_delete_noise:
+            image = threshold(image, self._noise_threshold)
+        if self._flag_iso_moments:
+            return width_by_moments_iso(image, self._flag_rotation_enable)
+        return width_by_moments(image, self._flag_rotation_enable)
+
+    def _measure_beam_in_window(
+            self,
+            image: numpy.ndarray,
+            cx: float,
+            cy: float,
+            half_size: float) -> tuple[tuple[float, float, float, float, float], tuple[int, int, int, int]] | None:
+        x1 = max(int(cx - half_size), 0)
+        y1 = max(int(cy - half_size), 0)
+        x2 = min(int(cx + half_size) + 1, image.shape[1])
+        y2 = min(int(cy + half_size) + 1, image.shape[0])
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+        cx, cy, dx, dy, angle = self._measure_beam(image[y1:y2, x1:x2])
+        return (cx + x1, cy + y1, dx, dy, angle), (x1, y1, x2, y2)
+
+    def _search_beam(self, image: numpy.ndarray) -> tuple[float, float, float, float, float]:
+        small_image = image
+        for _ in range(self._pyramid_depth):
+            if min(small_image.shape) < 2 * MIN_PYRAMID_IMAGE_SIZE:
+                break
+            small_image = cv2.pyrDown(small_image)
+        if small_image is image:
+            return self._measure_beam(image)
+
+        scale_x = image.shape[1] / small_image.shape[1]
+        scale_y = image.shape[0] / small_image.shape[0]
+        cx, cy, dx, dy, _ = self._measure_beam(small_image)
+        if dx == 0.0 or dy == 0.0:
+            return self._measure_beam(image)
+        half_size = PYRAMID_REFINE_WINDOW_FACTOR * max(dx * scale_x, dy * scale_y) / 2
+        measured = self._measure_beam_in_window(image, cx * scale_x, cy * scale_y, half_size)
+        if measured is None:
+            return self._measure_beam(image)
+        return measured[0]
+
+    def _track_beam(self, image: numpy.ndarray) -> tuple[float, float, float, float, float] | None:
+        cx, cy, dx, dy, _ = self._tracked_beam
+        half_size = TRACKING_WINDOW_FACTOR * max(dx, dy) / 2
+        measured = self._measure_beam_in_window(image, cx, cy, half_size)
+        if measured is None:
+            return None
+        (cx, cy, dx, dy, angle), (x1, y1, x2, y2) = measured
+        if dx == 0.0 or dy == 0.0:
+            return None
+        # the beam is lost if it grew beyond the window or its D4sigma circle reaches a window edge
+        # which is not an image edge
+        radius = max(dx, dy) / 2
+        if TRACKING_MIN_WINDOW_FACTOR * radius > half_size:
+            return None
+        if (x1 > 0 and cx - radius < x1) or (y1 > 0 and cy - radius < y1):
+            return None
+        if (x2 < image.shape[1] and cx + radius > x2) or (y2 < image.shape[0] and cy + radius > y2):
+            return None
+        return cx, cy, dx, dy, angle
+
+    def _find_beam(self, image: numpy.ndarray) -> tuple[float, float, float, float, float]:
+        if not self._flag_tracking:
+            return self._search_beam(image)
+        measured = None
+        if self._tracked_beam is not None:
+            measured = self._track_beam(image)
+        if measured is None:
+            measured = self._search_beam(image)
+            self._position_filter.reset()
+            self._shape_filter.reset()
+        cx, cy, dx, dy, angle = measured
+        if dx == 0.0 or dy == 0.0:
+            self._tracked_beam = None
+            return measured
+        self._tracked_beam = measured
+        cx, cy = self._position_filter.update((cx, cy))
+        dx, dy, angle = self._shape_filter.update((dx, dy, angle))
+        return float(cx), float(cy), float(dx), float(dy), float(angle)
+
+    def reset_tracking(self) -> None:
+        self._tracked_beam = None
+        self._position_filter.reset()
+        self._shape_filter.reset()
 
     def _set_parameter_value(self, parameter: BeamFinderParameters | str, value: object) -> None:
         with QMutexLocker(self._mutex):
@@ -147,6 +345,7 @@ class BeamFinder(ImageProcessorBase):
             elif parameter == BeamFinderParameters.FIND_AUTO:
                 if isinstance(value, bool):
                     self._flag_find_auto = value
+                    self.reset_tracking()
             elif parameter == BeamFinderParameters.ROTATION_ENABLE:
                 if isinstance(value, bool):
                     self._flag_rotation_enable = value
@@ -156,6 +355,27 @@ class BeamFinder(ImageProcessorBase):
             elif parameter == BeamFinderParameters.MANUAL_ROTATION_ENABLE:
                 if isinstance(value, bool):
                     self._flag_manual_rotation = value
+            elif parameter == BeamFinderParameters.ISO_MOMENTS_ENABLE:
+                if isinstance(value, bool):
+                    self._flag_iso_moments = value
+            elif parameter == BeamFinderParameters.PYRAMID_DEPTH:
+                if isinstance(value, int):
+                    self._pyramid_depth = min(max(value, 0), MAX_PYRAMID_DEPTH)
+            elif parameter == BeamFinderParameters.TRACKING_ENABLE:
+                if isinstance(value, bool):
+                    self._flag_tracking = value
+                    self.reset_tracking()
+            elif parameter == BeamFinderParameters.TRACKING_SMOOTHING:
+                if isinstance(value, (float, int)) and 0.0 < value <= 1.0:
+                    self._set_tracking_smoothing(value)
+            elif parameter == BeamFinderParameters.CAMERA_ROI_ENABLE:
+                if isinstance(value, bool):
+                    self._flag_camera_roi = value
+                    if not value and self._camera_roi is not None:
+                        self._request_camera_roi(None)
+            elif parameter == BeamFinderParameters.CAMERA_ROI_MARGIN:
+                if isinstance(value, (float, int)) and value > CAMERA_ROI_KEEP_FACTOR:
+                    self._camera_roi_margin = float(value)
 
     def get_parameter_value(self, parameter: BeamFinderParameters | str) -> object | None:
         with QMutexLocker(self._mutex):
@@ -177,9 +397,34 @@ class BeamFinder(ImageProcessorBase):
                 return self._flag_delete_noise
             elif parameter == BeamFinderParameters.MANUAL_ROTATION_ENABLE:
                 return self._flag_manual_rotation
+            elif parameter == BeamFinderParameters.ISO_MOMENTS_ENABLE:
+                return self._flag_iso_moments
+            elif parameter == BeamFinderParameters.PYRAMID_DEPTH:
+                return self._pyramid_depth
+            elif parameter == BeamFinderParameters.TRACKING_ENABLE:
+                return self._flag_tracking
+            elif parameter == BeamFinderParameters.TRACKING_SMOOTHING:
+                return self._tracking_smoothing
+            elif parameter == BeamFinderParameters.CAMERA_ROI_ENABLE:
+                return self._flag_camera_roi
+            elif parameter == BeamFinderParameters.CAMERA_ROI_MARGIN:
+                return self._camera_roi_margin
             else:
                 return None
 
+    def _set_tracking_smoothing(self, value: float) -> None:
+        self._tracking_smoothing = float(value)
+        self._position_filter.set_gains(self._tracking_smoothing)
+        self._shape_filter.set_gains(self._tracking_smoothing, 0.0)
+        self.reset_tracking()
+
+    def _set_init_parameters(self, parameters: dict) -> None:
+        # a new camera reads out the whole sensor
+        with QMutexLocker(self._mutex):
+            self._camera_roi = None
+            self._camera_roi_settle = 0
+            self._readout = (0, 0, 1)
+
     def collect_context_for_transmission(self) -> dict:
         return {
             BeamState.ANGLE: self._rotation_angle,
@@ -194,6 +439,12 @@ class BeamFinder(ImageProcessorBase):
         settings.setValue("EnabledRotation", self._flag_rotation_enable)
         settings.setValue("ManualRotation", self._flag_manual_rotation)
         settings.setValue("DeleteNoise", self._flag_delete_noise)
+        settings.setValue("IsoMoments", self._flag_iso_moments)
+        settings.setValue("PyramidDepth", self._pyramid_depth)
+        settings.setValue("Tracking", self._flag_tracking)
+        settings.setValue("TrackingSmoothing", self._tracking_smoothing)
+        settings.setValue("CameraRoi", self._flag_camera_roi)
+        settings.setValue("CameraRoiMargin", self._camera_roi_margin)
         if self._flag_delete_noise:
             settings.setValue("NoiseLevel", self._noise_level)
         if not self._flag_find_auto:
@@ -214,6 +465,19 @@ class BeamFinder(ImageProcessorBase):
         self._flag_rotation_enable = read_boolean_value(settings, "EnabledRotation", self._flag_rotation_enable)
         self._flag_manual_rotation = read_boolean_value(settings, "ManualRotation", self._flag_manual_rotation)
         self._flag_delete_noise = read_boolean_value(settings, "DeleteNoise", self._flag_delete_noise)
+        self._flag_iso_moments = read_boolean_value(settings, "IsoMoments", self._flag_iso_moments)
+        if settings.contains("PyramidDepth"):
+            self._pyramid_depth = min(max(int(settings.value("PyramidDepth")), 0), MAX_PYRAMID_DEPTH)
+        self._flag_tracking = read_boolean_value(settings, "Tracking", self._flag_tracking)
+        if settings.contains("TrackingSmoothing"):
+            smoothing = float(settings.value("TrackingSmoothing"))
+            if 0.0 < smoothing <= 1.0:
+                self._set_tracking_smoothing(smoothing)
+        self._flag_camera_roi = read_boolean_value(settings, "CameraRoi", self._flag_camera_roi)
+        if settings.contains("CameraRoiMargin"):
+            margin = float(settings.value("CameraRoiMargin"))
+            if margin > CAMERA_ROI_KEEP_FACTOR:
+                self._camera_roi_margin = margin
         if self._flag_delete_noise:
             if settings.contains("NoiseLevel"):
                 self._noise_level = float(settings.value("NoiseLevel"))
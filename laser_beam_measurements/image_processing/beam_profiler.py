@@ -11,28 +11,47 @@
 
 import numpy
 
+from math import pi
 from PySide6.QtCore import Signal, QSettings, Slot, QPointF, QMutexLocker
 from .image_processor_base import ImageProcessorBase
 from .beam_finder import BeamState
 from enum import StrEnum
-from .utils.denoising import find_noise_level_from_histogram, threshold
+from .utils.denoising import (find_noise_level_from_histogram, find_noise_level_from_histogram_batch, threshold,
+                              NoiseEstimator, NoiseEstimatorMode, NoiseRegion)
 from .utils import beam_width as bm
+from .utils import beam_width_batch as bmb
 from .utils.sub_image import get_cross_section
 from .parameter_logger import ParameterLogger
+from laser_beam_measurements.camera_control.frame import FRAME_INFO, FrameField
 from typing import Optional
 
 
 CROSS_SECTION_AUTO = "Cross section auto"
 CROSS_SECTION_CENTER = "Cross section center"
+POWER_LEVELS = "Power levels"
+GAUSS_FIT_MODE = "Gauss fit mode"
+NOISE_ESTIMATOR = "Noise estimator"
+NOISE_REGION = "Noise region"
+NOISE_HISTOGRAM_BINS = "Noise histogram bins"
+NOISE_UPDATE_INTERVAL = "Noise update interval"
 
 class BeamWidthMethods(StrEnum):
     FOUR_SIGMA = "4 Sigma"
+    FOUR_SIGMA_ISO = "4 Sigma ISO"
     LEVELED_135 = "13.5% level"
     GAUSS_APPR = "Gauss approximation"
     POWER_86 = "86% Power"
 
 
 BEAM_WIDTH_METHODS = "Beam Width"
+POWER_86_LEVEL = 0.86
+MAX_GAUSS_RESIDUAL_FOR_WARM_START = 0.2
+
+
+def power_level_name(level: float) -> str:
+    if level == POWER_86_LEVEL:
+        return BeamWidthMethods.POWER_86
+    return f"{round(level * 100, 2):g}% Power"
 
 
 class BeamPositionAndOrientation(StrEnum):
@@ -47,11 +66,23 @@ BEAM_POSITION_AND_ORIENTATION = "Beam Position And Orientation"
 class OtherParameters(StrEnum):
     AREA = "Area"
     POWER = "Power"
+    GAUSS_RESIDUAL = "Gauss fit residual"
 
 
 OTHER_PARAMETERS = "Other Parameters"
 
 
+class ProfilerStage(StrEnum):
+    DENOISE = "denoise"
+    MOMENTS = "moments"
+    ISO_MOMENTS = "iso moments"
+    CROSS_SECTIONS = "cross sections"
+    GAUSS_FIT = "gauss fit"
+    LEVEL = "level"
+    POWER_AREA = "power and area"
+    POWER_LEVELS = "power levels"
+
+
 class BeamProfiler(ImageProcessorBase):
 
     signal_cross_section_updated = Signal(numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
@@ -66,6 +97,7 @@ class BeamProfiler(ImageProcessorBase):
 
         self._calculation_flags: dict[str, bool] = {
             BeamWidthMethods.FOUR_SIGMA: True,
+            BeamWidthMethods.FOUR_SIGMA_ISO: False,
             BeamWidthMethods.LEVELED_135: True,
             BeamWidthMethods.GAUSS_APPR: True,
             BeamWidthMethods.POWER_86: True,
@@ -73,13 +105,19 @@ class BeamProfiler(ImageProcessorBase):
             BeamPositionAndOrientation.LOCAL: True,
             BeamPositionAndOrientation.ANGLE: True,
             OtherParameters.AREA: True,
-            OtherParameters.POWER: True
+            OtherParameters.POWER: True,
+            OtherParameters.GAUSS_RESIDUAL: True
         }
 
         self._center: tuple[float, float] = (0.0, 0.0)
         # self._beam_parameters: dict[str, tuple[float, float] | float] = dict()
         self._beam_parameters: dict[str, dict[str, tuple[float, float] | float]] = dict()
         self._pixel_size: float = 1.0
+        self._power_levels: tuple[float, ...] = tuple()
+        self._gauss_fit_mode: bm.GaussFitMode = bm.GaussFitMode.ACCURATE
+        self._gauss_parameters: tuple[tuple[float, float, float] | None, tuple[float, float, float] | None] = (None, None)
+        self._noise_estimator_mode: NoiseEstimatorMode = NoiseEstimatorMode.HISTOGRAM
+        self._noise_estimator: NoiseEstimator = NoiseEstimator()
         self._parameter_logger: Optional[ParameterLogger] = None
 
     @property
@@ -91,6 +129,10 @@ class BeamProfiler(ImageProcessorBase):
         if self._parameter_logger:
             self.signal_beam_parameters_updated.disconnect(self._parameter_logger.slot_set_data)
         self._parameter_logger = logger
+        # the logger receives the results in the processing thread, it has to be moved there before
+        # it can become a child of the profiler
+        if self._parameter_logger.thread() != self.thread():
+            self._parameter_logger.moveToThread(self.thread())
         self._parameter_logger.setParent(self)
         self.signal_beam_parameters_updated.connect(self._parameter_logger.slot_set_data)
         self.update_available_parameters()
@@ -104,12 +146,16 @@ class BeamProfiler(ImageProcessorBase):
         # Width methods
         if self._calculation_flags[BeamWidthMethods.FOUR_SIGMA]:
             available_parameters.append(f"{BEAM_WIDTH_METHODS}: {BeamWidthMethods.FOUR_SIGMA}")
+        if self._calculation_flags[BeamWidthMethods.FOUR_SIGMA_ISO]:
+            available_parameters.append(f"{BEAM_WIDTH_METHODS}: {BeamWidthMethods.FOUR_SIGMA_ISO}")
         if self._calculation_flags[BeamWidthMethods.LEVELED_135]:
             available_parameters.append(f"{BEAM_WIDTH_METHODS}: {BeamWidthMethods.LEVELED_135}")
         if self._calculation_flags[BeamWidthMethods.GAUSS_APPR]:
             available_parameters.append(f"{BEAM_WIDTH_METHODS}: {BeamWidthMethods.GAUSS_APPR}")
         if self._calculation_flags[BeamWidthMethods.POWER_86]:
             available_parameters.append(f"{BEAM_WIDTH_METHODS}: {BeamWidthMethods.POWER_86}")
+        for level in self._power_levels:
+            available_parameters.append(f"{BEAM_WIDTH_METHODS}: {power_level_name(level)}")
 
         # Position and orientation
         if self._calculation_flags[BeamPositionAndOrientation.GLOBAL]:
@@ -124,24 +170,44 @@ class BeamProfiler(ImageProcessorBase):
             available_parameters.append(f"{OTHER_PARAMETERS}: {OtherParameters.POWER}")
         if self._calculation_flags[OtherParameters.AREA]:
             available_parameters.append(f"{OTHER_PARAMETERS}: {OtherParameters.AREA}")
+        if self._calculation_flags[BeamWidthMethods.GAUSS_APPR] and self._calculation_flags[OtherParameters.GAUSS_RESIDUAL]:
+            available_parameters.append(f"{OTHER_PARAMETERS}: {OtherParameters.GAUSS_RESIDUAL}")
+
+        available_parameters.append(f"{FRAME_INFO}: {FrameField.TIMESTAMP}")
+        available_parameters.append(f"{FRAME_INFO}: {FrameField.SEQUENCE}")
 
         self._parameter_logger.slot_update_available_parameters(available_parameters)
 
+    def _get_readout(self) -> tuple[int, int, int]:
+        frame_info = self._extra_context.get(FRAME_INFO, None)
+        if frame_info is None:
+            return 0, 0, 1
+        return (frame_info.get(FrameField.OFFSET_X, 0), frame_info.get(FrameField.OFFSET_Y, 0),
+                frame_info.get(FrameField.BINNING, 1))
+
     def process(self, image: numpy.ndarray) -> bool | None:
         if len(image.shape) != 2:
             return False
-        noise_level = find_noise_level_from_histogram(image)
-        denoised_image = threshold(image, noise_level)
+        with self._latency.measure(f"{self._name}: {ProfilerStage.DENOISE}"):
+            if self._noise_estimator_mode == NoiseEstimatorMode.FAST:
+                noise_level = self._noise_estimator.estimate(image)
+            else:
+                noise_level = find_noise_level_from_histogram(image)
+            denoised_image = threshold(image, noise_level)
 
         beam_parameters = dict()
 
         beam_width = dict()
         beam_position_and_orientation = dict()
         beam_other_parameters = dict()
-        ps = self._pixel_size
+        # a pixel of a binned frame covers binning x binning sensor pixels, the position of a camera ROI
+        # frame is relative to the ROI offset given in sensor pixels
+        offset_x, offset_y, binning = self._get_readout()
+        ps = self._pixel_size * binning
 
         if self._calculation_flags[BeamWidthMethods.FOUR_SIGMA]:
-            cx, cy, d_4sigma_x, d_4sigma_y, _ = bm.width_by_moments(denoised_image, False)
+            with self._latency.measure(f"{self._name}: {ProfilerStage.MOMENTS}"):
+                cx, cy, d_4sigma_x, d_4sigma_y, _ = bm.width_by_moments(denoised_image, False)
             # beam_parameters.update({BeamWidthMethods.FOUR_SIGMA: (d_4sigma_x, d_4sigma_y)})
             beam_width.update({BeamWidthMethods.FOUR_SIGMA: (d_4sigma_x*ps, d_4sigma_y*ps)})
             if self._flag_cross_sections_auto:
@@ -152,46 +218,62 @@ class BeamProfiler(ImageProcessorBase):
                 self._center = (denoised_image.shape[1] / 2.0, denoised_image.shape[0] / 2.0)
                 self.signal_beam_center_updated.emit(self._center[1], self._center[0])
 
-        im_x, im_y = get_cross_section(denoised_image, self._center[0], self._center[1])
+        if self._calculation_flags[BeamWidthMethods.FOUR_SIGMA_ISO]:
+            with self._latency.measure(f"{self._name}: {ProfilerStage.ISO_MOMENTS}"):
+                _, _, d_iso_x, d_iso_y, _ = bm.width_by_moments_iso(denoised_image, False)
+            beam_width.update({BeamWidthMethods.FOUR_SIGMA_ISO: (d_iso_x*ps, d_iso_y*ps)})
+
+        with self._latency.measure(f"{self._name}: {ProfilerStage.CROSS_SECTIONS}"):
+            im_x, im_y = get_cross_section(denoised_image, self._center[0], self._center[1])
         xx = numpy.arange(-len(im_x) / 2, len(im_x) / 2, dtype=numpy.float64) * ps
         yy = numpy.arange(-len(im_y) / 2, len(im_y) / 2, dtype=numpy.float64) * ps
         self.signal_cross_section_updated.emit(xx, im_x, yy, im_y)
 
         if self._calculation_flags[BeamWidthMethods.GAUSS_APPR]:
-            d0_x, d0_y = beam_parameters.get(BeamWidthMethods.FOUR_SIGMA, (len(im_x)/2, len(im_y)/2))
-            d_gauss_x, model_x = bm.width_by_gauss_approximation(im_x, xx, d0_x)
-            d_gauss_y, model_y = bm.width_by_gauss_approximation(im_y, yy, d0_y)
+            p0_x, p0_y = self._gauss_parameters
+            if p0_x is None or p0_y is None:
+                d0_x, d0_y = beam_width.get(BeamWidthMethods.FOUR_SIGMA, (len(im_x)*ps/2, len(im_y)*ps/2))
+                p0_x = (d0_x / 2.0, 0.0, pi * d0_x * d0_x / 32.0)
+                p0_y = (d0_y / 2.0, 0.0, pi * d0_y * d0_y / 32.0)
+            with self._latency.measure(f"{self._name}: {ProfilerStage.GAUSS_FIT}"):
+                res_x, model_x, residual_x = bm.gauss_approximation(im_x, xx, p0_x, self._gauss_fit_mode)
+                res_y, model_y, residual_y = bm.gauss_approximation(im_y, yy, p0_y, self._gauss_fit_mode)
+            self._gauss_parameters = (
+                res_x if residual_x < MAX_GAUSS_RESIDUAL_FOR_WARM_START else None,
+                res_y if residual_y < MAX_GAUSS_RESIDUAL_FOR_WARM_START else None
+            )
+            d_gauss_x = abs(2 * res_x[0])
+            d_gauss_y = abs(2 * res_y[0])
             # beam_parameters.update({BeamWidthMethods.GAUSS_APPR: (d_gauss_x, d_gauss_y)})
             beam_width.update({BeamWidthMethods.GAUSS_APPR: (d_gauss_x, d_gauss_y)})
+            if self._calculation_flags[OtherParameters.GAUSS_RESIDUAL]:
+                beam_other_parameters.update({OtherParameters.GAUSS_RESIDUAL: (residual_x, residual_y)})
             self.signal_gauss_approximation_updated.emit(xx, model_x, yy, model_y)
 
         if self._calculation_flags[BeamWidthMethods.LEVELED_135]:
-            d_135_x = bm.width_by_level(im_x, level=0.135)
-            d_135_y = bm.width_by_level(im_y, level=0.135)
+            with self._latency.measure(f"{self._name}: {ProfilerStage.LEVEL}"):
+                d_135_x = bm.width_by_level(im_x, level=0.135)
+                d_135_y = bm.width_by_level(im_y, level=0.135)
             # beam_parameters.update({BeamWidthMethods.LEVELED_135: (d_135_x, d_135_y)})
             beam_width.update({BeamWidthMethods.LEVELED_135: (d_135_x*ps, d_135_y*ps)})
 
-        if self._calculation_flags[BeamWidthMethods.POWER_86]:
-            power = None
-            area = None
-            if self._calculation_flags[OtherParameters.POWER] or self._calculation_flags[OtherParameters.AREA]:
+        power = None
+        if self._calculation_flags[OtherParameters.POWER] or self._calculation_flags[OtherParameters.AREA]:
+            with self._latency.measure(f"{self._name}: {ProfilerStage.POWER_AREA}"):
                 power, area = bm.power_area(denoised_image)
-
-            d_power = bm.width_by_power_level(denoised_image, level=0.86, power=power)
-            beam_width.update({BeamWidthMethods.POWER_86: d_power*ps})
-
             if self._calculation_flags[OtherParameters.POWER]:
                 beam_other_parameters.update({OtherParameters.POWER: power})
             if self._calculation_flags[OtherParameters.AREA]:
                 beam_other_parameters.update({OtherParameters.AREA: area})
 
-        else:
-            if self._calculation_flags[OtherParameters.POWER] or self._calculation_flags[OtherParameters.AREA]:
-                power, area = bm.power_area(denoised_image)
-                if self._calculation_flags[OtherParameters.POWER]:
-                    beam_other_parameters.update({OtherParameters.POWER: power})
-                if self._calculation_flags[OtherParameters.AREA]:
-                    beam_other_parameters.update({OtherParameters.AREA: area})
+        power_levels = self._power_levels
+        if self._calculation_flags[BeamWidthMethods.POWER_86]:
+            power_levels = (POWER_86_LEVEL, *power_levels)
+        if power_levels:
+            with self._latency.measure(f"{self._name}: {ProfilerStage.POWER_LEVELS}"):
+                d_power = bm.width_by_power_levels(denoised_image, power_levels, power=power)
+            for level, d in zip(power_levels, d_power):
+                beam_width.update({power_level_name(level): float(d)*ps})
 
         if self._calculation_flags[BeamPositionAndOrientation.ANGLE]:
             if BeamState.ANGLE in self._extra_context.keys():
@@ -201,8 +283,8 @@ class BeamProfiler(ImageProcessorBase):
             if BeamState.POS in self._extra_context.keys():
                 beam_position_and_orientation.update({
                     BeamPositionAndOrientation.GLOBAL:
-                        (self._extra_context[BeamState.POS][0]*ps,
-                         self._extra_context[BeamState.POS][1]*ps)
+                        ((self._extra_context[BeamState.POS][0]*binning + offset_x)*self._pixel_size,
+                         (self._extra_context[BeamState.POS][1]*binning + offset_y)*self._pixel_size)
                 })
 
         if self._calculation_flags[BeamPositionAndOrientation.LOCAL]:
@@ -221,11 +303,83 @@ class BeamProfiler(ImageProcessorBase):
         if beam_other_parameters:
             beam_parameters.update({OTHER_PARAMETERS: beam_other_parameters})
 
+        frame_info = self._extra_context.get(FRAME_INFO, None)
+        if frame_info is not None:
+            beam_parameters.update({FRAME_INFO: frame_info})
+
         self._beam_parameters.update(beam_parameters)
         self.signal_beam_parameters_updated.emit(self._beam_parameters)
 
         return True
 
+    def process_stack(self, images: numpy.ndarray) -> numpy.ndarray:
+        if images.ndim != 3:
+            raise ValueError(f"Expected a stack of frames N x H x W, got shape {images.shape}")
+        n, h, w = images.shape
+        noise_level = find_noise_level_from_histogram_batch(images)
+        denoised_images = numpy.where(images > noise_level[:, numpy.newaxis, numpy.newaxis], images, 0)
+        ps = self._pixel_size
+        columns: dict[str, numpy.ndarray] = dict()
+
+        def add_column(group: str, name: str, values: numpy.ndarray | tuple[numpy.ndarray, numpy.ndarray]) -> None:
+            if isinstance(values, tuple):
+                columns[f"{group}: {name}_X"] = values[0]
+                columns[f"{group}: {name}_Y"] = values[1]
+            else:
+                columns[f"{group}: {name}"] = values
+
+        if self._calculation_flags[BeamWidthMethods.FOUR_SIGMA]:
+            moments = bmb.width_by_moments_batch(denoised_images, False)
+            add_column(BEAM_WIDTH_METHODS, BeamWidthMethods.FOUR_SIGMA, (moments['dx']*ps, moments['dy']*ps))
+            center_x = moments['cx']
+            center_y = moments['cy']
+        else:
+            center_x = numpy.full(n, w / 2.0)
+            center_y = numpy.full(n, h / 2.0)
+
+        rows = numpy.arange(n)
+        im_x = denoised_images[rows, numpy.clip(center_y.astype(int), 0, h - 1), :]
+        im_y = denoised_images[rows, :, numpy.clip(center_x.astype(int), 0, w - 1)]
+
+        if self._calculation_flags[BeamWidthMethods.GAUSS_APPR]:
+            xx = numpy.arange(-w / 2, w / 2, dtype=numpy.float64) * ps
+            yy = numpy.arange(-h / 2, h / 2, dtype=numpy.float64) * ps
+            fit_x = bmb.gauss_fit_fast_batch(im_x, xx)
+            fit_y = bmb.gauss_fit_fast_batch(im_y, yy)
+            add_column(BEAM_WIDTH_METHODS, BeamWidthMethods.GAUSS_APPR,
+                       (numpy.abs(2 * fit_x['radius']), numpy.abs(2 * fit_y['radius'])))
+            if self._calculation_flags[OtherParameters.GAUSS_RESIDUAL]:
+                add_column(OTHER_PARAMETERS, OtherParameters.GAUSS_RESIDUAL, (fit_x['residual'], fit_y['residual']))
+
+        if self._calculation_flags[BeamWidthMethods.LEVELED_135]:
+            add_column(BEAM_WIDTH_METHODS, BeamWidthMethods.LEVELED_135,
+                       (bmb.width_by_level_batch(im_x, 0.135)*ps, bmb.width_by_level_batch(im_y, 0.135)*ps))
+
+        power = None
+        if self._calculation_flags[OtherParameters.POWER] or self._calculation_flags[OtherParameters.AREA]:
+            power_area = bmb.power_area_batch(denoised_images)
+            power = power_area['power']
+            if self._calculation_flags[OtherParameters.POWER]:
+                add_column(OTHER_PARAMETERS, OtherParameters.POWER, power_area['power'])
+            if self._calculation_flags[OtherParameters.AREA]:
+                add_column(OTHER_PARAMETERS, OtherParameters.AREA, power_area['area'])
+
+        power_levels = self._power_levels
+        if self._calculation_flags[BeamWidthMethods.POWER_86]:
+            power_levels = (POWER_86_LEVEL, *power_levels)
+        if power_levels:
+            d_power = bmb.width_by_power_levels_batch(denoised_images, power_levels, power=power)
+            for index, level in enumerate(power_levels):
+                add_column(BEAM_WIDTH_METHODS, power_level_name(level), d_power[:, index]*ps)
+
+        if self._calculation_flags[BeamPositionAndOrientation.LOCAL]:
+            add_column(BEAM_POSITION_AND_ORIENTATION, BeamPositionAndOrientation.LOCAL, (center_x*ps, center_y*ps))
+
+        result = numpy.zeros(n, dtype=[(name, numpy.float64) for name in columns.keys()])
+        for name, values in columns.items():
+            result[name] = values
+        return result
+
     def save_settings(self, settings: QSettings) -> None:
         settings.beginGroup("BeamFinder")
         settings.endGroup()
@@ -243,6 +397,28 @@ class BeamProfiler(ImageProcessorBase):
                     self._center = (value.x(), value.y())
             elif parameter == CROSS_SECTION_AUTO:
                 self._flag_cross_sections_auto = bool(value)
+            elif parameter == GAUSS_FIT_MODE:
+                if value in list(bm.GaussFitMode):
+                    self._gauss_fit_mode = bm.GaussFitMode(value)
+                    self._gauss_parameters = (None, None)
+            elif parameter == POWER_LEVELS:
+                if isinstance(value, (tuple, list)):
+                    self._power_levels = tuple(float(v) for v in value if 0.0 < float(v) < 1.0 and v != POWER_86_LEVEL)
+            elif parameter == NOISE_ESTIMATOR:
+                if value in list(NoiseEstimatorMode):
+                    self._noise_estimator_mode = NoiseEstimatorMode(value)
+                    self._noise_estimator.reset()
+            elif parameter == NOISE_REGION:
+                if value in list(NoiseRegion):
+                    self._noise_estimator.region = value
+            elif parameter == NOISE_HISTOGRAM_BINS:
+                if isinstance(value, int) and value > 0:
+                    self._noise_estimator.bins = value
+            elif parameter == NOISE_UPDATE_INTERVAL:
+                if isinstance(value, int) and value > 0:
+                    self._noise_estimator.update_interval = value
+        if parameter == POWER_LEVELS:
+            self.update_available_parameters()
         super()._set_parameter_value(parameter, value)
 
     def get_parameter_value(self, parameter: str) -> object | None:
@@ -251,6 +427,18 @@ class BeamProfiler(ImageProcessorBase):
                 return self._center
             elif parameter == CROSS_SECTION_AUTO:
                 return self._flag_cross_sections_auto
+            elif parameter == GAUSS_FIT_MODE:
+                return self._gauss_fit_mode
+            elif parameter == POWER_LEVELS:
+                return self._power_levels
+            elif parameter == NOISE_ESTIMATOR:
+                return self._noise_estimator_mode
+            elif parameter == NOISE_REGION:
+                return self._noise_estimator.region
+            elif parameter == NOISE_HISTOGRAM_BINS:
+                return self._noise_estimator.bins
+            elif parameter == NOISE_UPDATE_INTERVAL:
+                return self._noise_estimator.update_interval
         return super().get_parameter_value(parameter)
 
     @Slot(QPointF)
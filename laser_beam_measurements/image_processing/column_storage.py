@@ -0,0 +1,148 @@
+#
+# Project: laser_beam_measurements
+#
+# File: column_storage.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2025 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+import numpy
+from typing import Optional, Sequence
+
+
+__all__ = ["ColumnStorage"]
+
+
+# 2**19 rows are about 14 hours of logging every 100 ms, the whole session is kept in the log file
+DEFAULT_CAPACITY = 1 << 19
+DEFAULT_CHUNK_ROWS = 1 << 12
+COLUMN_DTYPE = numpy.float64
+
+
+class ColumnStorage:
+
+    def __init__(self, columns: int, capacity: int = DEFAULT_CAPACITY, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        # The rows are stored in a float64 array which grows by chunks up to the capacity. After that
+        # the storage becomes a ring keeping the last capacity rows, so its memory is bounded. Every row
+        # of the ring is written twice, at its index and capacity rows further, so the kept rows are always
+        # a contiguous block of the array and the columns are returned as views without copying.
+        self._columns: int = max(int(columns), 1)
+        self._capacity: int = max(int(capacity), 1)
+        self._chunk_rows: int = max(int(chunk_rows), 1)
+        self._buffer: numpy.ndarray = numpy.empty((0, self._columns), dtype=COLUMN_DTYPE)
+        self._flag_ring: bool = False
+        # the number of the kept rows, the next row of the ring and the number of all appended rows
+        self._size: int = 0
+        self._position: int = 0
+        self._counter: int = 0
+
+    @property
+    def columns(self) -> int:
+        return self._columns
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def counter(self) -> int:
+        return self._counter
+
+    @property
+    def nbytes(self) -> int:
+        return self._buffer.nbytes
+
+    @property
+    def rows(self) -> numpy.ndarray:
+        # the kept rows from the oldest to the newest
+        if self._flag_ring:
+            return self._buffer[self._position:self._position + self._capacity]
+        return self._buffer[:self._size]
+
+    def column(self, index: int) -> numpy.ndarray:
+        return self.rows[:, index]
+
+    def last_row(self) -> Optional[numpy.ndarray]:
+        if self._size == 0:
+            return None
+        return self.rows[-1]
+
+    def clear(self) -> None:
+        self._buffer = numpy.empty((0, self._columns), dtype=COLUMN_DTYPE)
+        self._flag_ring = False
+        self._size = 0
+        self._position = 0
+        self._counter = 0
+
+    def append(self, row: Sequence) -> None:
+        row = self._to_row(row)
+        if not self._flag_ring and self._size == len(self._buffer):
+            self._grow()
+        if self._flag_ring:
+            self._buffer[self._position] = row
+            self._buffer[self._position + self._capacity] = row
+            self._position = (self._position + 1) % self._capacity
+        else:
+            self._buffer[self._size] = row
+            self._size += 1
+        self._counter += 1
+
+    def extend(self, rows: numpy.ndarray) -> None:
+        # appends a block of rows with one copy per part of the array
+        rows = numpy.asarray(rows, dtype=COLUMN_DTYPE).reshape(-1, self._columns)
+        if len(rows) > self._capacity:
+            self._counter += len(rows) - self._capacity
+            rows = rows[-self._capacity:]
+        while len(rows) > 0 and not self._flag_ring:
+            if self._size == len(self._buffer):
+                self._grow()
+                continue
+            count = min(len(rows), len(self._buffer) - self._size)
+            self._buffer[self._size:self._size + count] = rows[:count]
+            self._size += count
+            self._counter += count
+            rows = rows[count:]
+        if len(rows) == 0:
+            return
+        count = len(rows)
+        first = min(count, self._capacity - self._position)
+        for offset in (0, self._capacity):
+            self._buffer[offset + self._position:offset + self._position + first] = rows[:first]
+            self._buffer[offset:offset + count - first] = rows[first:]
+        self._position = (self._position + count) % self._capacity
+        self._counter += count
+
+    def _grow(self) -> None:
+        allocated = len(self._buffer)
+        if allocated >= self._capacity:
+            # the kept rows fill both halves of the ring, the next row replaces the oldest one
+            buffer = numpy.empty((2 * self._capacity, self._columns), dtype=COLUMN_DTYPE)
+            buffer[:self._capacity] = self._buffer
+            buffer[self._capacity:] = self._buffer
+            self._flag_ring = True
+            self._position = 0
+        else:
+            buffer = numpy.empty((min(allocated + self._chunk_rows, self._capacity), self._columns), dtype=COLUMN_DTYPE)
+            buffer[:allocated] = self._buffer
+        # the views given out before keep the former array
+        self._buffer = buffer
+
+    def _to_row(self, row: Sequence) -> numpy.ndarray:
+        try:
+            return numpy.asarray(row, dtype=COLUMN_DTYPE)
+        except (TypeError, ValueError):
+            # the values which are not numbers are stored as NaN
+            return numpy.array([_to_float(value) for value in row], dtype=COLUMN_DTYPE)
+
+
+def _to_float(value: object) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return numpy.nan
@@ -0,0 +1,226 @@
+#
+# Project: laser_beam_measurements
+#
+# File: frame_averager.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+import numpy
+import cv2
+from enum import StrEnum
+from PySide6.QtCore import Slot, QMutexLocker, QSettings
+
+from .image_processor_base import ImageProcessorBase
+from laser_beam_measurements.camera_control.frame import FRAME_INFO, FrameField
+from laser_beam_measurements.camera_control.frame_pool import FramePool
+from laser_beam_measurements.utils.settings_bool_reader import read_boolean_value
+
+
+class AveragingMode(StrEnum):
+    ROLLING_MEAN = "rolling mean"
+    EXPONENTIAL = "exponential"
+
+
+class FrameAveragerParameters(StrEnum):
+    ACTIVE = "active"
+    MODE = "mode"
+    FRAME_COUNT = "frame count"
+    SMOOTHING = "smoothing"
+    EMIT_INTERVAL = "emit interval"
+
+
+DEFAULT_FRAME_COUNT = 8
+# every frame of the ring is a full copy of the camera frame
+MAX_FRAME_COUNT = 128
+DEFAULT_SMOOTHING = 0.1
+DEFAULT_EMIT_INTERVAL = 1
+OUTPUT_POOL_SIZE = 4
+
+_CV_DEPTHS: dict[numpy.dtype, int] = {
+    numpy.dtype(numpy.uint8): cv2.CV_8U,
+    numpy.dtype(numpy.uint16): cv2.CV_16U,
+    numpy.dtype(numpy.float32): cv2.CV_32F
+}
+
+
+class FrameAverager(ImageProcessorBase):
+
+    def __init__(self, *args, **kwargs):
+        super(FrameAverager, self).__init__(*args, **kwargs)
+        self._flag_active: bool = False
+        self._mode: AveragingMode = AveragingMode.ROLLING_MEAN
+        self._frame_count: int = DEFAULT_FRAME_COUNT
+        self._smoothing: float = DEFAULT_SMOOTHING
+        # the averaged frame is passed on every emit_interval frames
+        self._emit_interval: int = DEFAULT_EMIT_INTERVAL
+
+        # the ring keeps the frames in their own type, the sum of the ring is kept in float32
+        self._ring: numpy.ndarray | None = None
+        self._ring_index: int = 0
+        self._ring_filled: int = 0
+        self._sum: numpy.ndarray | None = None
+        self._average: numpy.ndarray | None = None
+        self._received_counter: int = 0
+        # offset x, offset y and binning of the averaged frames
+        self._readout: tuple[int, int, int] = (0, 0, 1)
+        self._output_pool: FramePool = FramePool(OUTPUT_POOL_SIZE)
+
+    @property
+    def averaged_frames(self) -> int:
+        with QMutexLocker(self._mutex):
+            if self._mode == AveragingMode.ROLLING_MEAN:
+                return self._ring_filled
+            return self._received_counter
+
+    def process(self, image: numpy.ndarray) -> bool | None:
+        with QMutexLocker(self._mutex):
+            if not self._flag_active or image.ndim != 2 or image.dtype not in _CV_DEPTHS:
+                self._processed_image = image
+                return True
+            readout = self._get_readout()
+            if readout != self._readout:
+                # the frames of another camera ROI or binning show another part of the sensor
+                self._reset()
+                self._readout = readout
+            if self._mode == AveragingMode.ROLLING_MEAN:
+                scale = self._add_to_ring(image)
+                average = self._sum
+            else:
+                scale = 1.0
+                average = self._add_to_exponential_average(image)
+            self._received_counter += 1
+            if self._received_counter % self._emit_interval != 0:
+                # the next processors skip this frame
+                return False
+            output = self._output_pool.acquire(image.shape, image.dtype)
+            # scaling, rounding and saturation to the frame type are done by OpenCV in one pass
+            self._processed_image = cv2.addWeighted(average, scale, average, 0.0, 0.0,
+                                                    dst=output, dtype=_CV_DEPTHS[image.dtype])
+            # the result is held by the processor base from now on
+            FramePool.release(output)
+        return True
+
+    def _get_readout(self) -> tuple[int, int, int]:
+        frame_info = self._extra_context.get(FRAME_INFO, None)
+        if frame_info is None:
+            return 0, 0, 1
+        return (frame_info.get(FrameField.OFFSET_X, 0), frame_info.get(FrameField.OFFSET_Y, 0),
+                frame_info.get(FrameField.BINNING, 1))
+
+    def _add_to_ring(self, image: numpy.ndarray) -> float:
+        if self._ring is None or self._ring.shape[1:] != image.shape or self._ring.dtype != image.dtype \
+                or len(self._ring) != self._frame_count:
+            self._ring = numpy.empty((self._frame_count,) + image.shape, dtype=image.dtype)
+            self._sum = numpy.zeros(image.shape, dtype=numpy.float32)
+            self._ring_index = 0
+            self._ring_filled = 0
+        slot = self._ring[self._ring_index]
+        if self._ring_filled == self._frame_count:
+            # the oldest frame leaves the sum before it is overwritten
+            cv2.subtract(self._sum, slot, dst=self._sum, dtype=cv2.CV_32F)
+        else:
+            self._ring_filled += 1
+        numpy.copyto(slot, image)
+        cv2.accumulate(image, self._sum)
+        self._ring_index = (self._ring_index + 1) % self._frame_count
+        if self._ring_index == 0 and image.dtype.kind == 'f':
+            # integer frames are summed exactly, the rounding errors of float frames are dropped once per turn
+            numpy.sum(self._ring, axis=0, dtype=numpy.float32, out=self._sum)
+        return 1.0 / self._ring_filled
+
+    def _add_to_exponential_average(self, image: numpy.ndarray) -> numpy.ndarray:
+        if self._average is None or self._average.shape != image.shape:
+            self._average = image.astype(numpy.float32)
+        else:
+            cv2.accumulateWeighted(image, self._average, self._smoothing)
+        return self._average
+
+    def _reset(self) -> None:
+        self._ring = None
+        self._sum = None
+        self._ring_index = 0
+        self._ring_filled = 0
+        self._average = None
+        self._received_counter = 0
+
+    @Slot()
+    def reset(self) -> None:
+        with QMutexLocker(self._mutex):
+            self._reset()
+
+    @Slot(bool)
+    def set_active(self, value: bool) -> None:
+        self._set_parameter_value(FrameAveragerParameters.ACTIVE, value)
+
+    @Slot(str)
+    def set_mode(self, mode: AveragingMode | str) -> None:
+        self._set_parameter_value(FrameAveragerParameters.MODE, mode)
+
+    def _set_parameter_value(self, parameter: FrameAveragerParameters | str, value: object) -> None:
+        with QMutexLocker(self._mutex):
+            if parameter == FrameAveragerParameters.ACTIVE:
+                if isinstance(value, bool) and value != self._flag_active:
+                    self._flag_active = value
+                    self._reset()
+            elif parameter == FrameAveragerParameters.MODE:
+                if value in tuple(AveragingMode) and value != self._mode:
+                    self._mode = AveragingMode(value)
+                    self._reset()
+            elif parameter == FrameAveragerParameters.FRAME_COUNT:
+                if isinstance(value, int) and 0 < value <= MAX_FRAME_COUNT:
+                    self._frame_count = value
+            elif parameter == FrameAveragerParameters.SMOOTHING:
+                if isinstance(value, (float, int)) and 0.0 < value <= 1.0:
+                    self._smoothing = float(value)
+            elif parameter == FrameAveragerParameters.EMIT_INTERVAL:
+                if isinstance(value, int) and value > 0:
+                    self._emit_interval = value
+
+    def get_parameter_value(self, parameter: FrameAveragerParameters | str) -> object | None:
+        with QMutexLocker(self._mutex):
+            if parameter == FrameAveragerParameters.ACTIVE:
+                return self._flag_active
+            elif parameter == FrameAveragerParameters.MODE:
+                return self._mode
+            elif parameter == FrameAveragerParameters.FRAME_COUNT:
+                return self._frame_count
+            elif parameter == FrameAveragerParameters.SMOOTHING:
+                return self._smoothing
+            elif parameter == FrameAveragerParameters.EMIT_INTERVAL:
+                return self._emit_interval
+        return None
+
+    def _set_init_parameters(self, parameters: dict) -> None:
+        # a new camera starts a new average
+        self.reset()
+
+    def save_settings(self, settings: QSettings) -> None:
+        settings.beginGroup("FrameAverager")
+        settings.setValue("Active", self._flag_active)
+        settings.setValue("Mode", str(self._mode))
+        settings.setValue("FrameCount", self._frame_count)
+        settings.setValue("Smoothing", self._smoothing)
+        settings.setValue("EmitInterval", self._emit_interval)
+        settings.endGroup()
+
+    def load_settings(self, settings: QSettings) -> None:
+        if not settings.contains("FrameAverager/Active"):
+            return
+        settings.beginGroup("FrameAverager")
+        self._flag_active = read_boolean_value(settings, "Active", self._flag_active)
+        if settings.contains("Mode"):
+            mode = str(settings.value("Mode"))
+            if mode in tuple(AveragingMode):
+                self._mode = AveragingMode(mode)
+        if settings.contains("FrameCount"):
+            self._frame_count = min(max(int(settings.value("FrameCount")), 1), MAX_FRAME_COUNT)
+        if settings.contains("Smoothing"):
+            smoothing = float(settings.value("Smoothing"))
+            if 0.0 < smoothing <= 1.0:
+                self._smoothing = smoothing
+        if settings.contains("EmitInterval"):
+            self._emit_interval = max(int(settings.value("EmitInterval")), 1)
+        settings.endGroup()
@@ -8,14 +8,23 @@
 # Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
 #
 
-from PySide6.QtCore import QObject, Signal, Slot, QThread, QMutex, QMutexLocker, QSettings
+from PySide6.QtCore import QObject, Signal, Slot, QThread, QMutex, QMutexLocker, QSettings, Qt, QWaitCondition
 import numpy
+from time import perf_counter_ns
+from collections import deque
+from .utils.latency import LatencyRecorder
+from laser_beam_measurements.camera_control.frame import Frame, FRAME_INFO
+from laser_beam_measurements.camera_control.frame_pool import FramePool, retain_for_receivers
+
+
+DEFAULT_INPUT_QUEUE_SIZE = 2
 
 
 class ImageProcessorBase(QObject):
     signal_processed_done = Signal()
     signal_input_image = Signal(numpy.ndarray)
     signal_processed_image = Signal(numpy.ndarray)
+    _signal_input_queue_ready = Signal()
 
     def __init__(self, parent=None, **kwargs):
         super(ImageProcessorBase, self).__init__(parent)
@@ -25,9 +34,18 @@ class ImageProcessorBase(QObject):
         self._name: str = kwargs.get("name", type(self).__name__)
         self._next_processor: ImageProcessorBase | None = None
         self._processed_image: numpy.ndarray | None = None
+        # the processed image the processor keeps a hold of, its buffer is not reused while it is the result
+        self._held_image: numpy.ndarray | None = None
         self._flag_enable: bool = True
         self._flag_transmit_context: bool = False
         self._extra_context: dict = {}
+        self._latency: LatencyRecorder = LatencyRecorder()
+        self._flag_queued_input: bool = False
+        self._input_queue_mutex: QMutex = QMutex()
+        self._input_queue_not_full: QWaitCondition = QWaitCondition()
+        self._input_queue: deque[tuple[numpy.ndarray, dict]] = deque()
+        self._input_queue_size: int = DEFAULT_INPUT_QUEUE_SIZE
+        self._signal_input_queue_ready.connect(self._slot_process_input_queue, Qt.ConnectionType.QueuedConnection)
         create_thread = kwargs.get("create_thread", False)
         if self._thread is None and create_thread:
             self._thread = QThread()
@@ -49,6 +67,47 @@ class ImageProcessorBase(QObject):
         with QMutexLocker(self._mutex):
             return self._next_processor
 
+    def run_in_own_thread(self, queue_size: int = DEFAULT_INPUT_QUEUE_SIZE) -> None:
+        # the processor receives images from the previous one through a bounded queue
+        # and processes them in its own thread. The previous processor waits while the queue is full,
+        # so frames are dropped before the pipeline rather than after the first stages
+        if self._thread is None:
+            self._thread = QThread()
+            self._own_thread = True
+        self.moveToThread(self._thread)
+        if not self._thread.isRunning():
+            self._thread.start()
+        with QMutexLocker(self._input_queue_mutex):
+            self._input_queue_size = max(int(queue_size), 1)
+            self._flag_queued_input = True
+
+    @property
+    def queued_input(self) -> bool:
+        return self._flag_queued_input
+
+    def enqueue_image(self, image: numpy.ndarray, extra_context: dict | None = None) -> None:
+        with QMutexLocker(self._input_queue_mutex):
+            while self._flag_queued_input and len(self._input_queue) >= self._input_queue_size:
+                self._input_queue_not_full.wait(self._input_queue_mutex)
+            notify = len(self._input_queue) == 0
+            FramePool.retain(image)
+            self._input_queue.append((image, extra_context or dict()))
+        if notify:
+            self._signal_input_queue_ready.emit()
+
+    @Slot()
+    def _slot_process_input_queue(self) -> None:
+        while True:
+            with QMutexLocker(self._input_queue_mutex):
+                if len(self._input_queue) == 0:
+                    return
+                image, extra_context = self._input_queue.popleft()
+                self._input_queue_not_full.wakeAll()
+            self.set_extra_context(**extra_context)
+            self.on_new_image(image)
+            # the hold was taken when the image was queued
+            FramePool.release(image)
+
     def process(self, image: numpy.ndarray) -> bool | None:
         raise NotImplementedError()
 
@@ -56,11 +115,36 @@ class ImageProcessorBase(QObject):
     def name(self):
         return self._name
 
+    @property
+    def latency(self) -> LatencyRecorder:
+        return self._latency
+
+    def get_latency_statistics(self) -> dict:
+        return self._latency.statistics()
+
+    @Slot()
+    def reset_latency_statistics(self) -> None:
+        self._latency.reset()
+
     @property
     def processed_image(self) -> numpy.ndarray | None:
         with QMutexLocker(self._mutex):
             return self._processed_image
 
+    def hold_processed_image(self) -> numpy.ndarray | None:
+        # returns the processed image with a hold taken for the caller
+        with QMutexLocker(self._mutex):
+            FramePool.retain(self._processed_image)
+            return self._processed_image
+
+    def _hold_processed_image(self) -> None:
+        with QMutexLocker(self._mutex):
+            if self._processed_image is self._held_image:
+                return
+            FramePool.retain(self._processed_image)
+            FramePool.release(self._held_image)
+            self._held_image = self._processed_image
+
     @Slot(bool)
     def set_enable(self, flag: bool) -> None:
         with QMutexLocker(self._mutex):
@@ -75,17 +159,27 @@ class ImageProcessorBase(QObject):
     def on_new_image(self, image: numpy.ndarray) -> None:
         if not self._flag_enable:
             return
+        retain_for_receivers(self, "signal_input_image(PyObject)", image)
         self.signal_input_image.emit(image)
-        if self.process(image):
+        start = perf_counter_ns()
+        processed = self.process(image)
+        self._latency.add(self._name, perf_counter_ns() - start)
+        self._hold_processed_image()
+        if processed:
             self.signal_processed_done.emit()
             if self._processed_image is None:
                 return
+            retain_for_receivers(self, "signal_processed_image(PyObject)", self._processed_image)
             self.signal_processed_image.emit(self._processed_image)
             if self._next_processor is None:
                 return
-            if self._flag_transmit_context:
-                extra_context = self.collect_context_for_transmission()
-                self._next_processor.set_extra_context(**extra_context)
+            extra_context = self.collect_context_for_transmission() if self._flag_transmit_context else dict()
+            # the frame information always travels with the image
+            extra_context.update({FRAME_INFO: self._extra_context.get(FRAME_INFO, None)})
+            if self._next_processor.queued_input:
+                self._next_processor.enqueue_image(self._processed_image, extra_context)
+                return
+            self._next_processor.set_extra_context(**extra_context)
             self._next_processor.on_new_image(self._processed_image)
         # if self._flag_enable:
         #     self.signal_input_image.emit(image)
@@ -99,6 +193,12 @@ class ImageProcessorBase(QObject):
         #                     self._next_processor.set_extra_context(**extra_context)
         #                 self._next_processor.on_new_image(self._processed_image)
 
+    @Slot(object)
+    def on_new_frame(self, frame: Frame) -> None:
+        self._extra_context.update({FRAME_INFO: frame.info()})
+        self.on_new_image(frame.image)
+        self._extra_context.pop(FRAME_INFO, None)
+
     def set_extra_context(self, **kwargs) -> None:
         self._extra_context.update(kwargs)
 
@@ -129,6 +229,13 @@ class ImageProcessorBase(QObject):
         pass
 
     def stop_thread(self) -> None:
+        with QMutexLocker(self._input_queue_mutex):
+            # release the previous processor if it waits for the queue
+            self._flag_queued_input = False
+            for image, _ in self._input_queue:
+                FramePool.release(image)
+            self._input_queue.clear()
+            self._input_queue_not_full.wakeAll()
         if self._own_thread:
             self._thread.quit()
             self._thread.wait(1000)
@@ -8,13 +8,21 @@
 # Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
 #
 
-from .image_processor_base import ImageProcessorBase
-from PySide6.QtCore import Slot, QMutexLocker, QSettings
+from .image_processor_base import ImageProcessorBase, DEFAULT_INPUT_QUEUE_SIZE
+from laser_beam_measurements.camera_control.frame import FRAME_INFO
+from laser_beam_measurements.camera_control.frame_pool import FramePool
+from PySide6.QtCore import Signal, Slot, QMutexLocker, QSettings
+from time import perf_counter_ns
 import numpy
 
 
+LATENCY_REPORT_INTERVAL_NS = 1_000_000_000
+
+
 class ImageProcessorPipeline(ImageProcessorBase):
 
+    signal_latency_statistics_updated = Signal(dict)
+
     def __init__(self, *args, **kwargs):
         kwargs.update({"create_thread": True})
         super(ImageProcessorPipeline, self).__init__(*args, **kwargs)
@@ -22,6 +30,24 @@ class ImageProcessorPipeline(ImageProcessorBase):
         self._first_processor: ImageProcessorBase | None = None
         self._last_processor: ImageProcessorBase | None = None
         self._enable_add_processors: bool = True
+        self._flag_pipelined: bool = kwargs.get("pipelined", False)
+        self._queue_size: int = kwargs.get("queue_size", DEFAULT_INPUT_QUEUE_SIZE)
+        self._latency_report_interval_ns: int = LATENCY_REPORT_INTERVAL_NS
+        self._last_latency_report_ns: int = 0
+
+    @property
+    def pipelined(self) -> bool:
+        return self._flag_pipelined
+
+    def _attach_processor(self, processor: ImageProcessorBase) -> None:
+        # in the pipelined mode the first processor runs in the pipeline thread and every next one
+        # in its own thread, so they can not be children of the pipeline
+        if self._flag_pipelined and self._first_processor is not None:
+            processor.run_in_own_thread(self._queue_size)
+        else:
+            processor.moveToThread(self._thread)
+            if not self._flag_pipelined:
+                processor.setParent(self)
 
     def add_processor(self, processor: ImageProcessorBase | None) -> None:
         self.blockSignals(True)
@@ -30,21 +56,18 @@ class ImageProcessorPipeline(ImageProcessorBase):
                 self.blockSignals(False)
                 return
             if self._first_processor is None:
+                self._attach_processor(processor)
                 self._first_processor = processor
-                self._first_processor.moveToThread(self._thread)
-                self._first_processor.setParent(self)
                 self._first_processor.signal_processed_done.connect(self.set_processed_image)
             else:
                 if self._last_processor is None:
                     self._first_processor.signal_processed_done.disconnect(self.set_processed_image)
+                    self._attach_processor(processor)
                     self._last_processor = processor
-                    self._last_processor.moveToThread(self._thread)
-                    self._last_processor.setParent(self)
                     self._first_processor.set_next_processor(self._last_processor)
                     self._last_processor.signal_processed_done.connect(self.set_processed_image)
                 else:
-                    processor.moveToThread(self._thread)
-                    processor.setParent(self)
+                    self._attach_processor(processor)
                     self._last_processor.set_next_processor(processor)
                     self._last_processor.signal_processed_done.disconnect(self.set_processed_image)
                     self._last_processor = processor
@@ -53,18 +76,45 @@ class ImageProcessorPipeline(ImageProcessorBase):
 
     @Slot()
     def set_processed_image(self) -> None:
+        # the last processor may run in another thread, its result is taken with a hold under its mutex
         if self._last_processor is not None:
-            self._processed_image = self._last_processor.processed_image
+            image = self._last_processor.hold_processed_image()
+        elif self._first_processor is not None:
+            image = self._first_processor.hold_processed_image()
         else:
-            if self._first_processor is not None:
-                self._processed_image = self._first_processor.processed_image
+            return
+        with QMutexLocker(self._mutex):
+            FramePool.release(self._held_image)
+            self._processed_image = image
+            self._held_image = image
 
     def process(self, image: numpy.ndarray) -> bool | None:
         if self._first_processor is None:
             return False
+        self._first_processor.set_extra_context(**{FRAME_INFO: self._extra_context.get(FRAME_INFO, None)})
         self._first_processor.on_new_image(image)
+        now = perf_counter_ns()
+        if now - self._last_latency_report_ns >= self._latency_report_interval_ns:
+            self._last_latency_report_ns = now
+            self.signal_latency_statistics_updated.emit(self.get_latency_statistics())
         return True
 
+    def get_latency_statistics(self) -> dict:
+        statistics = self._latency.statistics()
+        processor = self._first_processor
+        while processor is not None:
+            statistics.update(processor.get_latency_statistics())
+            processor = processor.get_next_processor()
+        return statistics
+
+    @Slot()
+    def reset_latency_statistics(self) -> None:
+        self._latency.reset()
+        processor = self._first_processor
+        while processor is not None:
+            processor.reset_latency_statistics()
+            processor = processor.get_next_processor()
+
     @Slot(str, str, object)
     def set_processor_parameter_value(self, processor_name: str, parameter_name: str, value: object) -> None:
         processor = self._first_processor
@@ -73,7 +123,17 @@ class ImageProcessorPipeline(ImageProcessorBase):
                 processor.set_parameter_value(parameter_name, value)
             processor = processor.get_next_processor()
 
+    def stop_thread(self) -> None:
+        processor = self._first_processor
+        while processor is not None:
+            processor.stop_thread()
+            processor = processor.get_next_processor()
+        super(ImageProcessorPipeline, self).stop_thread()
+
     def save_settings(self, settings: QSettings) -> None:
+        settings.beginGroup(self._name)
+        settings.setValue("Pipelined", self._flag_pipelined)
+        settings.endGroup()
         processor = self._first_processor
         while processor is not None:
             processor.save_settings(settings)
@@ -8,14 +8,31 @@
 # Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
 #
 
-from PySide6.QtCore import QObject, Signal, Slot, QMutex, QMutexLocker, QThread
+from PySide6.QtCore import QObject, Signal, Slot, QMutex, QMutexLocker, QThread, QSettings
 import numpy
+from collections import deque
+from enum import StrEnum
 from .image_processor_base import ImageProcessorBase
+from laser_beam_measurements.camera_control.frame import Frame
+from laser_beam_measurements.camera_control.frame_pool import FramePool
+
+
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_DECIMATION = 2
+
+
+class SinkPolicy(StrEnum):
+    LATEST_ONLY = "latest only"
+    FIFO = "fifo"
+    EVERY_KTH = "every kth"
 
 
 class ImageProcessorSink(QObject):
 
     signal_on_new_image = Signal(numpy.ndarray)
+    signal_on_new_frame = Signal(object)
+    # received, processed, dropped
+    signal_statistics_updated = Signal(int, int, int)
 
     def __init__(self,
                  parent=None,
@@ -27,6 +44,15 @@ class ImageProcessorSink(QObject):
         self._processing_flag: bool = False
         self._image: numpy.ndarray | None = None
         self._image_processor: ImageProcessorBase | None = None
+        self._policy: SinkPolicy = SinkPolicy(kwargs.get("policy", SinkPolicy.LATEST_ONLY))
+        self._queue_size: int = kwargs.get("queue_size", DEFAULT_QUEUE_SIZE)
+        self._decimation: int = kwargs.get("decimation", DEFAULT_DECIMATION)
+        self._queue: deque[numpy.ndarray | Frame] = deque()
+        # the item given to the image processor, its hold is returned when the processing is done
+        self._processing_item: numpy.ndarray | Frame | None = None
+        self._received_counter: int = 0
+        self._processed_counter: int = 0
+        self._dropped_counter: int = 0
         if image_processor:
             self.set_image_processor(image_processor)
         if thread is not None and parent is None:
@@ -36,9 +62,42 @@ class ImageProcessorSink(QObject):
         if self._image_processor:
             self._image_processor.signal_processed_done.disconnect(self.stop_processing)
             self.signal_on_new_image.disconnect(self._image_processor.on_new_image)
+            self.signal_on_new_frame.disconnect(self._image_processor.on_new_frame)
         self._image_processor = image_processor
         self._image_processor.signal_processed_done.connect(self.stop_processing)
         self.signal_on_new_image.connect(self._image_processor.on_new_image)
+        self.signal_on_new_frame.connect(self._image_processor.on_new_frame)
+
+    @property
+    def policy(self) -> SinkPolicy:
+        with QMutexLocker(self._mutex):
+            return self._policy
+
+    @Slot(str)
+    def set_policy(self, policy: SinkPolicy | str, value: int | None = None) -> None:
+        # value is the queue size for the FIFO policy and the decimation factor for the every K-th policy
+        with QMutexLocker(self._mutex):
+            self._policy = SinkPolicy(policy)
+            if value is not None and value > 0:
+                if self._policy == SinkPolicy.FIFO:
+                    self._queue_size = int(value)
+                elif self._policy == SinkPolicy.EVERY_KTH:
+                    self._decimation = int(value)
+            self._dropped_counter += len(self._queue)
+            for item in self._queue:
+                _release(item)
+            self._queue.clear()
+
+    def get_statistics(self) -> tuple[int, int, int]:
+        with QMutexLocker(self._mutex):
+            return self._received_counter, self._processed_counter, self._dropped_counter
+
+    @Slot()
+    def reset_statistics(self) -> None:
+        with QMutexLocker(self._mutex):
+            self._received_counter = 0
+            self._processed_counter = 0
+            self._dropped_counter = 0
 
     def is_processing(self) -> bool:
         with QMutexLocker(self._mutex):
@@ -50,20 +109,84 @@ class ImageProcessorSink(QObject):
 
     @Slot()
     def stop_processing(self):
-        self._set_processing_flag(False)
+        with QMutexLocker(self._mutex):
+            self._processed_counter += 1
+            _release(self._processing_item)
+            item = self._queue.popleft() if self._queue else None
+            self._processing_item = item
+            self._processing_flag = item is not None
+            statistics = (self._received_counter, self._processed_counter, self._dropped_counter)
+        if item is not None:
+            self._emit(item)
+        self.signal_statistics_updated.emit(*statistics)
 
     def _set_processing_flag(self, value: bool) -> None:
         with QMutexLocker(self._mutex):
             self._processing_flag = value
 
+    def _accept(self, item: numpy.ndarray | Frame) -> bool:
+        self._received_counter += 1
+        if self._policy == SinkPolicy.EVERY_KTH and self._received_counter % max(self._decimation, 1) != 0:
+            self._dropped_counter += 1
+            _release(item)
+            return False
+        if not self._processing_flag:
+            self._processing_flag = True
+            self._processing_item = item
+            return True
+        if self._policy == SinkPolicy.FIFO and len(self._queue) < self._queue_size:
+            self._queue.append(item)
+        else:
+            self._dropped_counter += 1
+            _release(item)
+        return False
+
+    def _emit(self, item: numpy.ndarray | Frame) -> None:
+        if isinstance(item, Frame):
+            self._image = item.image
+            self.signal_on_new_frame.emit(item)
+        else:
+            self._image = item
+            self.signal_on_new_image.emit(item)
+
     @Slot(numpy.ndarray)
     def slot_new_image(self, image: numpy.ndarray) -> None:
         with QMutexLocker(self._mutex):
-            if not self._processing_flag:
-                self._image = image
-                self._processing_flag = True
-                self.signal_on_new_image.emit(self._image)
+            accepted = self._accept(image)
+        if accepted:
+            self._emit(image)
+
+    @Slot(object)
+    def slot_new_frame(self, frame: Frame) -> None:
+        with QMutexLocker(self._mutex):
+            accepted = self._accept(frame)
+        if accepted:
+            self._emit(frame)
 
     def get_image(self) -> numpy.ndarray:
         with QMutexLocker(self._mutex):
             return self._image
+
+    def save_settings(self, settings: QSettings) -> None:
+        settings.beginGroup("ImageProcessorSink")
+        settings.setValue("Policy", str(self._policy))
+        settings.setValue("QueueSize", self._queue_size)
+        settings.setValue("Decimation", self._decimation)
+        settings.endGroup()
+
+    def load_settings(self, settings: QSettings) -> None:
+        settings.beginGroup("ImageProcessorSink")
+        if settings.contains("QueueSize"):
+            self._queue_size = max(int(settings.value("QueueSize")), 1)
+        if settings.contains("Decimation"):
+            self._decimation = max(int(settings.value("Decimation")), 1)
+        if settings.contains("Policy"):
+            policy = str(settings.value("Policy"))
+            if policy in tuple(SinkPolicy):
+                self._policy = SinkPolicy(policy)
+        settings.endGroup()
+
+
+def _release(item: numpy.ndarray | Frame | None) -> None:
+    # the listener took a hold of the frame for the sink
+    FramePool.release(item.image if isinstance(item, Frame) else item)
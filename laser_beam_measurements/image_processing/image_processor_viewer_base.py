@@ -11,6 +11,7 @@
 from PySide6.QtCore import Slot, Signal, QSettings
 from PySide6.QtWidgets import QWidget
 from .image_processor_base import ImageProcessorBase
+from laser_beam_measurements.camera_control.frame_pool import FramePool
 from laser_beam_measurements.widgets.utils.custom_graphics_scene import CustomGraphicsScene
 from laser_beam_measurements.utils.colormap import COLORMAPS
 from laser_beam_measurements.utils.image_saver import ImageSaver
@@ -73,21 +74,30 @@ class ImageProcessorViewerBase(QWidget):
     def slot_show_input_image(self, input_image: numpy.ndarray) -> None:
         if self._flag_show_input_image:
             self._slot_show_input_image(input_image)
+        else:
+            # the processor took a hold of the image for this slot, the scene keeps it otherwise
+            FramePool.release(input_image)
 
     def _slot_show_input_image(self, input_image: numpy.ndarray) -> None:
         # raise NotImplementedError()
         if self._input_image_scene is not None:
             self._input_image_scene.update_image(input_image)
+        else:
+            FramePool.release(input_image)
 
     @Slot(numpy.ndarray)
     def slot_show_processed_image(self, input_image: numpy.ndarray) -> None:
         if self._flag_show_processed_image:
             self._slot_show_processed_image(input_image)
+        else:
+            FramePool.release(input_image)
 
     def _slot_show_processed_image(self, input_image: numpy.ndarray) -> None:
         # raise NotImplementedError()
         if self._output_image_scene is not None:
             self._output_image_scene.update_image(input_image)
+        else:
+            FramePool.release(input_image)
 
     @Slot(str)
     def slot_set_colormap_for_input(self, name: str) -> None:
@@ -0,0 +1,107 @@
+#
+# Project: laser_beam_measurements
+#
+# File: log_file.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2025 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+import json
+import os
+import numpy
+from enum import StrEnum
+from typing import Iterable, Optional
+
+
+__all__ = ["LogFormat", "LOG_FILE_EXTENSIONS", "make_binary_log_header", "rows_to_binary",
+           "load_binary_log", "read_binary_log_header", "export_binary_log_to_text"]
+
+
+class LogFormat(StrEnum):
+    BINARY = "binary"
+    TEXT = "text"
+
+
+LOG_FILE_EXTENSIONS: dict[LogFormat, str] = {
+    LogFormat.BINARY: ".lbmlog",
+    LogFormat.TEXT: ".txt"
+}
+
+# The binary log is a flat file: the magic, the header length as a little endian uint32, the JSON header
+# padded with spaces and the rows of little endian float64 values, one value per column. The data starts
+# at a multiple of DATA_ALIGNMENT bytes, so the file is mapped into memory as a (rows, columns) array and
+# every column is a view of it. The number of rows follows from the file size, so a log of a session that
+# was not closed properly is read up to its last complete row.
+BINARY_LOG_MAGIC = b"LBMLOG\x00\x01"
+BINARY_LOG_VERSION = 1
+BINARY_LOG_DTYPE = numpy.dtype("<f8")
+DATA_ALIGNMENT = 64
+EXPORT_CHUNK_ROWS = 65536
+
+
+def make_binary_log_header(columns: Iterable[str], **extra) -> bytes:
+    header = {"version": BINARY_LOG_VERSION, "dtype": BINARY_LOG_DTYPE.str, "columns": list(columns)}
+    header.update(extra)
+    text = json.dumps(header).encode("utf-8")
+    prefix_size = len(BINARY_LOG_MAGIC) + 4
+    padding = -(prefix_size + len(text) + 1) % DATA_ALIGNMENT
+    text += b" " * padding + b"\n"
+    return BINARY_LOG_MAGIC + len(text).to_bytes(4, "little") + text
+
+
+def rows_to_binary(rows: list[tuple]) -> bytes:
+    try:
+        values = numpy.array(rows, dtype=BINARY_LOG_DTYPE)
+    except (TypeError, ValueError):
+        # the values which are not numbers are stored as NaN
+        values = numpy.array([[_to_float(value) for value in row] for row in rows], dtype=BINARY_LOG_DTYPE)
+    return values.tobytes()
+
+
+def _to_float(value: object) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+def read_binary_log_header(filename: str) -> tuple[dict, int]:
+    # returns the header and the offset of the data
+    with open(filename, "rb") as file:
+        magic = file.read(len(BINARY_LOG_MAGIC))
+        if magic != BINARY_LOG_MAGIC:
+            raise ValueError(f"{filename} is not a binary parameter log")
+        header_size = int.from_bytes(file.read(4), "little")
+        header = json.loads(file.read(header_size).decode("utf-8"))
+    return header, len(BINARY_LOG_MAGIC) + 4 + header_size
+
+
+def load_binary_log(filename: str, columns: Optional[Iterable[str]] = None) -> dict[str, numpy.ndarray]:
+    # the columns are read-only views of the memory mapped file
+    header, offset = read_binary_log_header(filename)
+    names = header["columns"]
+    dtype = numpy.dtype(header.get("dtype", BINARY_LOG_DTYPE.str))
+    row_size = dtype.itemsize * len(names)
+    n_rows = max(os.path.getsize(filename) - offset, 0) // row_size if names else 0
+    if n_rows == 0:
+        data = numpy.empty((0, len(names)), dtype=dtype)
+    else:
+        data = numpy.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=(n_rows, len(names)))
+    selected = names if columns is None else [name for name in columns if name in names]
+    return {name: data[:, names.index(name)] for name in selected}
+
+
+def export_binary_log_to_text(filename: str, text_filename: str) -> int:
+    # writes the tab separated text log of the former format, returns the number of rows
+    header, _ = read_binary_log_header(filename)
+    columns = load_binary_log(filename)
+    names = header["columns"]
+    n_rows = len(columns[names[0]]) if names else 0
+    with open(text_filename, "w") as file:
+        file.write("\t".join(names) + "\n")
+        for start in range(0, n_rows, EXPORT_CHUNK_ROWS):
+            chunk = numpy.column_stack([columns[name][start:start + EXPORT_CHUNK_ROWS] for name in names])
+            file.write("\n".join(["\t".join([repr(float(value)) for value in row]) for row in chunk]) + "\n")
+    return n_rows
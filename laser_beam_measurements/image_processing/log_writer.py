@@ -0,0 +1,173 @@
+#
+# Project: laser_beam_measurements
+#
+# File: log_writer.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2025 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+from PySide6.QtCore import QThread, QMutex, QMutexLocker, QWaitCondition, Signal
+from collections import deque
+from time import monotonic
+from typing import Optional, Iterable, BinaryIO, TextIO
+from .log_file import LogFormat, make_binary_log_header, rows_to_binary
+
+
+__all__ = ["LogWriter"]
+
+
+DEFAULT_QUEUE_SIZE = 65536
+DEFAULT_FLUSH_ROWS = 1024
+DEFAULT_FLUSH_INTERVAL_MS = 1000
+# the backlog is reported when the queue is filled above this part
+BACKLOG_REPORT_LEVEL = 0.5
+WRITER_STOP_TIMEOUT = 10000
+
+
+class LogWriter(QThread):
+
+    # queued rows, dropped rows
+    signal_backlog_updated = Signal(int, int)
+    signal_error = Signal(str)
+
+    def __init__(self,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 flush_rows: int = DEFAULT_FLUSH_ROWS,
+                 flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS):
+        super(LogWriter, self).__init__()
+        # The rows are formatted and written in the writer thread as text lines or binary blocks. The file
+        # stays open while logging, the queued rows are written in one call and it is flushed after flush_rows
+        # rows or flush_interval_ms milliseconds. When the disk can not keep up the queue fills, the new
+        # rows are dropped rather than the logger waits, and the backlog is reported.
+        self._mutex: QMutex = QMutex()
+        self._condition: QWaitCondition = QWaitCondition()
+        self._queue: deque[tuple] = deque()
+        self._queue_size: int = max(int(queue_size), 1)
+        self._flush_rows: int = max(int(flush_rows), 1)
+        self._flush_interval_ms: int = max(int(flush_interval_ms), 1)
+        self._filename: Optional[str] = None
+        self._header: tuple[str, ...] = tuple()
+        self._format: LogFormat = LogFormat.TEXT
+        self._metadata: dict = dict()
+        self._flag_stop: bool = False
+        self._written_counter: int = 0
+        self._dropped_counter: int = 0
+        self._reported_dropped: int = 0
+        self._flag_backlog: bool = False
+
+    @property
+    def written(self) -> int:
+        with QMutexLocker(self._mutex):
+            return self._written_counter
+
+    @property
+    def dropped(self) -> int:
+        with QMutexLocker(self._mutex):
+            return self._dropped_counter
+
+    @property
+    def queued(self) -> int:
+        with QMutexLocker(self._mutex):
+            return len(self._queue)
+
+    def open(self,
+             filename: str,
+             header: Iterable[str],
+             log_format: LogFormat | str = LogFormat.TEXT,
+             metadata: Optional[dict] = None) -> None:
+        # the metadata is stored in the header of a binary log
+        if self.isRunning():
+            self.close()
+        with QMutexLocker(self._mutex):
+            self._filename = filename
+            self._header = tuple(header)
+            self._format = LogFormat(log_format)
+            self._metadata = dict(metadata or dict())
+            self._queue.clear()
+            self._flag_stop = False
+            self._written_counter = 0
+            self._dropped_counter = 0
+            self._reported_dropped = 0
+            self._flag_backlog = False
+        self.start()
+
+    def write_row(self, row: Iterable) -> bool:
+        with QMutexLocker(self._mutex):
+            if len(self._queue) >= self._queue_size:
+                self._dropped_counter += 1
+                return False
+            self._queue.append(tuple(row))
+            if len(self._queue) >= self._flush_rows:
+                self._condition.wakeOne()
+        return True
+
+    def close(self) -> None:
+        # the queued rows are written before the file is closed
+        with QMutexLocker(self._mutex):
+            self._flag_stop = True
+            self._condition.wakeOne()
+        self.wait(WRITER_STOP_TIMEOUT)
+
+    def run(self) -> None:
+        binary = self._format == LogFormat.BINARY
+        try:
+            # a binary log is a new file, an existing one is not overwritten
+            file = open(self._filename, 'xb' if binary else 'a')
+        except OSError as ex:
+            self.signal_error.emit(str(ex))
+            return
+        with file:
+            if binary:
+                written = self._write(file, make_binary_log_header(self._header, **self._metadata))
+            else:
+                written = self._write(file, "\t".join(self._header) + "\n")
+            if not written:
+                return
+            last_flush = monotonic()
+            while True:
+                with QMutexLocker(self._mutex):
+                    if not self._flag_stop and len(self._queue) < self._flush_rows:
+                        self._condition.wait(self._mutex, self._flush_interval_ms)
+                    rows = list(self._queue)
+                    self._queue.clear()
+                    stop = self._flag_stop
+                if rows:
+                    # the queued rows are written as one block
+                    block = rows_to_binary(rows) if binary else self._rows_to_text(rows)
+                    if not self._write(file, block):
+                        return
+                now = monotonic()
+                if stop or len(rows) >= self._flush_rows or (now - last_flush) * 1000 >= self._flush_interval_ms:
+                    file.flush()
+                    last_flush = now
+                    self._report_backlog()
+                with QMutexLocker(self._mutex):
+                    self._written_counter += len(rows)
+                if stop:
+                    return
+
+    @staticmethod
+    def _rows_to_text(rows: list[tuple]) -> str:
+        return "".join(["\t".join([str(value) for value in row]) + "\n" for row in rows])
+
+    def _write(self, file: BinaryIO | TextIO, block: bytes | str) -> bool:
+        try:
+            file.write(block)
+        except OSError as ex:
+            self.signal_error.emit(str(ex))
+            return False
+        return True
+
+    def _report_backlog(self) -> None:
+        with QMutexLocker(self._mutex):
+            queued = len(self._queue)
+            dropped = self._dropped_counter
+            backlog = queued >= BACKLOG_REPORT_LEVEL * self._queue_size
+            # the end of a backlog is reported once as well
+            report = backlog or self._flag_backlog or dropped != self._reported_dropped
+            self._flag_backlog = backlog
+            self._reported_dropped = dropped
+        if report:
+            self.signal_backlog_updated.emit(queued, dropped)
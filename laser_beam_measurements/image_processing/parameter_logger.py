@@ -8,13 +8,30 @@
 # Copyright 2025 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
 #
 
+import numpy
 from PySide6.QtCore import QObject, QThread, QCoreApplication, Signal, Slot, QMutex
 from typing import Dict, Tuple, Union, Optional, Iterable, Sized, List
-from time import time
+from laser_beam_measurements.camera_control.frame import FRAME_INFO, FrameField
+from .column_storage import ColumnStorage
+from .log_writer import LogWriter
+from .log_file import LogFormat, LOG_FILE_EXTENSIONS
+from time import time, monotonic
 from datetime import datetime
+import os
+from enum import StrEnum
 
 
-__all__ = ["ParameterLogger"]
+__all__ = ["ParameterLogger", "LoggingMode"]
+
+
+class LoggingMode(StrEnum):
+    # the current result is sampled by the timer
+    TIMER = "timer"
+    # every result of the beam profiler is logged once
+    EVERY_FRAME = "every frame"
+
+
+MAX_DECIMATION = 1000
 
 
 class ParameterLoggingStorage:
@@ -22,8 +39,10 @@ class ParameterLoggingStorage:
     def __init__(self, parameter_name: str, dim: int = 1):
         self._name: str = parameter_name
         self._dimension: int = dim
-        self._storage: dict[str, list] = dict()
         self._loggable_name: tuple = tuple()
+        # the values are kept in the columns of the common storage starting from the first column
+        self._columns: Optional[ColumnStorage] = None
+        self._first_column: int = 0
 
     @property
     def name(self) -> str:
@@ -34,8 +53,10 @@ class ParameterLoggingStorage:
         return self._loggable_name
 
     @property
-    def storage(self) -> dict:
-        return self._storage
+    def storage(self) -> dict[str, numpy.ndarray]:
+        if self._columns is None:
+            return dict()
+        return {name: self._columns.column(self._first_column + i) for i, name in enumerate(self._loggable_name)}
 
     def generate_loggable_names(self) -> None:
         if self._dimension == 1:
@@ -47,20 +68,21 @@ class ParameterLoggingStorage:
             for i in range(self._dimension):
                 names_list.append(f"{self._name}_{i}")
             self._loggable_name = tuple(names_list)
-        self._storage = {n: list() for n in self._loggable_name}
 
-    def add_value(self, data: dict) -> Optional[tuple]:
+    def set_columns(self, columns: ColumnStorage, first_column: int) -> None:
+        self._columns = columns
+        self._first_column = first_column
+
+    def get_values(self, data: dict) -> Optional[tuple]:
         if self._name in data.keys():
             param_value = data[self._name]
             if isinstance(param_value, (tuple, list)):
                 if len(self._loggable_name) != len(param_value):
                     return None
-                [self._storage[self._loggable_name[i]].append(param_value[i]) for i in range(len(param_value))]
                 return tuple(param_value)
             else:
                 if len(self._loggable_name) != 1:
                     return None
-                self._storage[self._loggable_name[0]].append(param_value)
                 return (param_value, )
         else:
             return None
@@ -90,21 +112,20 @@ class IntervalCalculator:
 class LoggingDataStorage:
 
     def __init__(self):
-        self._time: list[float] = list()
         self._data: list[ParameterLoggingStorage] = list()
-        self._counter: int = 0
-        self._data_to_write = list()
+        # the elapsed time and the values of all parameters, one row per sample
+        self._columns: ColumnStorage = ColumnStorage(1)
+        self._data_to_write: tuple = tuple()
         self._storage_to_show: Optional[ParameterLoggingStorage] = None
 
     def clear(self) -> None:
-        self._time.clear()
         self._storage_to_show = None
         self._data.clear()
-        self._counter = 0
-        self._data_to_write.clear()
+        self._columns = ColumnStorage(1)
+        self._data_to_write = tuple()
 
     @property
-    def data_to_write(self) -> list:
+    def data_to_write(self) -> tuple:
         return self._data_to_write
 
     @property
@@ -115,8 +136,8 @@ class LoggingDataStorage:
         return result
 
     @property
-    def logging_time(self) -> list:
-        return self._time
+    def logging_time(self) -> numpy.ndarray:
+        return self._columns.column(0)
 
     @property
     def storage_to_show(self) -> Optional[ParameterLoggingStorage]:
@@ -124,7 +145,7 @@ class LoggingDataStorage:
 
     @property
     def counter(self) -> int:
-        return self._counter
+        return self._columns.counter
 
     def prepare(self, selected_parameters: list, data: dict) -> None:
         for param in selected_parameters:
@@ -135,19 +156,21 @@ class LoggingDataStorage:
                 else:
                     self._data.append(ParameterLoggingStorage(param))
         [storage.generate_loggable_names() for storage in self._data]
+        self._columns = ColumnStorage(1 + len(self.parameter_names))
+        first_column = 1
+        for storage in self._data:
+            storage.set_columns(self._columns, first_column)
+            first_column += len(storage.loggable_names)
 
     def add_values(self, t: float, data: dict) -> bool:
-        self._data_to_write.clear()
-        self._time.append(t)
-        self._data_to_write.append(t)
+        row = [t]
         for storage in self._data:
-            added = storage.add_value(data)
-            if added is None:
+            values = storage.get_values(data)
+            if values is None:
                 return False
-            # if storage.add_value(data) is None:
-            #     return False
-            self._data_to_write = [*self._data_to_write, *added]
-        self._counter += 1
+            row.extend(values)
+        self._data_to_write = tuple(row)
+        self._columns.append(row)
         return True
 
     def set_storage_to_show(self, name: Optional[str] = None) -> True:
@@ -180,10 +203,15 @@ def adapt_data(data: Dict[str, Dict[str, Union[Tuple[float, float], float]]]) ->
 class ParameterLogger(QObject):
 
     signal_state_changed = Signal(bool)
-    signal_show_selected_parameter = Signal(str, list, dict)
+    # the kept history of the shown parameter, sent when it is selected
+    signal_show_selected_parameter = Signal(str, object, dict)
+    # the samples of the shown parameter logged since the last update
+    signal_append_selected_parameter = Signal(str, object, dict)
     signal_selected_parameters_updated = Signal(list)
     signal_available_parameters_updated = Signal(list)
     signal_timeout = Signal(int, float)
+    # queued and dropped rows of the file writer
+    signal_write_backlog_updated = Signal(int, int)
 
     MIN_TIMER_INTERVAL = 10
 
@@ -200,8 +228,20 @@ class ParameterLogger(QObject):
         self._filename: Optional[str] = ""
         # self._selected_parameter: Optional[str] = ""
         self._start_time: float = 0.0
+        self._start_monotonic_time: float = 0.0
         self._flag_show_parameters: bool = True
         self._flag_available: bool = True
+        self._log_format: LogFormat = LogFormat.BINARY
+        self._logging_mode: LoggingMode = LoggingMode.TIMER
+        # every decimation-th result is logged in the every frame mode
+        self._decimation: int = 1
+        self._received_counter: int = 0
+        self._shown_counter: int = 0
+        self._plotted_name: Optional[str] = None
+        self._plotted_counter: int = 0
+        self._writer: LogWriter = LogWriter()
+        self._writer.signal_backlog_updated.connect(self.signal_write_backlog_updated)
+        self._writer.signal_error.connect(self._slot_writer_error)
 
     @property
     def available(self) -> bool:
@@ -256,6 +296,39 @@ class ParameterLogger(QObject):
         if value > self.MIN_TIMER_INTERVAL:
             self._timer_interval = value
 
+    @property
+    def log_format(self) -> LogFormat:
+        return self._log_format
+
+    @Slot(str)
+    def set_log_format(self, log_format: LogFormat | str) -> None:
+        if self.is_active:
+            return
+        if log_format in tuple(LogFormat):
+            self._log_format = LogFormat(log_format)
+
+    @property
+    def logging_mode(self) -> LoggingMode:
+        return self._logging_mode
+
+    @Slot(str)
+    def set_logging_mode(self, mode: LoggingMode | str) -> None:
+        if self.is_active:
+            return
+        if mode in tuple(LoggingMode):
+            self._logging_mode = LoggingMode(mode)
+
+    @property
+    def decimation(self) -> int:
+        return self._decimation
+
+    @Slot(int)
+    def set_decimation(self, value: int) -> None:
+        if self.is_active:
+            return
+        if 0 < value <= MAX_DECIMATION:
+            self._decimation = int(value)
+
     @Slot(bool)
     def slot_change_state(self, state: bool) -> None:
         if state:
@@ -286,24 +359,42 @@ class ParameterLogger(QObject):
         if self._timer_id != -1:
             self.stop()
         self._start_time = time()
+        self._start_monotonic_time = monotonic()
         self._prepare_data_for_logging()
         self._prepare_file()
+        self._received_counter = 0
+        self._shown_counter = 0
+        self._plotted_name = None
+        # in the every frame mode the timer only updates the display
         self._timer_id = self.startTimer(self._timer_interval)
         self._interval_calculator.start()
         self.signal_state_changed.emit(True)
 
 
+    @Slot()
     def stop(self) -> None:
         if self._timer_id > 0:
             self.killTimer(self._timer_id)
             self._timer_id = -1
+            self._writer.close()
             self.signal_state_changed.emit(False)
 
+    @Slot(str)
+    def _slot_writer_error(self, message: str) -> None:
+        # the log can not be written anymore
+        self.stop()
+
     def timerEvent(self, *args, **kwargs) -> None:
         QCoreApplication.sendPostedEvents(self, 0)
-        self._save_data()
+        if self._logging_mode == LoggingMode.TIMER:
+            self._save_data()
         interval = self._interval_calculator.elapsed()
         counter = self._logging_data.counter
+        if self._logging_mode == LoggingMode.EVERY_FRAME:
+            # the mean interval between the results logged since the last update
+            new_counts = counter - self._shown_counter
+            interval = interval / new_counts if new_counts > 0 else 0.0
+        self._shown_counter = counter
         self.signal_timeout.emit(counter, interval)
         if self._flag_show_parameters:
             self._show_parameters()
@@ -312,29 +403,43 @@ class ParameterLogger(QObject):
     @Slot(dict)
     def slot_set_data(self, data: dict) -> None:
         self._current_data = data
+        if self._logging_mode != LoggingMode.EVERY_FRAME or not self.is_active:
+            return
+        self._received_counter += 1
+        if (self._received_counter - 1) % self._decimation == 0:
+            self._save_data()
 
     def _save_data(self) -> None:
         data = self._current_data.copy()
         data = adapt_data(data)
         # keys = data.keys()
-        current_time = time()
-        elapsed_time = current_time - self._start_time
+        frame_time = data.get(f"{FRAME_INFO}: {FrameField.TIMESTAMP}", None)
+        if self._logging_mode == LoggingMode.EVERY_FRAME and frame_time is not None:
+            # every result is stamped with the capture time of the frame it was calculated from, the timer
+            # mode samples the last result at the time of the timer
+            elapsed_time = frame_time - self._start_monotonic_time
+        else:
+            current_time = time()
+            elapsed_time = current_time - self._start_time
         result = self._logging_data.add_values(elapsed_time, data)
         if not result:
             self.stop()
             return
-        data_to_write = self._logging_data.data_to_write
         if self._filename is None:
             return
-        with open(self._filename, 'a') as file:
-            str_to_write = "\t".join([str(data) for data in data_to_write])
-            file.write(f"{str_to_write}\n")
+        # the row is formatted and written in the writer thread
+        self._writer.write_row(self._logging_data.data_to_write)
 
     def _prepare_data_for_logging(self) -> None:
         self._logging_data.clear()
         data = self._current_data.copy()
         data = adapt_data(data)
-        self._logging_data.prepare(self._selected_parameters, data)
+        selected_parameters = list(self._selected_parameters)
+        sequence = f"{FRAME_INFO}: {FrameField.SEQUENCE}"
+        if self._logging_mode == LoggingMode.EVERY_FRAME and sequence in data and sequence not in selected_parameters:
+            # the logged results are matched to the frames by their sequence numbers
+            selected_parameters.append(sequence)
+        self._logging_data.prepare(selected_parameters, data)
 
     @Slot(str)
     def set_filename(self, filename: str) -> None:
@@ -342,21 +447,39 @@ class ParameterLogger(QObject):
         self._validate_filename()
 
     def _validate_filename(self) -> None:
-        default_name: str = datetime.now().strftime('%Y_%m_%d__%H%M') + ".txt"
+        base_name: str = datetime.now().strftime('%Y_%m_%d__%H%M%S')
+        extension = LOG_FILE_EXTENSIONS[self._log_format]
         # if self._filename is None or (isinstance(self._filename, str) and len(self._filename) == 0):
         #     self._filename = default_name
+        # the log of an earlier session is never overwritten
+        default_name = base_name + extension
+        index = 1
+        while os.path.exists(default_name):
+            default_name = f"{base_name}_{index}{extension}"
+            index += 1
         self._filename = default_name
-        #TODO: check existence of the file
 
     def _prepare_file(self):
         self._validate_filename()
-        str_to_write: str = "Elapsed Time\t"
-        str_to_write += "\t".join(self._logging_data.parameter_names)
-        with open(self._filename, 'a') as file:
-            file.write(f"{str_to_write}\n")
+        self._writer.open(self._filename, ["Elapsed Time", *self._logging_data.parameter_names], self._log_format,
+                          {"start_time": datetime.fromtimestamp(self._start_time).isoformat()})
 
     def _show_parameters(self):
         storage = self._logging_data.storage_to_show
         if storage is None:
             return
-        self.signal_show_selected_parameter.emit(storage.name, self._logging_data.logging_time, storage.storage)
+        # the arrays are copied, the widget reads them in the GUI thread while the storage is written
+        counter = self._logging_data.counter
+        logging_time = self._logging_data.logging_time
+        if storage.name != self._plotted_name:
+            self._plotted_name = storage.name
+            self._plotted_counter = counter
+            self.signal_show_selected_parameter.emit(storage.name, logging_time.copy(),
+                                                     {k: v.copy() for k, v in storage.storage.items()})
+            return
+        new_counts = min(counter - self._plotted_counter, len(logging_time))
+        if new_counts <= 0:
+            return
+        self._plotted_counter = counter
+        self.signal_append_selected_parameter.emit(storage.name, logging_time[-new_counts:].copy(),
+                                                   {k: v[-new_counts:].copy() for k, v in storage.storage.items()})
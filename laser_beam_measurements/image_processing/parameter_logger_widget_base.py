@@ -8,6 +8,7 @@
 # Copyright 2025 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
 #
 
+import numpy
 from PySide6.QtCore import Signal, Slot
 from PySide6.QtWidgets import QWidget
 from pyqtgraph import disconnect
@@ -33,7 +34,9 @@ class ParameterLoggingWidgetBase(QWidget):
             self._logger.signal_state_changed.disconnect(self.slot_logger_state_changed)
             self._logger.signal_available_parameters_updated.disconnect(self.slot_show_available_parameters)
             self._logger.signal_show_selected_parameter.disconnect(self.slot_show_selected_parameter)
+            self._logger.signal_append_selected_parameter.disconnect(self.slot_append_selected_parameter)
             self._logger.signal_timeout.disconnect(self.slot_show_current_interval)
+            self._logger.signal_write_backlog_updated.disconnect(self.slot_show_write_backlog)
 
         self._logger = logger
         self.signal_change_state.connect(self._logger.slot_change_state)
@@ -41,7 +44,9 @@ class ParameterLoggingWidgetBase(QWidget):
         self._logger.signal_state_changed.connect(self.slot_logger_state_changed)
         self._logger.signal_available_parameters_updated.connect(self.slot_show_available_parameters)
         self._logger.signal_show_selected_parameter.connect(self.slot_show_selected_parameter)
+        self._logger.signal_append_selected_parameter.connect(self.slot_append_selected_parameter)
         self._logger.signal_timeout.connect(self.slot_show_current_interval)
+        self._logger.signal_write_backlog_updated.connect(self.slot_show_write_backlog)
         self._show_available_parameters(self._logger.available_parameters)
 
     @Slot(bool)
@@ -58,16 +63,42 @@ class ParameterLoggingWidgetBase(QWidget):
     def _show_available_parameters(self, parameters_list: list) -> None:
         raise NotImplementedError()
 
-    @Slot(str, list, dict)
-    def slot_show_selected_parameter(self, group_name: str, logging_time: list, parameters: dict[str, list]) -> None:
+    @Slot(str, object, dict)
+    def slot_show_selected_parameter(self,
+                                     group_name: str,
+                                     logging_time: numpy.ndarray,
+                                     parameters: dict[str, numpy.ndarray]) -> None:
         self._slot_show_selected_parameter(group_name, logging_time, parameters)
 
-    def _slot_show_selected_parameter(self, group_name: str, logging_time: list, parameters: dict[str, list]) -> None:
+    def _slot_show_selected_parameter(self,
+                                      group_name: str,
+                                      logging_time: numpy.ndarray,
+                                      parameters: dict[str, numpy.ndarray]) -> None:
         raise NotImplementedError
 
+    @Slot(str, object, dict)
+    def slot_append_selected_parameter(self,
+                                       group_name: str,
+                                       logging_time: numpy.ndarray,
+                                       parameters: dict[str, numpy.ndarray]) -> None:
+        self._append_selected_parameter(group_name, logging_time, parameters)
+
+    def _append_selected_parameter(self,
+                                   group_name: str,
+                                   logging_time: numpy.ndarray,
+                                   parameters: dict[str, numpy.ndarray]) -> None:
+        raise NotImplementedError()
+
     @Slot(int, float)
     def slot_show_current_interval(self, counter: int, interval: float) -> None:
         self._show_current_interval(counter, interval)
 
     def _show_current_interval(self, counter: int, interval: float) -> None:
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
+
+    @Slot(int, int)
+    def slot_show_write_backlog(self, queued: int, dropped: int) -> None:
+        self._show_write_backlog(queued, dropped)
+
+    def _show_write_backlog(self, queued: int, dropped: int) -> None:
+        raise NotImplementedError()
@@ -11,9 +11,41 @@
 
 import cv2
 import numpy
-from math import sqrt, pi, atan
+from math import sqrt, pi, atan, log
 from scipy.optimize import curve_fit
-from time import time
+from functools import lru_cache
+from enum import StrEnum
+from typing import Iterable
+
+
+def _widths_from_central_moments(
+        m00: float,
+        mu20: float,
+        mu02: float,
+        mu11: float,
+        with_rotation: bool = True) -> tuple[float, float, float]:
+    if with_rotation:
+        if (mu20 - mu02) > 0.0:
+            d_x = 2 * sqrt(2 / m00) * sqrt(mu20 + mu02 + sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11))
+            d_y = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 - sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11)))
+            angle = 1.0 / 2.0 * atan(2.0 * mu11 / (mu20 - mu02))
+        elif (mu20 - mu02) < 0.0:
+            d_x = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 - sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11)))
+            # d_x = 2 * sqrt(2 / m00) * sqrt(mu20 + mu02 - sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11))
+            d_y = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 + sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11)))
+            angle = 1.0 / 2.0 * atan(2.0 * mu11 / (mu20 - mu02))
+        else:
+            d_x = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 + sqrt(4 * mu11 * mu11)))
+            d_y = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 - sqrt(4 * mu11 * mu11)))
+            if mu11 == 0:
+                angle = 0.0
+            else:
+                angle = pi / 4 * numpy.sign(mu20)
+        return d_x, d_y, angle
+    else:
+        d_x = 4 * sqrt(abs(mu20) / m00)
+        d_y = 4 * sqrt(abs(mu02) / m00)
+        return d_x, d_y, 0.0
 
 
 def width_by_moments(image: numpy.ndarray, with_rotation: bool = True) -> tuple[float, float, float, float, float]:
@@ -23,33 +55,143 @@ def width_by_moments(image: numpy.ndarray, with_rotation: bool = True) -> tuple[
         h, w = image.shape
         return w/2, h/2, 0.0, 0.0, 0.0
     else:
-        mu20 = moment['mu20']
-        mu02 = moment['mu02']
-        mu11 = moment['mu11']
         center_of_mass_x = moment['m10'] / m00
         center_of_mass_y = moment['m01'] / m00
-        if with_rotation:
-            if (mu20 - mu02) > 0.0:
-                d_x = 2 * sqrt(2 / m00) * sqrt(mu20 + mu02 + sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11))
-                d_y = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 - sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11)))
-                angle = 1.0 / 2.0 * atan(2.0 * mu11 / (mu20 - mu02))
-            elif (mu20 - mu02) < 0.0:
-                d_x = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 - sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11)))
-                # d_x = 2 * sqrt(2 / m00) * sqrt(mu20 + mu02 - sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11))
-                d_y = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 + sqrt((mu20 - mu02) * (mu20 - mu02) + 4 * mu11 * mu11)))
-                angle = 1.0 / 2.0 * atan(2.0 * mu11 / (mu20 - mu02))
-            else:
-                d_x = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 + sqrt(4 * mu11 * mu11)))
-                d_y = 2 * sqrt(2 / m00) * sqrt(abs(mu20 + mu02 - sqrt(4 * mu11 * mu11)))
-                if mu11 == 0:
-                    angle = 0.0
-                else:
-                    angle = pi / 4 * numpy.sign(mu20)
-            return center_of_mass_x, center_of_mass_y, d_x, d_y, angle
-        else:
-            d_x = 4 * sqrt(mu20 / m00)
-            d_y = 4 * sqrt(mu02 / m00)
-            return center_of_mass_x, center_of_mass_y, d_x, d_y, 0.0
+        d_x, d_y, angle = _widths_from_central_moments(
+            m00, moment['mu20'], moment['mu02'], moment['mu11'], with_rotation)
+        return center_of_mass_x, center_of_mass_y, d_x, d_y, angle
+
+
+class _MomentIntegralTables:
+
+    def __init__(self, image: numpy.ndarray, window: tuple[int, int, int, int], total: float):
+        # the tables cover only the window of the integration areas, the sum over the whole frame is
+        # given for the background outside the area
+        h, w = image.shape
+        self._shape = (h, w)
+        self._total = total
+        x1, y1, x2, y2 = window
+        self._window = window
+        # coordinates are taken relative to the window center to limit cancellation in central moments
+        self._x0 = (x1 + x2 - 1) / 2.0
+        self._y0 = (y1 + y2 - 1) / 2.0
+        x = numpy.arange(x1, x2, dtype=numpy.float64) - self._x0
+        y = numpy.arange(y1, y2, dtype=numpy.float64) - self._y0
+        img = numpy.asarray(image[y1:y2, x1:x2], dtype=numpy.float64)
+        img_x = img * x[numpy.newaxis, :]
+        img_y = img * y[:, numpy.newaxis]
+        self._tables = tuple(
+            cv2.integral(table, sdepth=cv2.CV_64F) for table in (
+                img, img_x, img_y, img_x * x[numpy.newaxis, :], img_y * y[:, numpy.newaxis], img_x * y[:, numpy.newaxis]
+            )
+        )
+        self._x_sums = tuple(numpy.concatenate(((0.0, ), numpy.cumsum(x ** k))) for k in (1, 2))
+        self._y_sums = tuple(numpy.concatenate(((0.0, ), numpy.cumsum(y ** k))) for k in (1, 2))
+
+    @property
+    def window(self) -> tuple[int, int, int, int]:
+        return self._window
+
+    def contains(self, x1: int, y1: int, x2: int, y2: int) -> bool:
+        w_x1, w_y1, w_x2, w_y2 = self._window
+        return w_x1 <= x1 and w_y1 <= y1 and x2 <= w_x2 and y2 <= w_y2
+
+    def _area_sum(self, table: numpy.ndarray, x1: int, y1: int, x2: int, y2: int) -> float:
+        w_x1, w_y1, _, _ = self._window
+        x1, x2 = x1 - w_x1, x2 - w_x1
+        y1, y2 = y1 - w_y1, y2 - w_y1
+        return float(table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1])
+
+    def background(self, x1: int, y1: int, x2: int, y2: int) -> float:
+        h, w = self._shape
+        outside_count = h * w - (x2 - x1) * (y2 - y1)
+        if outside_count <= 0:
+            return 0.0
+        return (self._total - self._area_sum(self._tables[0], x1, y1, x2, y2)) / outside_count
+
+    def moments(
+            self,
+            x1: int, y1: int, x2: int, y2: int,
+            background: float = 0.0) -> tuple[float, float, float, float, float, float]:
+        m00, m10, m01, m20, m02, m11 = (self._area_sum(t, x1, y1, x2, y2) for t in self._tables)
+        if background != 0.0:
+            w_x1, w_y1, _, _ = self._window
+            n_x = x2 - x1
+            n_y = y2 - y1
+            s_x, s_xx = (float(c[x2 - w_x1] - c[x1 - w_x1]) for c in self._x_sums)
+            s_y, s_yy = (float(c[y2 - w_y1] - c[y1 - w_y1]) for c in self._y_sums)
+            m00 -= background * n_x * n_y
+            m10 -= background * s_x * n_y
+            m01 -= background * s_y * n_x
+            m20 -= background * s_xx * n_y
+            m02 -= background * s_yy * n_x
+            m11 -= background * s_x * s_y
+        if m00 <= 0.0:
+            return m00, 0.0, 0.0, 0.0, 0.0, 0.0
+        cx = m10 / m00
+        cy = m01 / m00
+        mu20 = m20 - cx * m10
+        mu02 = m02 - cy * m01
+        mu11 = m11 - cx * m01
+        return m00, cx + self._x0, cy + self._y0, mu20, mu02, mu11
+
+
+def width_by_moments_iso(
+        image: numpy.ndarray,
+        with_rotation: bool = True,
+        integration_factor: float = 3.0,
+        subtract_background: bool = True,
+        max_iterations: int = 20) -> tuple[float, float, float, float, float]:
+    h, w = image.shape
+    if h == 0 or w == 0:
+        return w/2, h/2, 0.0, 0.0, 0.0
+    moment = cv2.moments(image)
+    total = moment['m00']
+    if total <= 0.0:
+        return w/2, h/2, 0.0, 0.0, 0.0
+    area = (0, 0, w, h)
+    m00, mu20, mu02, mu11 = total, moment['mu20'], moment['mu02'], moment['mu11']
+    cx = moment['m10'] / total
+    cy = moment['m01'] / total
+    # the first integration area is estimated from the pixels above the half maximum, since
+    # the whole frame moments are dominated by the background and the iterations would stall there
+    _, max_value, _, _ = cv2.minMaxLoc(image)
+    half_max_moment = cv2.moments(cv2.compare(image, max_value / 2, cv2.CMP_GE), True)
+    if half_max_moment['m00'] > 0.0:
+        cx = half_max_moment['m10'] / half_max_moment['m00']
+        cy = half_max_moment['m01'] / half_max_moment['m00']
+        # radius of the half maximum area converted to the gaussian 1/e^2 radius (D4sigma / 2)
+        half_x = half_y = integration_factor * sqrt(half_max_moment['m00'] / pi) * sqrt(2 / log(2))
+    else:
+        half_x = integration_factor * 2 * sqrt(abs(mu20) / m00)
+        half_y = integration_factor * 2 * sqrt(abs(mu02) / m00)
+    tables = None
+    for _ in range(max_iterations):
+        new_area = (
+            min(max(int(round(cx - half_x)), 0), w - 1),
+            min(max(int(round(cy - half_y)), 0), h - 1),
+            max(min(int(round(cx + half_x)) + 1, w), 1),
+            max(min(int(round(cy + half_y)) + 1, h), 1)
+        )
+        if new_area == area:
+            break
+        if tables is None or not tables.contains(*new_area):
+            # the tables are built over the first area and again only when an area grows out of them
+            window = new_area if tables is None else (
+                min(new_area[0], tables.window[0]), min(new_area[1], tables.window[1]),
+                max(new_area[2], tables.window[2]), max(new_area[3], tables.window[3])
+            )
+            tables = _MomentIntegralTables(image, window, total)
+        background = tables.background(*new_area) if subtract_background else 0.0
+        moments = tables.moments(*new_area, background=background)
+        if moments[0] <= 0.0:
+            break
+        area = new_area
+        m00, cx, cy, mu20, mu02, mu11 = moments
+        half_x = integration_factor * 2 * sqrt(abs(mu20) / m00)
+        half_y = integration_factor * 2 * sqrt(abs(mu02) / m00)
+    d_x, d_y, angle = _widths_from_central_moments(m00, mu20, mu02, mu11, with_rotation)
+    return cx, cy, d_x, d_y, angle
 
 
 def _func_linear_interp(x1, x2, y1, y2, y):
@@ -90,30 +232,140 @@ def _func_gauss(x: numpy.ndarray, a: float, b: float, c: float) -> numpy.ndarray
     return 2*c/(pi*a*a)*numpy.exp(-2*(x - b) ** 2 / a ** 2)
 
 
-def width_by_gauss_approximation(img: numpy.ndarray, xx: numpy.ndarray, d0: float = None) -> tuple[float, numpy.ndarray]:
-    # x = numpy.arange(-len(img) / 2, len(img) / 2)
-    if d0 is not None:
-        p0 = (d0 / 2.0, 0.0, pi * d0 * d0 / 32.0)
-    else:
-        p0 = None
+class GaussFitMode(StrEnum):
+    FAST = "Fast"
+    ACCURATE = "Accurate"
+
+
+def _gauss_fit_residual(img: numpy.ndarray, model: numpy.ndarray) -> float:
+    max_value = float(numpy.max(img)) if len(img) > 0 else 0.0
+    if max_value <= 0.0:
+        return 0.0
+    return float(numpy.sqrt(numpy.mean((model - img) ** 2))) / max_value
+
+
+def _gauss_fit_log_parabola(
+        y: numpy.ndarray,
+        x: numpy.ndarray,
+        min_level: float) -> tuple[float, float, float] | None:
+    mask = y > min_level * numpy.max(y)
+    if numpy.count_nonzero(mask) < 3:
+        return None
+    y_m = y[mask]
+    x_m = x[mask]
+    x_shift = float(numpy.mean(x_m))
+    x_scale = float(numpy.std(x_m))
+    if x_scale <= 0.0:
+        return None
+    t = (x_m - x_shift) / x_scale
+    # weighting by y^2 suppresses the noisy logarithm of the wings (Caruana's algorithm)
+    w = y_m * y_m
+    a_matrix = numpy.stack((numpy.ones_like(t), t, t * t), axis=1)
+    lhs = a_matrix.T @ (a_matrix * w[:, None])
+    rhs = a_matrix.T @ (w * numpy.log(y_m))
+    try:
+        k0, k1, k2 = numpy.linalg.solve(lhs, rhs)
+    except numpy.linalg.LinAlgError:
+        return None
+    if k2 >= 0.0:
+        return None
+    radius = sqrt(-2.0 / k2) * x_scale
+    center = x_shift - k1 / (2.0 * k2) * x_scale
+    peak = float(numpy.exp(k0 - k1 * k1 / (4.0 * k2)))
+    return peak, center, radius
+
+
+def _gauss_newton_step(
+        y: numpy.ndarray,
+        x: numpy.ndarray,
+        peak: float,
+        center: float,
+        radius: float) -> tuple[float, float, float]:
+    dx = x - center
+    e = numpy.exp(-2.0 * dx * dx / (radius * radius))
+    f = peak * e
+    jacobian = numpy.stack((
+        e,
+        4.0 * f * dx / (radius * radius),
+        4.0 * f * dx * dx / (radius * radius * radius)), axis=1)
+    try:
+        delta = numpy.linalg.solve(jacobian.T @ jacobian, jacobian.T @ (y - f))
+    except numpy.linalg.LinAlgError:
+        return peak, center, radius
+    new_radius = radius + delta[2]
+    if new_radius <= 0.0:
+        return peak, center, radius
+    return peak + delta[0], center + delta[1], new_radius
+
+
+def gauss_fit_fast(
+        img: numpy.ndarray,
+        xx: numpy.ndarray,
+        p0: tuple[float, float, float] | None = None,
+        min_level: float = 0.05,
+        refine_steps: int = 1) -> tuple[float, float, float] | None:
+    y = numpy.asarray(img, dtype=numpy.float64)
+    x = numpy.asarray(xx, dtype=numpy.float64)
+    if p0 is not None and p0[0] > 0.0:
+        window = numpy.abs(x - p0[1]) < 2.0 * p0[0]
+        if numpy.count_nonzero(window) >= 3:
+            y = y[window]
+            x = x[window]
+    estimation = _gauss_fit_log_parabola(y, x, min_level)
+    if estimation is None:
+        return None
+    peak, center, radius = estimation
+    for _ in range(refine_steps):
+        peak, center, radius = _gauss_newton_step(y, x, peak, center, radius)
+    return float(radius), float(center), float(peak * pi * radius * radius / 2.0)
+
+
+def gauss_fit_accurate(
+        img: numpy.ndarray,
+        xx: numpy.ndarray,
+        p0: tuple[float, float, float] | None = None) -> tuple[float, float, float] | None:
     try:
-        # max_im = float(numpy.max(img))
-        # im = img / max_im if max_im > 0 else img
         res, _ = curve_fit(_func_gauss, xx, img, p0=p0, maxfev=100)
     except (RuntimeError, ValueError, RuntimeWarning):
-        if d0 is not None:
+        return None
+    return float(res[0]), float(res[1]), float(res[2])
+
+
+def gauss_approximation(
+        img: numpy.ndarray,
+        xx: numpy.ndarray,
+        p0: tuple[float, float, float] | None = None,
+        mode: GaussFitMode = GaussFitMode.ACCURATE) -> tuple[tuple[float, float, float], numpy.ndarray, float]:
+    if mode == GaussFitMode.FAST:
+        res = gauss_fit_fast(img, xx, p0)
+    else:
+        res = gauss_fit_accurate(img, xx, p0)
+    if res is None:
+        if p0 is not None:
             res = p0
         else:
             res = (img.shape[0] / 4, img.shape[0] / 2, 1.0)
-
     model = _func_gauss(xx, res[0], res[1], res[2])
+    return res, model, _gauss_fit_residual(img, model)
+
+
+def width_by_gauss_approximation(
+        img: numpy.ndarray,
+        xx: numpy.ndarray,
+        d0: float = None,
+        mode: GaussFitMode = GaussFitMode.ACCURATE) -> tuple[float, numpy.ndarray]:
+    if d0 is not None:
+        p0 = (d0 / 2.0, 0.0, pi * d0 * d0 / 32.0)
+    else:
+        p0 = None
+    res, model, _ = gauss_approximation(img, xx, p0, mode)
     d = abs(2 * res[0])
     return d, model
 
 
 def power_area(img: numpy.ndarray) -> tuple[float, float]:
     power = float(numpy.sum(img))
-    a = numpy.sum(img*img)
+    a = float(numpy.sum(numpy.square(img, dtype=numpy.float64)))
     if a <= 0:
         area = 0.0
     else:
@@ -121,43 +373,59 @@ def power_area(img: numpy.ndarray) -> tuple[float, float]:
     return power, area
 
 
-def width_by_power_level(
-            img: numpy.ndarray,
-            level: float = 0.86,
-            center=None,
-            power=None,
-            initial_radius=None) -> float:
-    if power is None:
-        power = float(numpy.sum(img))
+@lru_cache(maxsize=4)
+def _radial_bins(h: int, w: int, cx: float, cy: float, bin_width: float) -> tuple[numpy.ndarray, numpy.ndarray]:
+    yy, xx = numpy.ogrid[:h, :w]
+    dist_from_center = numpy.sqrt((xx - cx) ** 2 + (yy - cy) ** 2)
+    bins = numpy.floor(dist_from_center / bin_width).astype(numpy.int32).ravel()
+    radii = numpy.arange(0, int(bins.max()) + 2, dtype=numpy.float64) * bin_width
+    bins.flags.writeable = False
+    radii.flags.writeable = False
+    return bins, radii
+
+
+def encircled_power(
+        img: numpy.ndarray,
+        center: tuple[float, float] | None = None,
+        bin_width: float = 1.0) -> tuple[numpy.ndarray, numpy.ndarray]:
+    h, w = img.shape
     if center is None:
-        center = (int(img.shape[1] / 2), int(img.shape[0] / 2))
-    if initial_radius is None:
-        initial_radius = int(min(img.shape)/2)
+        center = (int(w / 2), int(h / 2))
+    bins, radii = _radial_bins(h, w, float(center[0]), float(center[1]), float(bin_width))
+    ring_power = numpy.bincount(bins, weights=img.ravel(), minlength=len(radii) - 1)
+    cumulative_power = numpy.empty(len(radii), dtype=numpy.float64)
+    cumulative_power[0] = 0.0
+    numpy.cumsum(ring_power, out=cumulative_power[1:])
+    return radii, cumulative_power
+
 
+def width_by_power_levels(
+        img: numpy.ndarray,
+        levels: Iterable[float] | numpy.ndarray,
+        center: tuple[float, float] | None = None,
+        power: float | None = None,
+        bin_width: float = 1.0) -> numpy.ndarray:
+    levels = numpy.asarray(levels, dtype=numpy.float64)
+    if img.size == 0:
+        return numpy.zeros_like(levels)
+    radii, cumulative_power = encircled_power(img, center, bin_width)
+    if power is None:
+        power = float(cumulative_power[-1])
     if power <= 1.0:
-        return 0.0
+        return numpy.zeros_like(levels)
+    aim_power = levels * power
+    index = numpy.clip(numpy.searchsorted(cumulative_power, aim_power), 1, len(cumulative_power) - 1)
+    p0 = cumulative_power[index - 1]
+    p1 = cumulative_power[index]
+    dp = p1 - p0
+    fraction = numpy.divide(aim_power - p0, dp, out=numpy.zeros_like(aim_power), where=dp > 0)
+    radius = radii[index - 1] + numpy.clip(fraction, 0.0, 1.0) * (radii[index] - radii[index - 1])
+    return 2 * radius
 
-    h, w = img.shape
-    yy, xx = numpy.ogrid[:h, :w]
-    dist_from_center = numpy.sqrt((xx - center[0]) ** 2 + (yy - center[1]) ** 2)
-    res_power = 0.0
-    aim_power_range = (0.99 * level * power, 1.01 * level * power)
-    radius = initial_radius
-    t0 = time()
-    while res_power < aim_power_range[0] or res_power > aim_power_range[1]:
-        im_ = img.copy()
-        numpy.place(im_, dist_from_center >= radius, 0)
-        res_power = float(numpy.sum(im_))
-        if 1.0 < res_power/aim_power_range[0] < 1.05:
-            radius -= radius*0.02
-        elif 0.95 < res_power / aim_power_range[1] < 1.0:
-            radius += radius*0.02
 
-        else:
-            if res_power > aim_power_range[1]:
-                radius -= radius*0.1
-            elif res_power < aim_power_range[0]:
-                radius += radius*0.1
-        if time() - t0 > 0.1:
-            break
-    return 2*radius
+def width_by_power_level(
+            img: numpy.ndarray,
+            level: float = 0.86,
+            center=None,
+            power=None) -> float:
+    return float(width_by_power_levels(img, (level, ), center, power)[0])
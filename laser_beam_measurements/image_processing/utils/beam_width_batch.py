@@ -0,0 +1,286 @@
+#
+# Project: laser_beam_measurements
+#
+# File: beam_width_batch.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+
+import numpy
+from functools import lru_cache
+from math import pi
+from typing import Iterable
+
+
+MOMENTS_DTYPE = numpy.dtype([
+    ('cx', numpy.float64),
+    ('cy', numpy.float64),
+    ('dx', numpy.float64),
+    ('dy', numpy.float64),
+    ('angle', numpy.float64)
+])
+
+POWER_AREA_DTYPE = numpy.dtype([
+    ('power', numpy.float64),
+    ('area', numpy.float64)
+])
+
+GAUSS_FIT_DTYPE = numpy.dtype([
+    ('radius', numpy.float64),
+    ('center', numpy.float64),
+    ('amplitude', numpy.float64),
+    ('residual', numpy.float64)
+])
+
+# the frames are processed in chunks whose temporary arrays take at most this number of bytes, a frame
+# which alone does not fit is processed alone
+DEFAULT_CHUNK_BYTES = 64 << 20
+
+
+def frames_per_chunk(frame_shape: tuple[int, ...], itemsize: int, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> int:
+    # itemsize is the number of bytes per pixel of the temporaries made for a chunk
+    frame_bytes = max(int(numpy.prod(frame_shape)), 1) * max(int(itemsize), 1)
+    return max(int(chunk_bytes) // frame_bytes, 1)
+
+
+def _check_stack(images: numpy.ndarray, ndim: int) -> numpy.ndarray:
+    images = numpy.asarray(images)
+    if images.ndim == ndim - 1:
+        images = images[numpy.newaxis]
+    if images.ndim != ndim:
+        raise ValueError(f"Expected an array with {ndim} dimensions, got {images.ndim}")
+    return images
+
+
+def width_by_moments_batch(
+        images: numpy.ndarray,
+        with_rotation: bool = True,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> numpy.ndarray:
+    images = _check_stack(images, 3)
+    n, h, w = images.shape
+    # every chunk is converted to float64
+    chunk_size = frames_per_chunk((h, w), numpy.dtype(numpy.float64).itemsize, chunk_bytes)
+    x = numpy.arange(w, dtype=numpy.float64)
+    y = numpy.arange(h, dtype=numpy.float64)
+    m00 = numpy.empty(n)
+    m10 = numpy.empty(n)
+    m01 = numpy.empty(n)
+    m20 = numpy.empty(n)
+    m02 = numpy.empty(n)
+    m11 = numpy.empty(n)
+    for start in range(0, n, chunk_size):
+        chunk = images[start:start + chunk_size].astype(numpy.float64)
+        p_x = chunk.sum(axis=1)
+        p_y = chunk.sum(axis=2)
+        s = slice(start, start + len(chunk))
+        m00[s] = p_x.sum(axis=1)
+        m10[s] = p_x @ x
+        m01[s] = p_y @ y
+        m20[s] = p_x @ (x * x)
+        m02[s] = p_y @ (y * y)
+        m11[s] = (chunk @ x) @ y
+
+    result = numpy.zeros(n, dtype=MOMENTS_DTYPE)
+    result['cx'] = w / 2
+    result['cy'] = h / 2
+    valid = m00 != 0.0
+    if not numpy.any(valid):
+        return result
+    m00 = m00[valid]
+    cx = m10[valid] / m00
+    cy = m01[valid] / m00
+    mu20 = m20[valid] - cx * m10[valid]
+    mu02 = m02[valid] - cy * m01[valid]
+    mu11 = m11[valid] - cx * m01[valid]
+    result['cx'][valid] = cx
+    result['cy'][valid] = cy
+    if with_rotation:
+        diff = mu20 - mu02
+        disc = numpy.sqrt(diff * diff + 4 * mu11 * mu11)
+        major = numpy.sqrt(numpy.abs(mu20 + mu02 + disc))
+        minor = numpy.sqrt(numpy.abs(mu20 + mu02 - disc))
+        scale = 2 * numpy.sqrt(2 / m00)
+        result['dx'][valid] = scale * numpy.where(diff >= 0.0, major, minor)
+        result['dy'][valid] = scale * numpy.where(diff >= 0.0, minor, major)
+        safe_diff = numpy.where(diff != 0.0, diff, 1.0)
+        angle = numpy.where(
+            diff != 0.0,
+            0.5 * numpy.arctan(2.0 * mu11 / safe_diff),
+            numpy.where(mu11 == 0.0, 0.0, pi / 4 * numpy.sign(mu20)))
+        result['angle'][valid] = angle
+    else:
+        result['dx'][valid] = 4 * numpy.sqrt(numpy.abs(mu20) / m00)
+        result['dy'][valid] = 4 * numpy.sqrt(numpy.abs(mu02) / m00)
+    return result
+
+
+def power_area_batch(images: numpy.ndarray, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> numpy.ndarray:
+    images = _check_stack(images, 3)
+    n = images.shape[0]
+    chunk_size = frames_per_chunk(images.shape[1:], numpy.dtype(numpy.float64).itemsize, chunk_bytes)
+    result = numpy.zeros(n, dtype=POWER_AREA_DTYPE)
+    for start in range(0, n, chunk_size):
+        chunk = images[start:start + chunk_size].reshape(-1, images.shape[1] * images.shape[2])
+        chunk = chunk.astype(numpy.float64)
+        s = slice(start, start + len(chunk))
+        result['power'][s] = chunk.sum(axis=1)
+        result['area'][s] = numpy.einsum('ij,ij->i', chunk, chunk)
+    a = result['area']
+    result['area'] = numpy.divide(result['power'] ** 2, a, out=numpy.zeros_like(a), where=a > 0)
+    return result
+
+
+@lru_cache(maxsize=4)
+def _radial_order(h: int, w: int, cx: float, cy: float, bin_width: float) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    yy, xx = numpy.ogrid[:h, :w]
+    dist_from_center = numpy.sqrt((xx - cx) ** 2 + (yy - cy) ** 2)
+    bins = numpy.floor(dist_from_center / bin_width).astype(numpy.int32).ravel()
+    order = numpy.argsort(bins, kind='stable')
+    unique_bins, starts = numpy.unique(bins[order], return_index=True)
+    radii = numpy.concatenate(((0.0, ), (unique_bins + 1) * bin_width))
+    for array in (order, starts, radii):
+        array.flags.writeable = False
+    return order, starts, radii
+
+
+def encircled_power_batch(
+        images: numpy.ndarray,
+        center: tuple[float, float] | None = None,
+        bin_width: float = 1.0,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> tuple[numpy.ndarray, numpy.ndarray]:
+    images = _check_stack(images, 3)
+    n, h, w = images.shape
+    # the pixels of every chunk are copied in the radial order
+    chunk_size = frames_per_chunk((h, w), images.itemsize, chunk_bytes)
+    if center is None:
+        center = (int(w / 2), int(h / 2))
+    order, starts, radii = _radial_order(h, w, float(center[0]), float(center[1]), float(bin_width))
+    cumulative_power = numpy.zeros((n, len(radii)), dtype=numpy.float64)
+    flat = images.reshape(n, h * w)
+    for start in range(0, n, chunk_size):
+        ring_power = numpy.add.reduceat(flat[start:start + chunk_size, order], starts, axis=1, dtype=numpy.float64)
+        numpy.cumsum(ring_power, axis=1, out=cumulative_power[start:start + chunk_size, 1:])
+    return radii, cumulative_power
+
+
+def width_by_power_levels_batch(
+        images: numpy.ndarray,
+        levels: Iterable[float] | numpy.ndarray,
+        center: tuple[float, float] | None = None,
+        power: numpy.ndarray | None = None,
+        bin_width: float = 1.0,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> numpy.ndarray:
+    levels = numpy.asarray(levels, dtype=numpy.float64)
+    images = _check_stack(images, 3)
+    if images.shape[1] == 0 or images.shape[2] == 0:
+        return numpy.zeros((images.shape[0], len(levels)))
+    radii, cumulative_power = encircled_power_batch(images, center, bin_width, chunk_bytes)
+    if power is None:
+        power = cumulative_power[:, -1]
+    power = numpy.asarray(power, dtype=numpy.float64)
+    aim_power = power[:, numpy.newaxis] * levels[numpy.newaxis, :]
+    index = numpy.count_nonzero(cumulative_power[:, numpy.newaxis, :] < aim_power[:, :, numpy.newaxis], axis=2)
+    index = numpy.clip(index, 1, len(radii) - 1)
+    p0 = numpy.take_along_axis(cumulative_power, index - 1, axis=1)
+    p1 = numpy.take_along_axis(cumulative_power, index, axis=1)
+    dp = p1 - p0
+    fraction = numpy.divide(aim_power - p0, dp, out=numpy.zeros_like(aim_power), where=dp > 0)
+    radius = radii[index - 1] + numpy.clip(fraction, 0.0, 1.0) * (radii[index] - radii[index - 1])
+    radius[power <= 1.0] = 0.0
+    return 2 * radius
+
+
+def width_by_level_batch(profiles: numpy.ndarray, level: float = 0.135) -> numpy.ndarray:
+    profiles = _check_stack(profiles, 2).astype(numpy.float64)
+    n, length = profiles.shape
+    if length == 0:
+        return numpy.zeros(n)
+    rows = numpy.arange(n)
+    aim = numpy.max(profiles, axis=1) * level
+    above = profiles >= aim[:, numpy.newaxis]
+    first = numpy.argmax(above, axis=1)
+    last = length - 1 - numpy.argmax(above[:, ::-1], axis=1)
+
+    left = first.astype(numpy.float64)
+    inner = first > 0
+    y1 = profiles[rows, numpy.maximum(first - 1, 0)]
+    y2 = profiles[rows, first]
+    dy = y2 - y1
+    shift = numpy.divide(aim - y1, dy, out=numpy.zeros(n), where=dy != 0)
+    left[inner] = (first - 1 + shift)[inner]
+
+    right = last.astype(numpy.float64)
+    inner = last < length - 1
+    y1 = profiles[rows, last]
+    y2 = profiles[rows, numpy.minimum(last + 1, length - 1)]
+    dy = y2 - y1
+    shift = numpy.divide(aim - y1, dy, out=numpy.zeros(n), where=dy != 0)
+    right[inner] = (last + shift)[inner]
+    return right - left
+
+
+def gauss_fit_fast_batch(
+        profiles: numpy.ndarray,
+        xx: numpy.ndarray,
+        min_level: float = 0.05,
+        refine_steps: int = 1) -> numpy.ndarray:
+    y = _check_stack(profiles, 2).astype(numpy.float64)
+    x = numpy.asarray(xx, dtype=numpy.float64)
+    n = y.shape[0]
+    result = numpy.full(n, numpy.nan, dtype=GAUSS_FIT_DTYPE)
+    if y.shape[1] < 3:
+        return result
+    max_value = numpy.max(y, axis=1)
+    mask = y > min_level * max_value[:, numpy.newaxis]
+    x_shift = float(numpy.mean(x))
+    x_scale = float(numpy.std(x))
+    if x_scale <= 0.0:
+        return result
+    t = (x - x_shift) / x_scale
+    w = numpy.where(mask, y * y, 0.0)
+    log_y = numpy.log(numpy.where(mask, y, 1.0))
+    powers = numpy.stack((numpy.ones_like(t), t, t * t))
+    lhs = numpy.einsum('il,jl,nl->nij', powers, powers, w)
+    rhs = numpy.einsum('il,nl->ni', powers, w * log_y)
+    valid = numpy.count_nonzero(mask, axis=1) >= 3
+    valid &= numpy.abs(numpy.linalg.det(lhs)) > 0.0
+    k = numpy.zeros((n, 3))
+    if numpy.any(valid):
+        k[valid] = numpy.linalg.solve(lhs[valid], rhs[valid][:, :, numpy.newaxis])[:, :, 0]
+    valid &= k[:, 2] < 0.0
+    k2 = numpy.where(valid, k[:, 2], -1.0)
+    radius = numpy.sqrt(-2.0 / k2) * x_scale
+    center = x_shift - k[:, 1] / (2.0 * k2) * x_scale
+    peak = numpy.exp(numpy.where(valid, k[:, 0] - k[:, 1] ** 2 / (4.0 * k2), 0.0))
+
+    for _ in range(refine_steps):
+        dx = x[numpy.newaxis, :] - center[:, numpy.newaxis]
+        r2 = (radius * radius)[:, numpy.newaxis]
+        e = numpy.exp(-2.0 * dx * dx / r2)
+        f = peak[:, numpy.newaxis] * e
+        jacobian = numpy.stack((e, 4.0 * f * dx / r2, 4.0 * f * dx * dx / (r2 * radius[:, numpy.newaxis])), axis=2)
+        jtj = numpy.einsum('nli,nlj->nij', jacobian, jacobian)
+        jtr = numpy.einsum('nli,nl->ni', jacobian, y - f)
+        step_valid = valid & (numpy.abs(numpy.linalg.det(jtj)) > 0.0)
+        if not numpy.any(step_valid):
+            break
+        delta = numpy.zeros((n, 3))
+        delta[step_valid] = numpy.linalg.solve(jtj[step_valid], jtr[step_valid][:, :, numpy.newaxis])[:, :, 0]
+        step_valid &= radius + delta[:, 2] > 0.0
+        peak = numpy.where(step_valid, peak + delta[:, 0], peak)
+        center = numpy.where(step_valid, center + delta[:, 1], center)
+        radius = numpy.where(step_valid, radius + delta[:, 2], radius)
+
+    dx = x[numpy.newaxis, :] - center[:, numpy.newaxis]
+    model = peak[:, numpy.newaxis] * numpy.exp(-2.0 * dx * dx / (radius * radius)[:, numpy.newaxis])
+    rms = numpy.sqrt(numpy.mean((model - y) ** 2, axis=1))
+    residual = numpy.divide(rms, max_value, out=numpy.zeros(n), where=max_value > 0)
+
+    result['radius'][valid] = radius[valid]
+    result['center'][valid] = center[valid]
+    result['amplitude'][valid] = (peak * pi * radius * radius / 2.0)[valid]
+    result['residual'][valid] = residual[valid]
+    return result
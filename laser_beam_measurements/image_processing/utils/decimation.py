@@ -0,0 +1,159 @@
+#
+# Project: laser_beam_measurements
+#
+# File: decimation.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2025 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+
+import numpy
+from laser_beam_measurements.image_processing.column_storage import ColumnStorage
+
+
+# every level keeps the last 2**16 entries, an entry of a level summarises REDUCTION_FACTOR entries of the
+# level below, so eight levels cover more than 10**11 samples
+DEFAULT_LEVEL_CAPACITY = 1 << 16
+REDUCTION_FACTOR = 8
+MAX_LEVELS = 8
+# the samples are drawn as they are while there are not more than this number per pixel
+RAW_POINTS_PER_PIXEL = 2
+
+
+class MinMaxPyramid:
+
+    def __init__(self, columns: int, level_capacity: int = DEFAULT_LEVEL_CAPACITY):
+        # An entry of every level is the first and the last x of its samples and the minimum and the
+        # maximum of every column over them, an entry of the first level is one sample. The entries of a
+        # level which are not summarised in the next level yet are pending. A view is rendered from the
+        # finest level which covers the range with a bounded number of entries, so its cost does not
+        # depend on the number of the samples.
+        self._columns: int = max(int(columns), 1)
+        self._level_capacity: int = max(int(level_capacity), 2 * REDUCTION_FACTOR)
+        self._levels: list[ColumnStorage] = list()
+        self._pending: list[int] = list()
+        self.clear()
+
+    @property
+    def columns(self) -> int:
+        return self._columns
+
+    @property
+    def counter(self) -> int:
+        return self._levels[0].counter
+
+    @property
+    def levels(self) -> int:
+        return len(self._levels)
+
+    def x_range(self) -> tuple[float, float] | None:
+        # the range of the kept samples
+        top = self._levels[-1].rows
+        last = self._levels[0].rows
+        if len(last) == 0:
+            return None
+        first = top[0, 0] if len(top) > 0 else last[0, 0]
+        return float(first), float(last[-1, 1])
+
+    def clear(self) -> None:
+        self._levels = [self._new_level()]
+        self._pending = [0]
+
+    def append(self, x: numpy.ndarray, y: numpy.ndarray) -> None:
+        x = numpy.asarray(x, dtype=numpy.float64).reshape(-1)
+        y = numpy.asarray(y, dtype=numpy.float64).reshape(len(x), self._columns)
+        # the pending entries of a level must stay in its ring until they are summarised
+        step = self._level_capacity // 2
+        for start in range(0, len(x), step):
+            xs, ys = x[start:start + step], y[start:start + step]
+            self._levels[0].extend(numpy.column_stack((xs, xs, ys, ys)))
+            self._pending[0] += len(xs)
+            self._reduce()
+
+    def _reduce(self) -> None:
+        n = self._columns
+        for level in range(MAX_LEVELS - 1):
+            groups = self._pending[level] // REDUCTION_FACTOR
+            if groups == 0:
+                return
+            if level + 1 == len(self._levels):
+                self._levels.append(self._new_level())
+                self._pending.append(0)
+            rows = self._levels[level].rows
+            start = len(rows) - self._pending[level]
+            block = rows[start:start + groups * REDUCTION_FACTOR].reshape(groups, REDUCTION_FACTOR, -1)
+            # fmin and fmax skip the NaN values of the samples which were not numbers
+            self._levels[level + 1].extend(numpy.column_stack((
+                block[:, 0, 0],
+                block[:, -1, 1],
+                numpy.fmin.reduce(block[:, :, 2:2 + n], axis=1),
+                numpy.fmax.reduce(block[:, :, 2 + n:], axis=1)
+            )))
+            self._pending[level] -= groups * REDUCTION_FACTOR
+            self._pending[level + 1] += groups
+
+    def view(self, x_min: float, x_max: float, width: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+        # returns x and the values of the columns, shape (points, columns), of the decimated range
+        width = max(int(width), 1)
+        entries, level = self._select_entries(x_min, x_max, width)
+        n = self._columns
+        if level == 0 and len(entries) <= RAW_POINTS_PER_PIXEL * width:
+            return entries[:, 0], entries[:, 2:2 + n]
+        if len(entries) > width:
+            entries = self._bin_entries(entries, x_min, x_max, width)
+        # every entry is drawn as a vertical segment from its minimum to its maximum
+        x = numpy.repeat(entries[:, 0], 2)
+        x[1::2] = entries[:, 1]
+        y = numpy.empty((2 * len(entries), n), dtype=numpy.float64)
+        y[0::2] = entries[:, 2:2 + n]
+        y[1::2] = entries[:, 2 + n:]
+        return x, y
+
+    def _select_entries(self, x_min: float, x_max: float, width: int) -> tuple[numpy.ndarray, int]:
+        # one level coarser has REDUCTION_FACTOR times less entries, so the chosen level has at least
+        # RAW_POINTS_PER_PIXEL entries per pixel unless it is the first level
+        max_entries = REDUCTION_FACTOR * RAW_POINTS_PER_PIXEL * width
+        for level in range(len(self._levels)):
+            storage = self._levels[level]
+            rows = storage.rows
+            covered = storage.counter == storage.size or (len(rows) > 0 and rows[0, 0] <= x_min)
+            if not covered and level + 1 < len(self._levels):
+                continue
+            first = max(int(numpy.searchsorted(rows[:, 1], x_min, side="left")) - 1, 0)
+            last = min(int(numpy.searchsorted(rows[:, 0], x_max, side="right")) + 1, len(rows))
+            if last - first > max_entries and level + 1 < len(self._levels):
+                continue
+            return self._entries_with_pending(level, rows[first:last], x_max), level
+        return numpy.empty((0, 2 + 2 * self._columns), dtype=numpy.float64), 0
+
+    def _entries_with_pending(self, level: int, entries: numpy.ndarray, x_max: float) -> numpy.ndarray:
+        # the newest samples are only in the pending entries of the finer levels
+        parts = [entries]
+        for finer in reversed(range(level)):
+            rows = self._levels[finer].rows
+            pending = rows[len(rows) - self._pending[finer]:]
+            parts.append(pending[pending[:, 0] <= x_max])
+        if len(parts) == 1:
+            return entries
+        return numpy.concatenate(parts)
+
+    def _bin_entries(self, entries: numpy.ndarray, x_min: float, x_max: float, width: int) -> numpy.ndarray:
+        # the entries are merged to one entry per pixel
+        n = self._columns
+        edges = numpy.linspace(x_min, x_max, width + 1)
+        starts = numpy.unique(numpy.searchsorted(entries[:, 0], edges[:-1], side="left"))
+        starts = starts[starts < len(entries)]
+        if len(starts) == 0 or starts[0] != 0:
+            starts = numpy.concatenate(([0], starts))
+        ends = numpy.append(starts[1:], len(entries)) - 1
+        return numpy.column_stack((
+            entries[starts, 0],
+            entries[ends, 1],
+            numpy.fmin.reduceat(entries[:, 2:2 + n], starts, axis=0),
+            numpy.fmax.reduceat(entries[:, 2 + n:], starts, axis=0)
+        ))
+
+    def _new_level(self) -> ColumnStorage:
+        return ColumnStorage(2 + 2 * self._columns, self._level_capacity)
@@ -12,12 +12,32 @@
 
 import cv2
 import numpy
+from math import ceil
+from enum import StrEnum
+from .beam_width_batch import DEFAULT_CHUNK_BYTES, frames_per_chunk
+
+
+DEFAULT_NOISE_HISTOGRAM_BINS = 256
+DEFAULT_NOISE_SAMPLE_STEP = 4
+DEFAULT_NOISE_BORDER_WIDTH = 16
+DEFAULT_NOISE_UPDATE_INTERVAL = 10
+DEFAULT_NOISE_SMOOTHING = 0.3
+
+
+class NoiseEstimatorMode(StrEnum):
+    HISTOGRAM = "Histogram"
+    FAST = "Fast"
+
+
+class NoiseRegion(StrEnum):
+    SUBSAMPLE = "Subsample"
+    BORDER = "Border"
 
 
 def threshold(image: numpy.ndarray, th_level: float = 0.0) -> numpy.ndarray:
     if th_level != 0:
-        max_level = numpy.max(image)
-        _, th = cv2.threshold(image, th_level, max_level, cv2.THRESH_TOZERO)
+        # the maximal value is not used by THRESH_TOZERO
+        _, th = cv2.threshold(image, th_level, 0, cv2.THRESH_TOZERO)
         return th
     else:
         return image
@@ -28,3 +48,123 @@ def find_noise_level_from_histogram(img):
     if numpy.shape(bins) != (0,):
         return numpy.nanargmax(bins)
     return 0
+
+
+def find_noise_level_from_histogram_batch(images: numpy.ndarray, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> numpy.ndarray:
+    n = images.shape[0]
+    result = numpy.zeros(n, dtype=numpy.int64)
+    if images.size == 0:
+        return result
+    number_of_bins = int(numpy.max(images)) + 1
+    # the values of every chunk are shifted to the bins of their frame as int64
+    chunk_size = frames_per_chunk(images.shape[1:], numpy.dtype(numpy.int64).itemsize, chunk_bytes)
+    for start in range(0, n, chunk_size):
+        chunk = images[start:start + chunk_size].reshape(-1, images.shape[1] * images.shape[2])
+        offsets = numpy.arange(len(chunk), dtype=numpy.int64)[:, numpy.newaxis] * number_of_bins
+        bins = numpy.bincount((chunk + offsets).ravel(), minlength=len(chunk) * number_of_bins)
+        result[start:start + len(chunk)] = numpy.argmax(bins.reshape(len(chunk), number_of_bins), axis=1)
+    return result
+
+
+def find_noise_level_from_bounded_histogram(img: numpy.ndarray, bins: int = DEFAULT_NOISE_HISTOGRAM_BINS) -> float:
+    # The most frequent value from a histogram of at most `bins` bins. For integer images the most
+    # populated bin is refined with unit bins, and so is every other bin whose total is not below the
+    # count found, as only such a bin can hold a more frequent value. The result is the exact mode as from
+    # find_noise_level_from_histogram. For float images it is the centre of the most populated bin.
+    if img.size == 0:
+        return 0
+    min_value, max_value, _, _ = cv2.minMaxLoc(img)
+    bins = max(int(bins), 1)
+    if img.dtype.kind == 'f':
+        if max_value <= min_value:
+            return min_value
+        hist = cv2.calcHist([img], [0], None, [bins], [min_value, max_value])
+        width = (max_value - min_value) / bins
+        return min_value + (int(numpy.argmax(hist)) + 0.5) * width
+    low = int(min_value)
+    width = max(ceil((int(max_value) - low + 1) / bins), 1)
+    n_bins = ceil((int(max_value) - low + 1) / width)
+    hist = cv2.calcHist([img], [0], None, [n_bins], [low, low + n_bins * width]).ravel()
+    if width == 1:
+        return low + int(numpy.argmax(hist))
+    best_value, best_count = low, -1.0
+    # the bins are refined from the most populated one, the equal ones from the lowest values
+    for index in numpy.argsort(-hist, kind='stable'):
+        start = low + int(index) * width
+        if hist[index] < best_count or (hist[index] == best_count and start > best_value):
+            break
+        fine = cv2.calcHist([img], [0], None, [width], [start, start + width]).ravel()
+        value = int(numpy.argmax(fine))
+        if fine[value] > best_count or (fine[value] == best_count and start + value < best_value):
+            best_value, best_count = start + value, fine[value]
+    return best_value
+
+
+class NoiseEstimator:
+
+    def __init__(self, **kwargs):
+        # The noise level is estimated from a strided subsample or from the border of the frame, so the
+        # full frame is not scanned. The estimate is refreshed every `update_interval` frames and smoothed
+        # with an exponential moving average.
+        self._region: NoiseRegion = NoiseRegion(kwargs.get("region", NoiseRegion.SUBSAMPLE))
+        self._step: int = max(int(kwargs.get("step", DEFAULT_NOISE_SAMPLE_STEP)), 1)
+        self._border_width: int = max(int(kwargs.get("border_width", DEFAULT_NOISE_BORDER_WIDTH)), 1)
+        self._bins: int = max(int(kwargs.get("bins", DEFAULT_NOISE_HISTOGRAM_BINS)), 1)
+        self._update_interval: int = max(int(kwargs.get("update_interval", DEFAULT_NOISE_UPDATE_INTERVAL)), 1)
+        self._smoothing: float = float(kwargs.get("smoothing", DEFAULT_NOISE_SMOOTHING))
+        self._level: float | None = None
+        self._frame_counter: int = 0
+
+    @property
+    def region(self) -> NoiseRegion:
+        return self._region
+
+    @region.setter
+    def region(self, region: NoiseRegion | str) -> None:
+        self._region = NoiseRegion(region)
+        self.reset()
+
+    @property
+    def bins(self) -> int:
+        return self._bins
+
+    @bins.setter
+    def bins(self, bins: int) -> None:
+        self._bins = max(int(bins), 1)
+        self.reset()
+
+    @property
+    def update_interval(self) -> int:
+        return self._update_interval
+
+    @update_interval.setter
+    def update_interval(self, interval: int) -> None:
+        self._update_interval = max(int(interval), 1)
+
+    @property
+    def level(self) -> float | None:
+        return self._level
+
+    def reset(self) -> None:
+        self._level = None
+        self._frame_counter = 0
+
+    def _sample(self, image: numpy.ndarray) -> numpy.ndarray:
+        if self._region == NoiseRegion.BORDER:
+            b = self._border_width
+            if 2 * b < min(image.shape[:2]):
+                return numpy.concatenate((
+                    image[:b].ravel(), image[-b:].ravel(), image[b:-b, :b].ravel(), image[b:-b, -b:].ravel()))
+        return image[::self._step, ::self._step]
+
+    def estimate(self, image: numpy.ndarray) -> float:
+        if self._level is not None and self._frame_counter % self._update_interval != 0:
+            self._frame_counter += 1
+            return self._level
+        self._frame_counter = 1
+        level = find_noise_level_from_bounded_histogram(self._sample(image), self._bins)
+        if self._level is None or self._smoothing >= 1.0:
+            self._level = float(level)
+        else:
+            self._level += self._smoothing * (level - self._level)
+        return self._level
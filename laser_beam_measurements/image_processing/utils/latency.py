@@ -0,0 +1,107 @@
+#
+# Project: laser_beam_measurements
+#
+# File: latency.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+
+import numpy
+from time import perf_counter_ns
+from contextlib import contextmanager
+from enum import StrEnum
+from typing import Iterator
+from PySide6.QtCore import QMutex, QMutexLocker
+
+
+DEFAULT_LATENCY_WINDOW = 1000
+NS_IN_MS = 1e6
+
+
+class LatencyStatistic(StrEnum):
+    COUNT = "count"
+    MEAN = "mean"
+    P50 = "p50"
+    P95 = "p95"
+    P99 = "p99"
+    MAX = "max"
+
+
+class LatencyStatistics:
+
+    def __init__(self, window: int = DEFAULT_LATENCY_WINDOW):
+        self._values: numpy.ndarray = numpy.zeros(max(int(window), 1), dtype=numpy.int64)
+        self._index: int = 0
+        self._count: int = 0
+
+    def add(self, duration_ns: int) -> None:
+        self._values[self._index] = duration_ns
+        self._index = (self._index + 1) % len(self._values)
+        self._count += 1
+
+    def reset(self) -> None:
+        self._index = 0
+        self._count = 0
+
+    def statistics(self) -> dict[LatencyStatistic, float]:
+        # values are reported in milliseconds, percentiles are taken over the rolling window
+        values = self._values[:min(self._count, len(self._values))]
+        if len(values) == 0:
+            return {LatencyStatistic.COUNT: 0}
+        p50, p95, p99 = numpy.percentile(values, (50, 95, 99))
+        return {
+            LatencyStatistic.COUNT: self._count,
+            LatencyStatistic.MEAN: float(numpy.mean(values)) / NS_IN_MS,
+            LatencyStatistic.P50: float(p50) / NS_IN_MS,
+            LatencyStatistic.P95: float(p95) / NS_IN_MS,
+            LatencyStatistic.P99: float(p99) / NS_IN_MS,
+            LatencyStatistic.MAX: float(numpy.max(values)) / NS_IN_MS
+        }
+
+
+class LatencyRecorder:
+
+    def __init__(self, window: int = DEFAULT_LATENCY_WINDOW):
+        self._mutex: QMutex = QMutex()
+        self._window: int = window
+        self._stages: dict[str, LatencyStatistics] = dict()
+
+    def add(self, stage: str, duration_ns: int) -> None:
+        with QMutexLocker(self._mutex):
+            statistics = self._stages.get(stage, None)
+            if statistics is None:
+                statistics = LatencyStatistics(self._window)
+                self._stages[stage] = statistics
+            statistics.add(duration_ns)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(stage, perf_counter_ns() - start)
+
+    def reset(self) -> None:
+        with QMutexLocker(self._mutex):
+            self._stages.clear()
+
+    def statistics(self) -> dict[str, dict[LatencyStatistic, float]]:
+        with QMutexLocker(self._mutex):
+            return {stage: statistics.statistics() for stage, statistics in self._stages.items()}
+
+
+def format_latency_statistics(statistics: dict[str, dict[LatencyStatistic, float]]) -> str:
+    columns = tuple(LatencyStatistic)
+    name_width = max([len("Stage")] + [len(stage) for stage in statistics.keys()])
+    lines = ["  ".join([f"{'Stage':<{name_width}}"] + [f"{str(c):>10}" for c in columns])]
+    for stage, values in statistics.items():
+        cells = [f"{stage:<{name_width}}", f"{values.get(LatencyStatistic.COUNT, 0):>10}"]
+        for column in columns[1:]:
+            value = values.get(column, None)
+            cells.append(f"{value:>10.3f}" if value is not None else f"{'-':>10}")
+        lines.append("  ".join(cells))
+    return "\n".join(lines)
@@ -15,20 +15,82 @@ from math import cos, sin
 
 
 MIN_ANGLE = 0.001
+BUFFER_POOL_DEPTH = 5
+BUFFER_POOL_GRANULARITY = 64
+BUFFER_POOL_MAX_SIZES = 3
 
 
-def sub_image(
+class SubImageBufferPool:
+
+    def __init__(
+            self,
+            depth: int = BUFFER_POOL_DEPTH,
+            granularity: int = BUFFER_POOL_GRANULARITY,
+            max_sizes: int = BUFFER_POOL_MAX_SIZES):
+        # several buffers per size are rotated so that a sub image emitted to a viewer
+        # or waiting in the input queue of the next processor is not overwritten
+        self._depth: int = max(int(depth), 1)
+        self._granularity: int = max(int(granularity), 1)
+        self._max_sizes: int = max(int(max_sizes), 1)
+        self._buffers: dict[tuple[int, int, numpy.dtype], list[numpy.ndarray]] = {}
+        self._indexes: dict[tuple[int, int, numpy.dtype], int] = {}
+
+    def _round_up(self, value: int) -> int:
+        return -(-value // self._granularity) * self._granularity
+
+    def get(self, height: int, width: int, dtype: numpy.dtype) -> numpy.ndarray:
+        key = (self._round_up(max(height, 1)), self._round_up(max(width, 1)), numpy.dtype(dtype))
+        buffers = self._buffers.pop(key, None)
+        if buffers is None:
+            buffers = []
+            if len(self._buffers) >= self._max_sizes:
+                oldest_key = next(iter(self._buffers))
+                del self._buffers[oldest_key]
+                del self._indexes[oldest_key]
+        # dict keeps the insertion order, so the most recently used size goes to the end
+        self._buffers[key] = buffers
+        index = self._indexes.get(key, 0)
+        if index >= len(buffers):
+            buffers.append(numpy.empty(key[:2], dtype=key[2]))
+        self._indexes[key] = (index + 1) % self._depth
+        return buffers[index][:height, :width]
+
+    def clear(self) -> None:
+        self._buffers.clear()
+        self._indexes.clear()
+
+
+def _sub_image_bounds(
         image: numpy.ndarray,
         center: tuple[float, float],
         width: float,
-        height: float,
-        copy: bool = True) -> numpy.ndarray:
+        height: float) -> tuple[int, int, int, int]:
     cx, cy = center
     pt11 = int(cy - height / 2) if cy > height / 2 else 0
     pt21 = int(cy + height / 2) if cy + height / 2 < image.shape[0] else image.shape[0]
     pt10 = int(cx - width / 2) if cx > width / 2 else 0
     pt20 = int(cx + width / 2) if cx + width / 2 < image.shape[1] else image.shape[1]
-    return numpy.array(image[pt11:pt21, pt10:pt20], copy=copy)
+    return pt11, pt21, pt10, pt20
+
+
+def sub_image(
+        image: numpy.ndarray,
+        center: tuple[float, float],
+        width: float,
+        height: float,
+        copy: bool = True,
+        out: numpy.ndarray | None = None,
+        pool: SubImageBufferPool | None = None) -> numpy.ndarray:
+    pt11, pt21, pt10, pt20 = _sub_image_bounds(image, center, width, height)
+    view = image[pt11:pt21, pt10:pt20]
+    if not copy:
+        return view
+    if out is None and pool is not None:
+        out = pool.get(view.shape[0], view.shape[1], view.dtype)
+    if out is None or out.shape != view.shape or out.dtype != view.dtype:
+        return view.copy()
+    numpy.copyto(out, view)
+    return out
 
 
 def rotate_sub_image(
@@ -37,9 +99,11 @@ def rotate_sub_image(
         width: float,
         height: float,
         angle: float,
-        copy: bool = True) -> numpy.ndarray:
+        copy: bool = True,
+        out: numpy.ndarray | None = None,
+        pool: SubImageBufferPool | None = None) -> numpy.ndarray:
     if abs(angle) < MIN_ANGLE:
-        return sub_image(image, center, width, height, copy)
+        return sub_image(image, center, width, height, copy, out, pool)
     v_x = (cos(angle), sin(angle))
     v_y = (-sin(angle), cos(angle))
     c0 = int(center[0])
@@ -52,8 +116,14 @@ def rotate_sub_image(
                            [v_x[1], v_y[1], s_y]])
     flags = cv2.WARP_INVERSE_MAP + cv2.INTER_LINEAR
     border_mode = cv2.BORDER_TRANSPARENT
-    rotated_image = cv2.warpAffine(image, mapping, (w, h), flags=flags, borderMode=border_mode)
-    return rotated_image.copy() if copy else rotated_image
+    if out is None and pool is not None:
+        out = pool.get(h, w, image.dtype)
+    if out is None or out.shape != (h, w) or out.dtype != image.dtype:
+        # the output of warpAffine is a new array already, there is no need to copy it
+        return cv2.warpAffine(image, mapping, (w, h), flags=flags, borderMode=border_mode)
+    # pixels mapped outside the image are not written with the transparent border
+    out.fill(0)
+    return cv2.warpAffine(image, mapping, (w, h), dst=out, flags=flags, borderMode=border_mode)
 
 
 def get_cross_section(img: numpy.ndarray, x: float, y: float, copy: bool = True) -> tuple[numpy.ndarray, numpy.ndarray]:
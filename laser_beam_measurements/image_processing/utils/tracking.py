@@ -0,0 +1,53 @@
+#
+# Project: laser_beam_measurements
+#
+# File: tracking.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+
+import numpy
+
+
+class AlphaBetaFilter:
+
+    def __init__(self, alpha: float = 1.0, beta: float | None = None):
+        self._alpha: float = 1.0
+        self._beta: float = 0.0
+        self._value: numpy.ndarray | None = None
+        self._velocity: numpy.ndarray | None = None
+        self.set_gains(alpha, beta)
+
+    @property
+    def alpha(self) -> float:
+        return self._alpha
+
+    @property
+    def beta(self) -> float:
+        return self._beta
+
+    def set_gains(self, alpha: float, beta: float | None = None) -> None:
+        self._alpha = min(max(float(alpha), 0.0), 1.0)
+        if beta is None:
+            # Kalata's relation for a tracking filter with a constant velocity model
+            beta = self._alpha * self._alpha / (2.0 - self._alpha)
+        self._beta = max(float(beta), 0.0)
+
+    def reset(self) -> None:
+        self._value = None
+        self._velocity = None
+
+    def update(self, measurement: numpy.ndarray | tuple | list) -> numpy.ndarray:
+        measurement = numpy.asarray(measurement, dtype=numpy.float64)
+        if self._value is None:
+            self._value = measurement.copy()
+            self._velocity = numpy.zeros_like(measurement)
+            return self._value.copy()
+        prediction = self._value + self._velocity
+        residual = measurement - prediction
+        self._value = prediction + self._alpha * residual
+        self._velocity = self._velocity + self._beta * residual
+        return self._value.copy()
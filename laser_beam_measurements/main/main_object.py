@@ -9,13 +9,16 @@
 #
 
 
-from PySide6.QtCore import QObject, QSettings
+from PySide6.QtCore import QObject, QSettings, QThread, QMetaObject, Qt
 from PySide6.QtWidgets import QWidget
 from laser_beam_measurements.camera_control.camera_grabber import CameraGrabber
 from laser_beam_measurements.camera_control.camera_selector import CameraSelector
 from laser_beam_measurements.image_processing.beam_analyzer import BeamAnalyzer
+from laser_beam_measurements.image_processing.background_subtractor import BackgroundSubtractor
+from laser_beam_measurements.image_processing.frame_averager import FrameAverager
 from laser_beam_measurements.image_processing.image_processor_sink import ImageProcessorSink
 from laser_beam_measurements.image_processing.parameter_logger import ParameterLogger
+from laser_beam_measurements.utils.settings_bool_reader import read_boolean_value
 
 
 class MainObject(QObject):
@@ -25,17 +28,22 @@ class MainObject(QObject):
         self._camera_grabber: CameraGrabber = CameraGrabber()
         self._camera_selector: CameraSelector = CameraSelector(self._camera_grabber)
 
-        self._beam_analyzer: BeamAnalyzer = BeamAnalyzer()
+        self._settings_name = "settings.conf"
+
+        # the processing threads are set up on construction, so the mode is read before the other settings
+        pipelined = read_boolean_value(self.settings_file, "BeamAnalyzer/Pipelined", False)
+        self._beam_analyzer: BeamAnalyzer = BeamAnalyzer(pipelined=pipelined)
         self._sink = ImageProcessorSink(image_processor=self._beam_analyzer, thread=self._camera_grabber.thread())
         # self._camera_grabber.listener.signal_new_image_received.connect(self._beam_analyzer.on_new_image)
-        self._camera_grabber.listener.signal_new_image_received.connect(self._sink.slot_new_image)
+        self._camera_grabber.listener.signal_new_frame_received.connect(self._sink.slot_new_frame)
         self._camera_selector.signal_camera_selected.connect(self._beam_analyzer.slot_set_init_parameters)
+        # the beam finder narrows the camera readout to the found beam
+        self._beam_analyzer.beam_finder.signal_camera_roi_requested.connect(self._camera_grabber.set_roi)
+        self._beam_analyzer.beam_finder.signal_camera_roi_reset.connect(self._camera_grabber.reset_roi)
 
         self._logger = ParameterLogger()
         self._beam_analyzer.beam_profiler.parameter_logger = self._logger
 
-        self._settings_name = "settings.conf"
-
         self._load_settings()
 
     @property
@@ -46,6 +54,14 @@ class MainObject(QObject):
     def camera_selector(self) -> CameraSelector:
         return self._camera_selector
 
+    @property
+    def background_subtractor(self) -> BackgroundSubtractor:
+        return self._beam_analyzer.background_subtractor
+
+    @property
+    def frame_averager(self) -> FrameAverager:
+        return self._beam_analyzer.frame_averager
+
     @property
     def settings_file(self) -> QSettings:
         settings = QSettings(self._settings_name, QSettings.Format.IniFormat)
@@ -87,8 +103,20 @@ class MainObject(QObject):
             return True
         return False
 
+    def set_widget_for_latency(self, widget: QWidget) -> bool:
+        if hasattr(widget, "set_image_processor"):
+            widget.set_image_processor(self._beam_analyzer)
+            return True
+        return False
+
     def closeEvent(self, event) -> None:
         self._camera_grabber.run_status_changed(False)
+        # the logger lives in the processing thread, it is stopped there and the queued log rows are
+        # written before closing
+        if self._logger.thread() == QThread.currentThread():
+            self._logger.stop()
+        else:
+            QMetaObject.invokeMethod(self._logger, "stop", Qt.ConnectionType.BlockingQueuedConnection)
         self._save_settings()
         self._camera_grabber.stop_thread()
         self._beam_analyzer.stop_thread()
@@ -98,11 +126,13 @@ class MainObject(QObject):
         settings.clear()
         self._camera_selector.save_settings(settings)
         self._beam_analyzer.save_settings(settings)
+        self._sink.save_settings(settings)
 
     def _load_settings(self):
         settings = QSettings(self._settings_name, QSettings.Format.IniFormat)
         self._camera_selector.load_settings(settings)
         self._beam_analyzer.load_settings(settings)
+        self._sink.load_settings(settings)
 
     def save_settings(self):
         self._save_settings()
@@ -23,10 +23,27 @@ class ImageConverter(object):
         return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
 
     @staticmethod
-    def to_qimage(img: numpy.ndarray, color_table: list or None = None, copy: bool = True) -> QImage:
+    def to_8bit(img: numpy.ndarray, bit_depth: int = 16) -> numpy.ndarray:
+        if img.dtype == numpy.uint8:
+            return img
+        # the full scale of the bit depth is mapped to 0-255
+        return cv2.convertScaleAbs(img, alpha=255.0 / ((1 << bit_depth) - 1))
+
+    @staticmethod
+    def to_qimage(
+            img: numpy.ndarray,
+            color_table: list or None = None,
+            copy: bool = True,
+            bit_depth: int | None = None) -> QImage:
+        # 16-bit images are kept as Grayscale16 unless a color table or a bit depth for display is given
         _img: numpy.ndarray = img
         if color_table is not None:
             _img = ImageConverter.to_grey(img)
+        if _img.dtype == numpy.uint16 and (color_table or bit_depth is not None):
+            _img = ImageConverter.to_8bit(_img, bit_depth if bit_depth is not None else 16)
+        if not _img.flags.c_contiguous:
+            # sub images may be views into a larger frame or buffer
+            _img = numpy.ascontiguousarray(_img)
 
         qim = QImage()
         if len(_img.shape) == 3:
@@ -52,8 +69,6 @@ class ImageConverter(object):
                 # im = (im / 16)
                 # im = numpy.require(im, dtype=numpy.uint8, requirements='C')
                 qim = QImage(_img.data, _img.shape[1], _img.shape[0], _img.strides[0], QImage.Format.Format_Grayscale16)
-                if color_table:
-                    qim.setColorTable(color_table)
             else:
                 raise TypeError("Unsupported data type")
 
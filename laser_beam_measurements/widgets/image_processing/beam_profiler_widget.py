@@ -267,6 +267,23 @@ class BeamProfilerWidget(ImageProcessorViewerBase):
                 self.table_widget_items.update({beam_profiler.BeamWidthMethods.FOUR_SIGMA: (item_x, item_y)})
                 position_to_add += 1
 
+            if beam_profiler.BeamWidthMethods.FOUR_SIGMA_ISO in widths.keys():
+                item_title = _create_table_item(
+                    beam_profiler.BeamWidthMethods.FOUR_SIGMA_ISO, alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+                table_widget.setItem(row_number + position_to_add, 0, item_title)
+                item_x = _create_table_item(
+                    "", alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+                item_y = _create_table_item(
+                    "", alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+
+                table_widget.setItem(row_number + position_to_add, 1, item_x)
+                table_widget.setItem(row_number + position_to_add, 2, item_y)
+                self.table_widget_items.update({beam_profiler.BeamWidthMethods.FOUR_SIGMA_ISO: (item_x, item_y)})
+                position_to_add += 1
+
             if beam_profiler.BeamWidthMethods.GAUSS_APPR in widths.keys():
                 item_title = _create_table_item(
                     beam_profiler.BeamWidthMethods.GAUSS_APPR, alignment=Qt.AlignRight | Qt.AlignVCenter
@@ -314,6 +331,21 @@ class BeamProfilerWidget(ImageProcessorViewerBase):
                 self.table_widget_items.update({beam_profiler.BeamWidthMethods.POWER_86: item})
                 position_to_add += 1
 
+            for power_level_name in widths.keys():
+                if power_level_name in list(beam_profiler.BeamWidthMethods):
+                    continue
+                item_title = _create_table_item(
+                    power_level_name, alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+                table_widget.setItem(row_number + position_to_add, 0, item_title)
+                item = _create_table_item(
+                    "", alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+
+                table_widget.setItem(row_number + position_to_add, 1, item)
+                self.table_widget_items.update({power_level_name: item})
+                position_to_add += 1
+
             row_number = table_widget.rowCount()
 
         if beam_profiler.OTHER_PARAMETERS in parameters_dict.keys():
@@ -350,6 +382,23 @@ class BeamProfilerWidget(ImageProcessorViewerBase):
                 self.table_widget_items.update({beam_profiler.OtherParameters.AREA: item})
                 position_to_add += 1
 
+            if beam_profiler.OtherParameters.GAUSS_RESIDUAL in other_parameters.keys():
+                item_title = _create_table_item(
+                    beam_profiler.OtherParameters.GAUSS_RESIDUAL, alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+                table_widget.setItem(row_number + position_to_add, 0, item_title)
+                item_x = _create_table_item(
+                    "", alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+                item_y = _create_table_item(
+                    "", alignment=Qt.AlignRight | Qt.AlignVCenter
+                )
+
+                table_widget.setItem(row_number + position_to_add, 1, item_x)
+                table_widget.setItem(row_number + position_to_add, 2, item_y)
+                self.table_widget_items.update({beam_profiler.OtherParameters.GAUSS_RESIDUAL: (item_x, item_y)})
+                position_to_add += 1
+
     @Slot(dict)
     def show_beam_parameters(self, parameters_dict: dict[str, dict[str, float | tuple[float, float]]]) -> None:
         # print(parameters_dict)
@@ -0,0 +1,89 @@
+#
+# Project: laser_beam_measurements
+#
+# File: latency_widget.py
+#
+# Author: Konstantin Prusakov
+#
+# Copyright 2024 Konstantin Prusakov <konstantin.prusakov@phystech.edu>
+#
+
+
+from PySide6.QtWidgets import (QWidget, QTableWidget, QTableWidgetItem, QVBoxLayout, QHBoxLayout, QPushButton,
+                               QHeaderView, QFileDialog)
+from PySide6.QtCore import Qt, Signal, Slot
+from laser_beam_measurements.image_processing.image_processor_pipeline import ImageProcessorPipeline
+from laser_beam_measurements.image_processing.utils.latency import LatencyStatistic, format_latency_statistics
+
+
+class LatencyWidget(QWidget):
+
+    signal_reset = Signal()
+
+    def __init__(self, parent=None):
+        super(LatencyWidget, self).__init__(parent)
+        self.setObjectName("LatencyWidget")
+        self.setWindowTitle("Processing Latency")
+        self.resize(560, 320)
+        self._pipeline: ImageProcessorPipeline | None = None
+        self._statistics: dict = dict()
+
+        self._table = QTableWidget(self)
+        self._table.setColumnCount(len(LatencyStatistic) + 1)
+        self._table.setHorizontalHeaderLabels(
+            ["Stage", "Count"] + [f"{s} (ms)" for s in tuple(LatencyStatistic)[1:]])
+        self._table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self._table.verticalHeader().setVisible(False)
+        self._table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+
+        self._reset_button = QPushButton("Reset", self)
+        self._reset_button.clicked.connect(self.signal_reset)
+        self._save_button = QPushButton("Save", self)
+        self._save_button.clicked.connect(self._slot_save)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self._reset_button)
+        buttons_layout.addWidget(self._save_button)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self._table)
+        layout.addLayout(buttons_layout)
+
+    def set_image_processor(self, pipeline: ImageProcessorPipeline) -> None:
+        if self._pipeline is not None:
+            self._pipeline.signal_latency_statistics_updated.disconnect(self.slot_update_statistics)
+            self.signal_reset.disconnect(self._pipeline.reset_latency_statistics)
+        self._pipeline = pipeline
+        self._pipeline.signal_latency_statistics_updated.connect(self.slot_update_statistics)
+        self.signal_reset.connect(self._pipeline.reset_latency_statistics)
+
+    @Slot(dict)
+    def slot_update_statistics(self, statistics: dict) -> None:
+        self._statistics = statistics
+        self._table.setRowCount(len(statistics))
+        for row, (stage, values) in enumerate(statistics.items()):
+            self._set_item(row, 0, stage)
+            self._set_item(row, 1, str(values.get(LatencyStatistic.COUNT, 0)))
+            for column, statistic in enumerate(tuple(LatencyStatistic)[1:], start=2):
+                value = values.get(statistic, None)
+                self._set_item(row, column, f"{value:.3f}" if value is not None else "-")
+
+    def _set_item(self, row: int, column: int, text: str) -> None:
+        item = self._table.item(row, column)
+        if item is None:
+            item = QTableWidgetItem()
+            if column > 0:
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self._table.setItem(row, column, item)
+        item.setText(text)
+
+    @Slot()
+    def _slot_save(self) -> None:
+        if not self._statistics:
+            return
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save latency statistics", "latency.txt", "*.txt")
+        if not file_name:
+            return
+        with open(file_name, "w") as file:
+            file.write(format_latency_statistics(self._statistics))
+            file.write("\n")
@@ -15,7 +15,9 @@ from PySide6.QtWidgets import QTableWidgetItem, QTableWidget, QWidget, QListWidg
 from PySide6.QtCore import Qt, Slot
 from laser_beam_measurements.image_processing.parameter_logger import ParameterLogger
 from laser_beam_measurements.image_processing.parameter_logger_widget_base import ParameterLoggingWidgetBase
+from laser_beam_measurements.image_processing.utils.decimation import MinMaxPyramid
 from .ui_parameter_logger_widget import Ui_Form
+import numpy
 import pyqtgraph as pg
 from typing import Optional, Iterable, Collection
 
@@ -52,15 +54,20 @@ class ParameterLoggerWidget(ParameterLoggingWidgetBase):
         self.ui.setupUi(self)
         self.ui.start_stop_button.clicked.connect(self._slot_change_logger_state)
         self.ui.select_parameter.currentTextChanged.connect(self.slot_select_parameter_changed)
-        self._configure_plot()
         self._curves: dict[str, dict[str, pg.PlotDataItem]] = dict()
         self._visible_curves_name: Optional[str] = None
+        self._pyramid: Optional[MinMaxPyramid] = None
+        self._write_backlog_text: str = ""
+        self._configure_plot()
 
     def _logger_state_changed(self, state: bool) -> None:
         if state:
+            self._write_backlog_text = ""
             self._set_enabled(False)
             self._set_curves_visibility(False)
             self._curves.clear()
+            self._visible_curves_name = None
+            self._pyramid = None
             self.slot_select_parameter_changed(self.ui.select_parameter.currentText())
             self.ui.start_stop_button.setText("Stop")
         else:
@@ -88,6 +95,9 @@ class ParameterLoggerWidget(ParameterLoggingWidgetBase):
         timer_interval = self._get_timer_interval()
         # self._logger.timer_interval = timer_interval
         self._logger.set_all_parameters(selected_parameters, timer_interval)
+        self._logger.set_log_format(self.ui.log_format.currentText())
+        self._logger.set_logging_mode(self.ui.log_mode.currentText())
+        self._logger.set_decimation(self.ui.decimation.value())
         self.signal_change_state.emit(True)
 
     def _stop_logging(self) -> None:
@@ -118,6 +128,9 @@ class ParameterLoggerWidget(ParameterLoggingWidgetBase):
         self.ui.available_parameters.setEnabled(value)
         self.ui.time_step.setEnabled(value)
         self.ui.time_unit.setEnabled(value)
+        self.ui.log_format.setEnabled(value)
+        self.ui.log_mode.setEnabled(value)
+        self.ui.decimation.setEnabled(value)
 
     def _configure_plot(self) -> None:
         styles = {'color': 'b', }  # 'font-size': '8px'}
@@ -128,6 +141,7 @@ class ParameterLoggerWidget(ParameterLoggingWidgetBase):
         # plot_widget.setLabel("bottom", "Dimension", "mkm", **styles)
         plot_widget.showGrid(x=True, y=True)
         plot_widget.addLegend(offset=(1, 1), labelTextColor=[0, 0, 0], labelTextSize='8pt')
+        plot_widget.getViewBox().sigXRangeChanged.connect(self._slot_view_range_changed)
 
     def _fill_parameter_to_show(self, selected_parameters: Optional[list[str]] = None) -> None:
         self.ui.select_parameter.clear()
@@ -136,24 +150,55 @@ class ParameterLoggerWidget(ParameterLoggingWidgetBase):
         for parameter in selected_parameters:
             self.ui.select_parameter.addItem(str(parameter))
 
-    def _slot_show_selected_parameter(self, group_name: str, logging_time: list, parameters: dict[str, list]) -> None:
-        if self._visible_curves_name == group_name:
-            visible_curves = self._curves[self._visible_curves_name]
-            if len(visible_curves) != len(parameters):
-                return
-            for key, value in parameters:
-                visible_curves[key].setData(logging_time, value)
-        else:
-            self._set_curves_visibility(False)
-            if group_name not in self._curves.keys():
-                self._create_curves_group(group_name, parameters)
-            visible_curves = self._curves[group_name]
-            set_curves_visibility(visible_curves, True)
-            for key, value in parameters.items():
-                curve = visible_curves[key]
-                if curve not in self.ui.plot.items():
-                    self.ui.plot.addItem(curve)
-                curve.setData(logging_time, value)
+    def _slot_show_selected_parameter(self,
+                                      group_name: str,
+                                      logging_time: numpy.ndarray,
+                                      parameters: dict[str, numpy.ndarray]) -> None:
+        # the history of the selected parameter replaces the plotted one, the next samples are appended
+        self._set_curves_visibility(False)
+        if group_name not in self._curves.keys():
+            self._create_curves_group(group_name, parameters)
+        visible_curves = self._curves[group_name]
+        for curve in visible_curves.values():
+            if curve not in self.ui.plot.items():
+                self.ui.plot.addItem(curve)
+        set_curves_visibility(visible_curves, True)
+        self._visible_curves_name = group_name
+        self._pyramid = MinMaxPyramid(len(visible_curves))
+        self._append_selected_parameter(group_name, logging_time, parameters)
+
+    def _append_selected_parameter(self,
+                                   group_name: str,
+                                   logging_time: numpy.ndarray,
+                                   parameters: dict[str, numpy.ndarray]) -> None:
+        if self._pyramid is None or group_name != self._visible_curves_name:
+            return
+        visible_curves = self._curves[group_name]
+        if set(parameters.keys()) != set(visible_curves.keys()):
+            return
+        self._pyramid.append(logging_time, numpy.column_stack([parameters[key] for key in visible_curves.keys()]))
+        self._update_curves()
+
+    def _update_curves(self) -> None:
+        # the curves get the range in view decimated to the plot width, so redrawing does not depend on
+        # the length of the logging
+        if self._pyramid is None or self._visible_curves_name is None:
+            return
+        x_range = self._pyramid.x_range()
+        if x_range is None:
+            return
+        view_box = self.ui.plot.getViewBox()
+        if not view_box.autoRangeEnabled()[0]:
+            x_range = view_box.viewRange()[0]
+        x, y = self._pyramid.view(x_range[0], x_range[1], int(view_box.width()))
+        for i, curve in enumerate(self._curves[self._visible_curves_name].values()):
+            curve.setData(x, y[:, i])
+
+    @Slot()
+    def _slot_view_range_changed(self) -> None:
+        # the auto range follows the data, a range set by the user is redrawn at its resolution
+        if not self.ui.plot.getViewBox().autoRangeEnabled()[0]:
+            self._update_curves()
 
     def _create_curves_group(self, group_name: str, parameters: dict[str, list]) -> None:
         curves = create_curves(list(parameters.keys()))
@@ -176,5 +221,9 @@ class ParameterLoggerWidget(ParameterLoggingWidgetBase):
         self.signal_set_parameter_to_show.emit(parameter_name)
 
     def _show_current_interval(self, counter: int, interval: float) -> None:
-        status_text = f"Counts: {counter}, Actual interval: {round(interval, 2)} s"
+        status_text = f"Counts: {counter}, Actual interval: {round(interval, 2)} s{self._write_backlog_text}"
         self.ui.status_label.setText(status_text)
+
+    def _show_write_backlog(self, queued: int, dropped: int) -> None:
+        # shown while the disk does not keep up with the logging
+        self._write_backlog_text = f", Write queue: {queued}, Dropped: {dropped}" if queued > 0 or dropped > 0 else ""
@@ -18,7 +18,7 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
 from PySide6.QtWidgets import (QApplication, QComboBox, QGridLayout, QGroupBox,
     QHBoxLayout, QLabel, QLineEdit, QListWidget,
     QListWidgetItem, QPushButton, QSizePolicy, QSpacerItem,
-    QVBoxLayout, QWidget)
+    QSpinBox, QVBoxLayout, QWidget)
 
 from pyqtgraph import PlotWidget
 
@@ -50,6 +50,21 @@ class Ui_Form(object):
         self.time_unit.addItem("")
         self.time_unit.setObjectName(u"time_unit")
         self.time_unit.setGeometry(QRect(100, 250, 69, 22))
+        self.log_format = QComboBox(self.groupBox)
+        self.log_format.addItem("")
+        self.log_format.addItem("")
+        self.log_format.setObjectName(u"log_format")
+        self.log_format.setGeometry(QRect(10, 280, 159, 22))
+        self.log_mode = QComboBox(self.groupBox)
+        self.log_mode.addItem("")
+        self.log_mode.addItem("")
+        self.log_mode.setObjectName(u"log_mode")
+        self.log_mode.setGeometry(QRect(10, 310, 101, 22))
+        self.decimation = QSpinBox(self.groupBox)
+        self.decimation.setObjectName(u"decimation")
+        self.decimation.setGeometry(QRect(120, 310, 49, 22))
+        self.decimation.setMinimum(1)
+        self.decimation.setMaximum(1000)
 
         self.gridLayout.addWidget(self.groupBox, 0, 0, 1, 1)
 
@@ -100,6 +115,14 @@ class Ui_Form(object):
         self.time_unit.setItemText(0, QCoreApplication.translate("Form", u"ms", None))
         self.time_unit.setItemText(1, QCoreApplication.translate("Form", u"sec", None))
         self.time_unit.setItemText(2, QCoreApplication.translate("Form", u"min", None))
+        self.log_format.setItemText(0, QCoreApplication.translate("Form", u"binary", None))
+        self.log_format.setItemText(1, QCoreApplication.translate("Form", u"text", None))
+        self.log_mode.setItemText(0, QCoreApplication.translate("Form", u"timer", None))
+        self.log_mode.setItemText(1, QCoreApplication.translate("Form", u"every frame", None))
+
+#if QT_CONFIG(tooltip)
+        self.decimation.setToolTip(QCoreApplication.translate("Form", u"Log every N-th frame", None))
+#endif // QT_CONFIG(tooltip)
 
         self.status_label.setText(QCoreApplication.translate("Form", u"Counts:", None))
     # retranslateUi
@@ -11,7 +11,7 @@
 # pyside6-uic laser_beam_measurements/widgets/main/main_window.ui -o laser_beam_measurements/widgets/main/ui_main_window.py
 
 from PySide6.QtWidgets import QMainWindow, QWidget, QMdiSubWindow
-from PySide6.QtGui import QIcon, QAction
+from PySide6.QtGui import QIcon, QAction, QActionGroup
 from PySide6.QtCore import Signal, Slot, QSettings, QTimer
 
 from .ui_main_window import Ui_MainWindow
@@ -23,9 +23,12 @@ from laser_beam_measurements.widgets.camera_control.camera_property_controller_w
 from laser_beam_measurements.widgets.image_processing.beam_finder_widget import BeamFinderWidget
 from laser_beam_measurements.widgets.image_processing.beam_profiler_widget import BeamProfilerWidget
 from laser_beam_measurements.widgets.image_processing.parameter_logger_widget import ParameterLoggerWidget
+from laser_beam_measurements.widgets.image_processing.latency_widget import LatencyWidget
 from laser_beam_measurements.main.main_object import MainObject
 from laser_beam_measurements.camera_control.camera_listener import CameraListener
 from laser_beam_measurements.camera_control.camera_listener_base import CameraState
+from laser_beam_measurements.image_processing.background_subtractor import BackgroundSubtractorParameters
+from laser_beam_measurements.image_processing.frame_averager import FrameAveragerParameters, AveragingMode
 from laser_beam_measurements.utils.settings_bool_reader import read_boolean_value
 
 from laser_beam_measurements.icons import Icon
@@ -65,6 +68,7 @@ class MainWindow(QMainWindow):
         self._beam_profiler_widget: Optional[BeamProfilerWidget] = None
         self._property_controller_widget: Optional[CameraPropertyControllerWidget] = None
         self._parameter_logger_widget: Optional[ParameterLoggerWidget] = None
+        self._latency_widget: Optional[LatencyWidget] = None
 
         self._flag_save_on_time: bool = False
         self._saving_timer = QTimer()
@@ -216,6 +220,18 @@ class MainWindow(QMainWindow):
             self._main_object.set_widget_for_parameter_logger(self._parameter_logger_widget)
         return self._create_sub_window(self._parameter_logger_widget, False)
 
+    @Slot()
+    def show_latency_widget(self) -> None:
+        sub = self._create_latency_widget_sub_window()
+        self._show_sub_window(sub)
+
+    def _create_latency_widget_sub_window(self) -> QMdiSubWindow:
+        if self._latency_widget is None:
+            self._latency_widget = LatencyWidget(self)
+            self._latency_widget.setWindowIcon(self._icons.clock)
+            self._main_object.set_widget_for_latency(self._latency_widget)
+        return self._create_sub_window(self._latency_widget, False)
+
     def _show_camera_select_dialog(self) -> None:
         camera_select_dialog = CameraSelectDialog(self)
         camera_select_dialog.set_selector(self._main_object.camera_selector)
@@ -287,6 +303,7 @@ class MainWindow(QMainWindow):
         self._save_widget_settings(self._beam_profiler_widget, settings, "BeamProfilerWidget")
         self._save_widget_settings(self._property_controller_widget, settings, "PropertyControllerWidget")
         self._save_widget_settings(self._parameter_logger_widget, settings, "ParameterLoggerWidget")
+        self._save_widget_settings(self._latency_widget, settings, "LatencyWidget")
 
     def _load_setting_for_sub_window(self, sub_window: QMdiSubWindow, settings: QSettings) -> None:
         if settings.contains("IsHidden"):
@@ -362,6 +379,12 @@ class MainWindow(QMainWindow):
                 self._load_setting_for_sub_window(sub, settings)
                 settings.endGroup()
 
+            if group == "LatencyWidget":
+                settings.beginGroup(group)
+                sub = self._create_latency_widget_sub_window()
+                self._load_setting_for_sub_window(sub, settings)
+                settings.endGroup()
+
     def _create_menu(self):
         bar = self.menuBar()
 
@@ -408,6 +431,59 @@ class MainWindow(QMainWindow):
         parameter_logger_action.triggered.connect(self.show_parameter_logger_widget)
         image_processing.addAction(parameter_logger_action)
 
+        latency_action = QAction("Processing Latency", self)
+        latency_action.setIcon(self._icons.clock)
+        latency_action.triggered.connect(self.show_latency_widget)
+        image_processing.addAction(latency_action)
+
+        subtractor = self._main_object.background_subtractor
+        background = bar.addMenu("Background")
+
+        capture_dark_frame_action = QAction("Capture Dark Frame", self)
+        capture_dark_frame_action.triggered.connect(subtractor.start_dark_frame_capture)
+        background.addAction(capture_dark_frame_action)
+
+        clear_dark_frame_action = QAction("Clear Dark Frame", self)
+        clear_dark_frame_action.triggered.connect(subtractor.clear_dark_frame)
+        background.addAction(clear_dark_frame_action)
+
+        background.addSeparator()
+
+        subtract_background_action = QAction("Subtract Background", self)
+        subtract_background_action.setCheckable(True)
+        subtract_background_action.setChecked(
+            bool(subtractor.get_parameter_value(BackgroundSubtractorParameters.ACTIVE)))
+        subtract_background_action.toggled.connect(subtractor.set_active)
+        background.addAction(subtract_background_action)
+
+        running_background_action = QAction("Running Background", self)
+        running_background_action.setCheckable(True)
+        running_background_action.setChecked(
+            bool(subtractor.get_parameter_value(BackgroundSubtractorParameters.RUNNING_BACKGROUND)))
+        running_background_action.toggled.connect(subtractor.set_running_background)
+        background.addAction(running_background_action)
+
+        averager = self._main_object.frame_averager
+        averaging = bar.addMenu("Averaging")
+
+        average_frames_action = QAction("Average Frames", self)
+        average_frames_action.setCheckable(True)
+        average_frames_action.setChecked(bool(averager.get_parameter_value(FrameAveragerParameters.ACTIVE)))
+        average_frames_action.toggled.connect(averager.set_active)
+        averaging.addAction(average_frames_action)
+
+        averaging.addSeparator()
+
+        averaging_mode_group = QActionGroup(self)
+        averaging_mode = averager.get_parameter_value(FrameAveragerParameters.MODE)
+        for mode, text in ((AveragingMode.ROLLING_MEAN, "Rolling Mean"), (AveragingMode.EXPONENTIAL, "Exponential")):
+            mode_action = QAction(text, self)
+            mode_action.setCheckable(True)
+            mode_action.setChecked(mode == averaging_mode)
+            mode_action.triggered.connect(lambda checked, m=mode: averager.set_mode(m))
+            averaging_mode_group.addAction(mode_action)
+            averaging.addAction(mode_action)
+
         views = bar.addMenu("Views")
 
         cascade_action = QAction("Cascade", self)
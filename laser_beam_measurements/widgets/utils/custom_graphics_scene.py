@@ -26,6 +26,10 @@ class CustomGraphicsScene(QGraphicsScene):
         self.image_item.set_image(image)
         self.update()
 
+    def set_bit_depth(self, bit_depth: int) -> None:
+        self.image_item.set_bit_depth(bit_depth)
+        self.update()
+
     def set_colormap(self, colormap: list | None) -> None:
         self.image_item.set_colormap(colormap)
         self.update()
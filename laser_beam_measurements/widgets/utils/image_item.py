@@ -14,6 +14,7 @@ from PySide6.QtGui import QImage, QPainter, QPixmap
 from PySide6.QtCore import QRectF
 import numpy
 from laser_beam_measurements.utils.numpy2qimage import ImageConverter
+from laser_beam_measurements.camera_control.frame_pool import FramePool
 
 
 __all__ = ["ImageItem"]
@@ -26,6 +27,9 @@ class ImageItem(QGraphicsObject):
         self.qimage: QImage | None = None
         self.image: numpy.ndarray | None = None
         self._colormap: list | None = None
+        # bit depth used to scale frames deeper than 8 bits for display, 0 means it follows the images
+        self._bit_depth: int = 0
+        self._auto_bit_depth: int = 8
 
         self._render_required = True
         self._unrenderable = False
@@ -40,8 +44,26 @@ class ImageItem(QGraphicsObject):
         return self._colormap
 
     def set_image(self, image: numpy.ndarray) -> None:
+        # the sender took a hold of the image for the item, the previous image is returned to its pool
+        if image is not self.image:
+            FramePool.release(self.image)
         self.image = image
 
+    def set_bit_depth(self, bit_depth: int) -> None:
+        self._bit_depth = bit_depth
+
+    def _display_bit_depth(self) -> int | None:
+        if self.image.dtype != numpy.uint16:
+            self._auto_bit_depth = 8
+            return None
+        if self._bit_depth > 0:
+            return self._bit_depth
+        # the bit depth only grows with the brightest pixel seen, so the display does not flicker
+        # with the frame maximum
+        max_value = int(self.image.max())
+        self._auto_bit_depth = min(max(self._auto_bit_depth, max_value.bit_length(), 8), 16)
+        return self._auto_bit_depth
+
     def paint(self, painter: QPainter, *args, **kwargs) -> None:
         if self.image is None:
             return
@@ -59,7 +81,7 @@ class ImageItem(QGraphicsObject):
         self._unrenderable = True
         if self.image is None or self.image.size == 0:
             return
-        qimage = ImageConverter.to_qimage(self.image, self._colormap)
+        qimage = ImageConverter.to_qimage(self.image, self._colormap, bit_depth=self._display_bit_depth())
         if qimage is not None:
             self.qimage = qimage
             self._unrenderable = False